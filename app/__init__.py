@@ -2,8 +2,9 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from config import Config
+from app.replica import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 login_manager.login_view = 'main.login'
 
@@ -12,11 +13,19 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
 
     db.init_app(app)
+    from app import database
+    database.init_app(app)
     login_manager.init_app(app)
 
+    from app import instrumentation
+    instrumentation.init_app(app)
+
     from app.routes import main_bp
     app.register_blueprint(main_bp)
 
+    from app.commands import register_commands
+    register_commands(app)
+
     return app
 
 app = create_app()
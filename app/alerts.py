@@ -0,0 +1,78 @@
+"""
+Low-stock alert engine.
+
+One sweep computes every product at or below its reorder level and records
+it in ``low_stock_alerts`` with a single ``INSERT ... SELECT``. The unique
+``(product_id, alert_date)`` constraint lets each product alert at most once
+a day, even when sweeps overlap. Alerts that have not been announced yet are
+then sent to admins in one bulk notification insert, and the whole sweep
+commits once. Run it on a schedule with ``flask low-stock-sweep``.
+"""
+from datetime import datetime
+
+from flask import url_for
+from sqlalchemy import select, update, exists, literal, Date, DateTime
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db, inbox
+from app.models import LowStockAlert, Product
+
+def _insert():
+    """INSERT that skips rows clashing with the (product_id, alert_date) constraint"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(LowStockAlert).on_conflict_do_nothing(
+            index_elements=['product_id', 'alert_date'])
+    if dialect == 'sqlite':
+        return sqlite.insert(LowStockAlert).on_conflict_do_nothing(
+            index_elements=['product_id', 'alert_date'])
+    return LowStockAlert.__table__.insert()
+
+def record_alerts(today=None):
+    """Insert today's alert for every low-stock product that does not have one yet"""
+    today = today or datetime.utcnow().date()
+    low_stock = select(
+        Product.id,
+        literal(today, Date),
+        Product.stock_quantity,
+        Product.reorder_level,
+        literal(datetime.utcnow(), DateTime)
+    ).where(
+        Product.stock_quantity <= Product.reorder_level,
+        ~exists().where(LowStockAlert.product_id == Product.id, LowStockAlert.alert_date == today)
+    )
+    db.session.execute(_insert().from_select(
+        ['product_id', 'alert_date', 'stock_quantity', 'reorder_level', 'created_at'], low_stock
+    ))
+
+def notify_pending():
+    """Notify admins about alerts not announced yet. Returns how many were sent."""
+    # Claim the pending alerts first, so an overlapping sweep cannot announce them twice
+    claimed_at = datetime.utcnow()
+    db.session.execute(
+        update(LowStockAlert)
+        .where(LowStockAlert.notified_at.is_(None))
+        .values(notified_at=claimed_at)
+        .execution_options(synchronize_session=False)
+    )
+    claimed = db.session.execute(
+        select(LowStockAlert.product_id, LowStockAlert.stock_quantity, LowStockAlert.reorder_level, Product.name)
+        .join(Product, Product.id == LowStockAlert.product_id)
+        .where(LowStockAlert.notified_at == claimed_at)
+        .order_by(LowStockAlert.id)
+    ).all()
+
+    inbox.notify_admins_many([(
+        f'⚠️ Low stock: {a.name} (Only {a.stock_quantity} left, reorder at {a.reorder_level})',
+        'warning',
+        url_for('main.edit_product', id=a.product_id)
+    ) for a in claimed])
+    return len(claimed)
+
+def sweep():
+    """Record and announce today's low-stock alerts in one transaction"""
+    record_alerts()
+    sent = notify_pending()
+    checked = Product.query.filter(Product.stock_quantity <= Product.reorder_level).count()
+    db.session.commit()
+    return {'checked': checked, 'alerts_sent': sent}
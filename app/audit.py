@@ -0,0 +1,169 @@
+"""
+Asynchronous, batched audit log writer behind ``utils.log_action``.
+
+``record()`` captures an entry (user, IP address, timestamp) in the calling
+thread and puts it on a bounded in-process queue. A background thread writes
+queued entries with one multi-row ``INSERT`` on a connection of its own, as
+soon as ``AUDIT_BATCH_SIZE`` entries are waiting or ``AUDIT_FLUSH_INTERVAL``
+seconds after the first one arrived. Audit writes never go through the
+request's session, so logging adds no commit to the request and never
+commits changes the caller has not committed yet.
+
+When the queue is full, the entry is written synchronously by the caller
+(backpressure). ``shutdown()`` writes whatever is still queued. It runs at
+interpreter exit and from the ``worker_exit`` hook in gunicorn.conf.py. With
+``AUDIT_ASYNC`` off, every entry is written synchronously.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import insert
+
+from app import db, search as fts
+from app.models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+_lock = threading.Lock()
+_writer = None
+
+def write_entries(entries):
+    """Insert audit entries with one statement in a transaction of their own"""
+    with db.engine.begin() as conn:
+        # Returned in any order: parameter order would make SQLite insert row by row
+        created = conn.execute(
+            insert(AuditLog).returning(AuditLog.id, AuditLog.action, AuditLog.username), entries
+        ).all()
+        if fts.index_exists(conn):
+            fts.index_rows(conn, AuditLog, created)
+
+class AuditWriter:
+    """A bounded queue of audit entries drained by one background thread"""
+
+    def __init__(self, app, max_queue, batch_size, interval):
+        self.app = app
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pid = os.getpid()
+        self.sync_writes = 0  # entries written by the caller because the queue was full
+        self.thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, entry):
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.sync_writes += 1
+            write_entries([entry])
+
+    def flush(self, timeout=5):
+        """Block until every entry queued so far has been written"""
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def stop(self, timeout=5):
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch, markers = [], []
+            item = self.queue.get()
+            deadline = time.monotonic() + self.interval
+            while True:
+                if item is _STOP:
+                    break
+                if isinstance(item, threading.Event):
+                    markers.append(item)
+                    break  # Write now; someone is waiting for it
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for marker in markers:
+                marker.set()
+            if item is _STOP:
+                return
+
+    def _write(self, batch):
+        with self.app.app_context():
+            try:
+                write_entries(batch)
+            except Exception:
+                # Write the batch row by row so only the entries that fail are lost
+                for entry in batch:
+                    try:
+                        write_entries([entry])
+                    except Exception:
+                        logger.exception('Audit log entry lost: %s', entry.get('action'))
+
+def _get_writer():
+    global _writer
+    with _lock:
+        if _writer is None or _writer.pid != os.getpid():
+            # A forked worker does not inherit the parent's thread; start its own
+            config = current_app.config
+            _writer = AuditWriter(current_app._get_current_object(),
+                                  config.get('AUDIT_QUEUE_SIZE', 10000),
+                                  config.get('AUDIT_BATCH_SIZE', 200),
+                                  config.get('AUDIT_FLUSH_INTERVAL', 1.0))
+        return _writer
+
+def make_entry(action, entity_type=None, entity_id=None, details=None):
+    authenticated = has_request_context() and current_user.is_authenticated
+    return {
+        'user_id': current_user.id if authenticated else None,
+        'username': current_user.username if authenticated else 'Anonymous',
+        'action': action,
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'details': details,
+        'ip_address': request.remote_addr if has_request_context() else None,
+        'timestamp': datetime.utcnow()
+    }
+
+def record(action, entity_type=None, entity_id=None, details=None):
+    """Queue an audit entry (or write it now when AUDIT_ASYNC is off)"""
+    entry = make_entry(action, entity_type, entity_id, details)
+    if current_app.config.get('AUDIT_ASYNC', True):
+        _get_writer().submit(entry)
+    else:
+        write_entries([entry])
+
+def flush(timeout=5):
+    """Wait for this process's queued entries to be written"""
+    if _writer is not None and _writer.pid == os.getpid():
+        return _writer.flush(timeout)
+    return True
+
+def shutdown(timeout=5):
+    """Write the remaining entries and stop the writer thread"""
+    global _writer
+    with _lock:
+        writer, _writer = _writer, None
+    if writer is not None and writer.pid == os.getpid():
+        writer.stop(timeout)
+
+atexit.register(shutdown)
@@ -0,0 +1,350 @@
+"""
+Audit log partitioning, retention and archiving.
+
+The database keeps only the hot months of the audit log: the current month
+and the ``AUDIT_HOT_MONTHS - 1`` before it. ``archive_cold_months()`` (run by
+``flask audit-archive`` from cron) writes each older month to a gzip-compressed
+JSON Lines file in ``AUDIT_ARCHIVE_FOLDER`` and only then removes it from the
+database. Archive files older than ``AUDIT_ARCHIVE_RETENTION_MONTHS`` are
+deleted.
+
+On PostgreSQL ``audit_logs`` is natively partitioned by month (migration 5).
+``ensure_partitions()`` creates the partitions ahead of time, and a cold month
+is detached, exported and dropped, so archiving never deletes row by row. On
+SQLite the hot months live in one table and a cold month is exported and then
+deleted by timestamp range.
+
+The audit log page reads the database only. A ``start``/``end`` date range
+that reaches back past the hot months also reads the archive files for those
+months, merged into the same keyset pages.
+"""
+import glob
+import gzip
+import heapq
+import itertools
+import json
+import os
+import re
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select, delete, func, tuple_
+
+from app import db, search as fts
+from app.database import without_statement_timeout
+from app.models import AuditLog
+from app.pagination import KeysetPage, decode_position
+from app.utils import encode_cursor
+
+FIELDS = ('id', 'user_id', 'username', 'action', 'entity_type', 'entity_id', 'details', 'ip_address', 'timestamp')
+ARCHIVE_NAME = re.compile(r'audit_logs_(\d{4})-(\d{2})(?:\.\d+)?\.jsonl\.gz$')
+
+# ==================== MONTHS ====================
+
+def month_start(year, month):
+    return datetime(year, month, 1)
+
+def add_months(year, month, count):
+    index = year * 12 + month - 1 + count
+    return index // 12, index % 12 + 1
+
+def months_between(start, end):
+    """(year, month) for every month from start's up to, not including, end's"""
+    year, month = start.year, start.month
+    while month_start(year, month) < end:
+        yield year, month
+        year, month = add_months(year, month, 1)
+
+def hot_cutoff(now=None, hot_months=None):
+    """Start of the oldest month still kept in the database"""
+    now = now or datetime.utcnow()
+    hot_months = hot_months or current_app.config.get('AUDIT_HOT_MONTHS', 3)
+    return month_start(*add_months(now.year, now.month, -(hot_months - 1)))
+
+# ==================== POSTGRESQL PARTITIONS ====================
+
+def partition_name(year, month):
+    return f'audit_logs_{year:04d}_{month:02d}'
+
+def is_partitioned(conn):
+    return conn.dialect.name == 'postgresql' and conn.exec_driver_sql(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'audit_logs'"
+    ).first() is not None
+
+def _table_exists(conn, name):
+    return conn.exec_driver_sql('SELECT to_regclass(%(name)s)', {'name': name}).scalar() is not None
+
+def ensure_partitions(conn, since=None, months_ahead=None):
+    """Create the monthly partitions from since's month through months_ahead months from now"""
+    if months_ahead is None:
+        months_ahead = current_app.config.get('AUDIT_PARTITIONS_AHEAD', 3)
+    now = datetime.utcnow()
+    until = month_start(*add_months(now.year, now.month, months_ahead + 1))
+    for year, month in months_between(min(since or now, now), until):
+        name = partition_name(year, month)
+        if _table_exists(conn, name):
+            continue
+        lower, upper = month_start(year, month), month_start(*add_months(year, month, 1))
+        bounds = f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        in_range = {'lower': lower, 'upper': upper}
+        stray = conn.exec_driver_sql(
+            'SELECT 1 FROM audit_logs_default WHERE timestamp >= %(lower)s AND timestamp < %(upper)s LIMIT 1', in_range
+        ).first()
+        if stray is None:
+            conn.exec_driver_sql(f'CREATE TABLE {name} PARTITION OF audit_logs {bounds}')
+            continue
+        # The month's rows went to the default partition (no partition existed yet), and a
+        # partition cannot be created over rows the default still holds: move them across
+        conn.exec_driver_sql('ALTER TABLE audit_logs DETACH PARTITION audit_logs_default')
+        conn.exec_driver_sql(f'CREATE TABLE {name} PARTITION OF audit_logs {bounds}')
+        conn.exec_driver_sql(
+            f"WITH moved AS (DELETE FROM audit_logs_default WHERE timestamp >= %(lower)s AND timestamp < %(upper)s "
+            f"RETURNING {', '.join(FIELDS)}) INSERT INTO audit_logs ({', '.join(FIELDS)}) SELECT * FROM moved", in_range
+        )
+        conn.exec_driver_sql('ALTER TABLE audit_logs ATTACH PARTITION audit_logs_default DEFAULT')
+
+def _attached_partition(conn, year, month):
+    return conn.exec_driver_sql(
+        "SELECT 1 FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'audit_logs' AND c.relname = %(name)s",
+        {'name': partition_name(year, month)}
+    ).first() is not None
+
+def partition_audit_logs(conn):
+    """Turn a plain audit_logs table into one partitioned by month, keeping its rows and ids"""
+    conn.exec_driver_sql('ALTER TABLE audit_logs RENAME TO audit_logs_unpartitioned')
+    conn.exec_driver_sql('ALTER SEQUENCE audit_logs_id_seq OWNED BY NONE')
+    # The partition key has to be part of the primary key
+    conn.exec_driver_sql(
+        "CREATE TABLE audit_logs ("
+        "id INTEGER NOT NULL DEFAULT nextval('audit_logs_id_seq'), "
+        "user_id INTEGER REFERENCES users (id), "
+        "username VARCHAR(64), "
+        "action VARCHAR(100) NOT NULL, "
+        "entity_type VARCHAR(50), "
+        "entity_id INTEGER, "
+        "details TEXT, "
+        "ip_address VARCHAR(45), "
+        "timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'), "
+        "PRIMARY KEY (id, timestamp)"
+        ") PARTITION BY RANGE (timestamp)"
+    )
+    # Catches rows outside every monthly partition instead of failing the insert
+    conn.exec_driver_sql('CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT')
+    ensure_partitions(conn, since=conn.exec_driver_sql('SELECT min(timestamp) FROM audit_logs_unpartitioned').scalar())
+    conn.exec_driver_sql(
+        f"INSERT INTO audit_logs ({', '.join(FIELDS)}) "
+        f"SELECT {', '.join(FIELDS[:-1])}, coalesce(timestamp, now() AT TIME ZONE 'utc') FROM audit_logs_unpartitioned"
+    )
+    conn.exec_driver_sql('DROP TABLE audit_logs_unpartitioned')
+    conn.exec_driver_sql('ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id')
+    conn.exec_driver_sql('CREATE INDEX ix_audit_logs_timestamp_id ON audit_logs (timestamp, id)')
+
+# ==================== ARCHIVING ====================
+
+def archive_folder():
+    folder = current_app.config['AUDIT_ARCHIVE_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def _archive_path(year, month):
+    """A new file for the month; a month archived again (late rows) gets a numbered part"""
+    base = os.path.join(archive_folder(), f'audit_logs_{year:04d}-{month:02d}')
+    path, part = f'{base}.jsonl.gz', 0
+    while os.path.exists(path):
+        part += 1
+        path = f'{base}.{part}.jsonl.gz'
+    return path
+
+def _write_archive(year, month, rows):
+    """Write rows to the month's archive atomically. Returns the ids written."""
+    path = _archive_path(year, month)
+    partial = path + '.partial'
+    ids = []
+    with gzip.open(partial, 'wt', encoding='utf-8') as f:
+        for row in rows:
+            entry = {field: getattr(row, field) for field in FIELDS}
+            entry['timestamp'] = entry['timestamp'].isoformat()
+            f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            ids.append(row.id)
+    if not ids:
+        os.remove(partial)
+        return ids
+    with open(partial, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+    return ids
+
+def _month_rows(conn, table, start, end, batch_size=1000):
+    columns = [table.c[field] for field in FIELDS]
+    result = conn.execute(
+        select(*columns).where(table.c.timestamp >= start, table.c.timestamp < end)
+        .order_by(table.c.id).execution_options(yield_per=batch_size)
+    )
+    for batch in result.partitions():
+        yield from batch
+
+def _detached_months(conn):
+    """Months whose partition was detached by an archive run that did not finish"""
+    names = conn.exec_driver_sql(
+        "SELECT c.relname FROM pg_class c WHERE c.relkind = 'r' AND c.relname ~ '^audit_logs_[0-9]{4}_[0-9]{2}$' "
+        "AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)"
+    ).scalars()
+    return [(int(name[11:15]), int(name[16:18])) for name in names]
+
+def archive_month(year, month):
+    """Move one month of audit entries from the database to an archive file. Returns entries archived."""
+    start, end = month_start(year, month), month_start(*add_months(year, month, 1))
+    table = AuditLog.__table__
+    name = partition_name(year, month)
+    partitioned = db.engine.dialect.name == 'postgresql'
+    if partitioned:
+        with db.engine.begin() as conn:
+            partitioned = is_partitioned(conn)
+            if partitioned and _attached_partition(conn, year, month):
+                # Detached, the month takes no more inserts and is exported without holding a lock on audit_logs
+                conn.exec_driver_sql(f'ALTER TABLE audit_logs DETACH PARTITION {name}')
+
+    with db.engine.begin() as conn, without_statement_timeout(conn):
+        detached = table.to_metadata(db.MetaData(), name=name) if partitioned and _table_exists(conn, name) else None
+        # Rows of the month outside its partition sit in the default partition (or, on SQLite, the only table)
+        rows = _month_rows(conn, table, start, end)
+        if detached is not None:
+            rows = itertools.chain(_month_rows(conn, detached, start, end), rows)
+        ids = _write_archive(year, month, rows)
+        if detached is not None:
+            conn.exec_driver_sql(f'DROP TABLE {name}')
+        if ids:
+            conn.execute(delete(table).where(table.c.timestamp >= start, table.c.timestamp < end,
+                                             table.c.id <= max(ids)))
+            if fts.index_exists(conn):
+                fts.unindex_ids(conn, AuditLog, ids)
+    return len(ids)
+
+def cold_months(cutoff=None):
+    """(year, month) of every month before the cutoff that still has rows in the database"""
+    cutoff = cutoff or hot_cutoff()
+    with db.engine.connect() as conn:
+        oldest = conn.execute(select(func.min(AuditLog.timestamp)).where(AuditLog.timestamp < cutoff)).scalar()
+        months = set(months_between(oldest, cutoff)) if oldest else set()
+        if is_partitioned(conn):
+            months.update(_detached_months(conn))
+    return sorted(months)
+
+def archived_files():
+    """{(year, month): [paths]} of the archive files on disk"""
+    files = {}
+    for path in sorted(glob.glob(os.path.join(archive_folder(), 'audit_logs_*.jsonl.gz'))):
+        match = ARCHIVE_NAME.search(os.path.basename(path))
+        if match:
+            files.setdefault((int(match.group(1)), int(match.group(2))), []).append(path)
+    return files
+
+def purge_archives(retention_months=None, now=None):
+    """Delete archive files for months older than the retention period. Returns the paths removed."""
+    if retention_months is None:
+        retention_months = current_app.config.get('AUDIT_ARCHIVE_RETENTION_MONTHS')
+    if not retention_months:
+        return []
+    now = now or datetime.utcnow()
+    oldest_kept = add_months(now.year, now.month, -retention_months)
+    removed = []
+    for month, paths in archived_files().items():
+        if month < oldest_kept:
+            for path in paths:
+                os.remove(path)
+                removed.append(path)
+    return removed
+
+def run_retention(log=None, dry_run=False):
+    """Create upcoming partitions, archive the cold months and purge expired archives"""
+    log = log or (lambda message: None)
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as conn, without_statement_timeout(conn):
+            if is_partitioned(conn):
+                ensure_partitions(conn)
+
+    summary = {'archived': {}, 'purged': []}
+    for year, month in cold_months():
+        if dry_run:
+            log(f'Would archive {year:04d}-{month:02d}')
+            continue
+        count = archive_month(year, month)
+        summary['archived'][f'{year:04d}-{month:02d}'] = count
+        log(f'Archived {year:04d}-{month:02d}: {count} entries')
+    if not dry_run:
+        summary['purged'] = purge_archives()
+        for path in summary['purged']:
+            log(f'Deleted expired archive {os.path.basename(path)}')
+    return summary
+
+# ==================== READING ====================
+
+class ArchivedEntry:
+    """An audit entry read back from an archive file, shaped like an AuditLog row"""
+
+    def __init__(self, data):
+        for field in FIELDS:
+            setattr(self, field, data.get(field))
+        self.timestamp = datetime.fromisoformat(data['timestamp'])
+
+def read_archive(start=None, end=None, user=None, action=None):
+    """Stream archived entries in [start, end), filtered by username/action substrings"""
+    user, action = (user or '').lower(), (action or '').lower()
+    for (year, month), paths in archived_files().items():
+        first, after = month_start(year, month), month_start(*add_months(year, month, 1))
+        if (start and after <= start) or (end and first >= end):
+            continue
+        for path in paths:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    entry = ArchivedEntry(json.loads(line))
+                    if start and entry.timestamp < start or end and entry.timestamp >= end:
+                        continue
+                    if user and user not in (entry.username or '').lower():
+                        continue
+                    if action and action not in (entry.action or '').lower():
+                        continue
+                    yield entry
+
+def reaches_archive(start, end, cutoff=None):
+    """Whether an explicit date range includes months no longer in the database"""
+    cutoff = cutoff or hot_cutoff()
+    return bool(start or end) and (start or datetime.min) < cutoff
+
+def paginate_with_archive(query, start, end, user=None, action=None, per_page=50, after=None, before=None):
+    """
+    Keyset pages (newest first) over the database query plus matching archived entries.
+    Raises ValueError for a malformed cursor.
+    """
+    def position(entry):
+        return entry.timestamp, entry.id
+
+    key = tuple_(AuditLog.timestamp, AuditLog.id)
+    archived = read_archive(start, end, user, action)
+    if before:
+        cursor = decode_position(before, AuditLog.timestamp)
+        stored = query.filter(key > tuple_(*cursor)).order_by(AuditLog.timestamp.asc(), AuditLog.id.asc()) \
+            .limit(per_page + 1).all()
+        from_archive = heapq.nsmallest(per_page + 1, (e for e in archived if position(e) > cursor), key=position)
+        rows = sorted(stored + from_archive, key=position)[:per_page + 1]
+        more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_prev, has_next = more, True
+    else:
+        cursor = decode_position(after, AuditLog.timestamp) if after else None
+        if cursor:
+            query = query.filter(key < tuple_(*cursor))
+        stored = query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(per_page + 1).all()
+        from_archive = heapq.nlargest(per_page + 1, (e for e in archived if not cursor or position(e) < cursor),
+                               key=position)
+        rows = sorted(stored + from_archive, key=position, reverse=True)[:per_page + 1]
+        items = rows[:per_page]
+        has_prev, has_next = bool(after), len(rows) > per_page
+
+    return KeysetPage(
+        items, per_page,
+        next_cursor=encode_cursor(*position(items[-1])) if has_next and items else None,
+        prev_cursor=encode_cursor(*position(items[0])) if has_prev and items else None
+    )
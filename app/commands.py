@@ -0,0 +1,138 @@
+import click
+
+def register_commands(app):
+    """Register maintenance commands on the `flask` CLI"""
+
+    @app.cli.command('kpi-refresh')
+    def kpi_refresh():
+        """Recompute every dashboard KPI snapshot metric."""
+        from app.kpi import refresh_kpis
+        data = refresh_kpis()
+        click.echo(f'Refreshed {len(data)} dashboard metrics.')
+
+    @app.cli.group('profit-ledger')
+    def profit_ledger():
+        """Maintain the per-product profit rollup."""
+
+    @profit_ledger.command('rebuild')
+    def profit_ledger_rebuild():
+        """Regenerate the rollup from a full OrderItem scan."""
+        from app.ledger import rebuild_profit_ledger
+        count = rebuild_profit_ledger()
+        click.echo(f'Profit ledger rebuilt: {count} products.')
+
+    @profit_ledger.command('verify')
+    def profit_ledger_verify():
+        """Check the rollup against a full recomputation."""
+        from app.ledger import verify_profit_ledger
+        mismatches = verify_profit_ledger()
+        for product_id, field, actual, expected in mismatches:
+            click.echo(f'Product {product_id}: {field} is {actual}, expected {expected}')
+        if mismatches:
+            raise SystemExit(1)
+        click.echo('Profit ledger OK.')
+
+    @app.cli.command('search-rebuild')
+    def search_rebuild():
+        """Recreate and backfill the full-text search index."""
+        from app.search import rebuild_index
+        for model, count in rebuild_index().items():
+            click.echo(f'{model}: {count} documents indexed')
+
+    @app.cli.command('jobs-worker')
+    @click.option('--once', is_flag=True, help='Exit once the queue is empty.')
+    def jobs_worker(once):
+        """Run a background job worker."""
+        from app.jobs import run_worker
+        run_worker(once=once, log=click.echo)
+
+    @app.cli.command('notification-counters')
+    def notification_counters():
+        """Recompute every user's unread-notification counter."""
+        from app.inbox import rebuild_counters
+        count = rebuild_counters()
+        click.echo(f'Notification counters rebuilt for {count} users.')
+
+    @app.cli.command('low-stock-sweep')
+    def low_stock_sweep():
+        """Record today's low-stock alerts and notify admins (run from cron)."""
+        from app.alerts import sweep
+        # Notification links are built with url_for
+        with app.test_request_context():
+            result = sweep()
+        click.echo(f"{result['checked']} low-stock products, {result['alerts_sent']} new alerts sent.")
+
+    @app.cli.command('stock-verify')
+    @click.option('--reconcile', is_flag=True, help='Add opening-balance movements for mismatched products.')
+    def stock_verify(reconcile):
+        """Check every product's stock against its movement ledger."""
+        from app import stock
+        mismatches = stock.verify()
+        for product_id, quantity, total in mismatches:
+            click.echo(f'Product {product_id}: stock {quantity}, ledger {total}')
+        if mismatches and reconcile:
+            click.echo(f'{stock.reconcile()} products reconciled.')
+        elif not mismatches:
+            click.echo('Stock matches the ledger for every product.')
+
+    @app.cli.command('import-data')
+    @click.argument('entity', type=click.Choice(['products', 'customers', 'suppliers']))
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--dry-run', is_flag=True, help='Validate and check duplicates without writing anything.')
+    @click.option('--update', is_flag=True, help='Update rows whose SKU / phone / name already exists instead of rejecting them.')
+    @click.option('--errors', 'errors_path', type=click.Path(dir_okay=False), help='Write rejected rows to this CSV file.')
+    def import_data(entity, path, dry_run, update, errors_path):
+        """Bulk-import products, customers or suppliers from a CSV/XLSX file."""
+        from app.imports import run_import, write_error_report
+        with open(path, 'rb') as f:
+            result = run_import(entity, f, path, dry_run=dry_run, update=update)
+        prefix = '[dry run] ' if dry_run else ''
+        click.echo(f'{prefix}{result.processed} rows: {result.inserted} inserted, {result.updated} updated, '
+                   f'{result.rejected} rejected in {result.elapsed:.2f}s ({result.rows_per_second:,.0f} rows/s)')
+        if errors_path:
+            with open(errors_path, 'w', newline='') as out:
+                write_error_report(result, out)
+            click.echo(f'Error report written to {errors_path}')
+        else:
+            for line, message in result.errors[:20]:
+                click.echo(f'  line {line}: {message}')
+            if result.rejected > 20:
+                click.echo(f'  ... {result.rejected - 20} more (use --errors to write them all)')
+
+    @app.cli.command('db-upgrade')
+    @click.option('--status', is_flag=True, help='List pending migrations without applying them.')
+    def db_upgrade(status):
+        """Apply pending schema migrations (tables and indexes)."""
+        from app import migrations
+        if status:
+            pending = migrations.pending()
+            for version, description, _, _ in pending:
+                click.echo(f'{version}: {description}')
+            click.echo(f'{len(pending)} pending migration(s).')
+            return
+        applied = migrations.upgrade(log=click.echo)
+        click.echo(f'Applied {len(applied)} migration(s).' if applied else 'Schema is up to date.')
+
+    @app.cli.command('db-explain')
+    @click.option('--verbose', is_flag=True, help='Print every query plan.')
+    def db_explain(verbose):
+        """Check that the hot list and join queries use their indexes."""
+        from app.migrations import check_query_plans
+        missing = 0
+        for description, index, used, plan in check_query_plans():
+            missing += not used
+            click.echo(f"{'OK  ' if used else 'MISS'} {description:<36} {index}")
+            if verbose or not used:
+                click.echo('     ' + plan.replace('\n', '\n     '))
+        if missing:
+            raise SystemExit(f'{missing} queries do not use their index; run `flask db-upgrade`.')
+
+    @app.cli.command('audit-archive')
+    @click.option('--dry-run', is_flag=True, help='List the months that would be archived without moving anything.')
+    def audit_archive(dry_run):
+        """Archive audit log months older than AUDIT_HOT_MONTHS and delete expired archives."""
+        from app.audit_archive import run_retention
+        summary = run_retention(log=click.echo, dry_run=dry_run)
+        if not dry_run:
+            click.echo(f"Archived {sum(summary['archived'].values())} entries from {len(summary['archived'])} month(s); "
+                       f"deleted {len(summary['purged'])} expired archive(s).")
@@ -0,0 +1,57 @@
+"""
+Per-connection database settings for the DB_PROFILE in config.py.
+
+Pool sizing, ``pool_pre_ping`` and the PostgreSQL server-side timeouts are
+plain engine options (``SQLALCHEMY_ENGINE_OPTIONS``). SQLite has no
+connection-string equivalent for its PRAGMAs, so ``init_app()`` runs
+``SQLITE_PRAGMAS`` on every new connection of every SQLite engine: WAL
+lets readers and the writer proceed together, and ``busy_timeout`` makes a
+second writer wait for the lock instead of failing with "database is
+locked".
+
+Maintenance work that legitimately runs long (migrations building indexes,
+archiving a month of audit entries) wraps itself in
+``without_statement_timeout()``.
+"""
+from contextlib import contextmanager
+from functools import partial
+
+from sqlalchemy import event
+
+from app import db
+
+def _apply_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+def init_app(app):
+    """Install the connect-time PRAGMAs on the app's SQLite engines"""
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', partial(_apply_pragmas, pragmas))
+
+@contextmanager
+def without_statement_timeout(conn):
+    """Lift the PostgreSQL statement timeout for the statements run on conn inside the block"""
+    if conn.dialect.name != 'postgresql':
+        yield conn
+        return
+    if conn.get_execution_options().get('isolation_level') != 'AUTOCOMMIT':
+        # Ends with the transaction, committed or rolled back
+        conn.exec_driver_sql('SET LOCAL statement_timeout = 0')
+        yield conn
+        return
+    conn.exec_driver_sql('SET statement_timeout = 0')
+    try:
+        yield conn
+    finally:
+        # Back to the connection's default before it returns to the pool
+        conn.exec_driver_sql('RESET statement_timeout')
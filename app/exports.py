@@ -0,0 +1,191 @@
+"""
+Streaming export engine for ``/reports/export/*``.
+
+Rows are fetched in batches (``yield_per``, server-side cursor on PostgreSQL)
+as plain column tuples, never as ORM objects. CSV is streamed to the client
+as a chunked generator response. XLSX goes through an openpyxl write-only
+workbook saved to a temporary file, so memory use stays flat however many
+rows there are. Exports accept a ``start``/``end`` date range and a
+``columns`` selection.
+
+File formats are ``ExportWriter`` backends registered in ``WRITERS``; they
+take a header row and an iterable of row batches, so they also serve callers
+that already hold their rows in memory (``utils.export_to_csv``). Nothing here
+needs pandas. ``to_dataframe()`` imports it on demand for ad-hoc analysis.
+"""
+import csv
+import io
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app import db
+from app.models import Product, Category, Order, Customer, Transaction
+
+BATCH_SIZE = 1000
+
+def _date(value):
+    return value.strftime('%Y-%m-%d') if value else ''
+
+class ExportSpec:
+    """A named export: base query, date column and the selectable output columns"""
+
+    def __init__(self, name, query, date_column, columns):
+        self.name = name
+        self.query = query              # callable returning a Select of labelled columns
+        self.date_column = date_column  # column used for start/end filtering
+        self.columns = columns          # [(key, header, formatter or None), ...]
+
+    def select_columns(self, keys=None):
+        if not keys:
+            return self.columns
+        by_key = {c[0]: c for c in self.columns}
+        unknown = [k for k in keys if k not in by_key]
+        if unknown:
+            raise ValueError(f"Unknown column(s) for {self.name} export: {', '.join(unknown)}")
+        return [by_key[k] for k in keys]
+
+EXPORTS = {
+    'products': ExportSpec(
+        'products',
+        lambda: select(Product.sku, Product.name, Category.name.label('category'), Product.stock_quantity,
+                       Product.cost_price, Product.selling_price, Product.created_at)
+        .outerjoin(Category, Category.id == Product.category_id).order_by(Product.id),
+        Product.created_at,
+        [('sku', 'SKU', None), ('name', 'Name', None), ('category', 'Category', lambda v: v or ''),
+         ('stock_quantity', 'Stock', None), ('cost_price', 'Cost Price', None),
+         ('selling_price', 'Selling Price', None)]
+    ),
+    'orders': ExportSpec(
+        'orders',
+        lambda: select(Order.id, Order.order_date, Customer.name.label('customer'), Order.status,
+                       Order.payment_status, Order.total_amount)
+        .outerjoin(Customer, Customer.id == Order.customer_id).order_by(Order.id),
+        Order.order_date,
+        [('id', 'Order ID', lambda v: f'#{v}'), ('order_date', 'Date', _date),
+         ('customer', 'Customer', lambda v: v or ''), ('status', 'Status', None),
+         ('payment_status', 'Payment', None), ('total_amount', 'Total', None)]
+    ),
+    'transactions': ExportSpec(
+        'transactions',
+        lambda: select(Transaction.date, Transaction.type, Transaction.category, Transaction.description,
+                       Transaction.amount).order_by(Transaction.id),
+        Transaction.date,
+        [('date', 'Date', _date), ('type', 'Type', None), ('category', 'Category', None),
+         ('description', 'Description', None), ('amount', 'Amount', None)]
+    ),
+}
+
+def parse_date_range(start, end):
+    """Parse YYYY-MM-DD bounds; end is inclusive. Raises ValueError on bad input."""
+    try:
+        start = datetime.strptime(start, '%Y-%m-%d') if start else None
+        end = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) if end else None
+    except ValueError:
+        raise ValueError('Dates must be in YYYY-MM-DD format.')
+    return start, end
+
+def iter_rows(spec, columns, start=None, end=None, batch_size=BATCH_SIZE):
+    """Yield lists of formatted rows, one batch at a time"""
+    stmt = spec.query()
+    if start:
+        stmt = stmt.where(spec.date_column >= start)
+    if end:
+        stmt = stmt.where(spec.date_column < end)
+
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    for batch in result.partitions():
+        yield [[fmt(getattr(row, key)) if fmt else getattr(row, key) for key, _, fmt in columns]
+               for row in batch]
+
+# ==================== WRITERS ====================
+
+class ExportWriter:
+    """An output format: writes a header row and batches of rows to a binary file"""
+    extension = None
+    mimetype = None
+    streams = False  # chunks() yields output while rows are still being fetched
+
+    def write(self, headers, batches, out):
+        raise NotImplementedError
+
+    def chunks(self, headers, batches):
+        """The output as a sequence of chunks; formats that cannot stream spool to a file first"""
+        with self.spool(headers, batches) as spool:
+            while True:
+                chunk = spool.read(64 * 1024)
+                if not chunk:
+                    return
+                yield chunk
+
+    def spool(self, headers, batches):
+        """The output in a rewound temporary file"""
+        spool = tempfile.TemporaryFile()
+        self.write(headers, batches, spool)
+        spool.seek(0)
+        return spool
+
+class CsvWriter(ExportWriter):
+    extension = 'csv'
+    mimetype = 'text/csv'
+    streams = True
+
+    def chunks(self, headers, batches):
+        """CSV text: the header, then one chunk per batch"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(headers)
+        yield buffer.getvalue()
+
+        for rows in batches:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue()
+
+    def write(self, headers, batches, out):
+        text = io.TextIOWrapper(out, encoding='utf-8', newline='', write_through=True)
+        for chunk in self.chunks(headers, batches):
+            text.write(chunk)
+        text.detach()
+
+class XlsxWriter(ExportWriter):
+    extension = 'xlsx'
+    mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    def write(self, headers, batches, out):
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Data')
+        sheet.append(headers)
+        for rows in batches:
+            for row in rows:
+                sheet.append(row)
+        workbook.save(out)
+
+WRITERS = {writer.extension: writer for writer in (CsvWriter(), XlsxWriter())}
+
+def get_writer(format):
+    """The writer for a format name; raises ValueError for an unknown one"""
+    if format not in WRITERS:
+        raise ValueError(f"Unknown export format: {format}. Use {' or '.join(WRITERS)}.")
+    return WRITERS[format]
+
+# ==================== EXPORTS ====================
+
+def headers(columns):
+    return [header for _, header, _ in columns]
+
+def write_export(spec, columns, format, out, start=None, end=None):
+    """Write the export in the given format to a binary file"""
+    get_writer(format).write(headers(columns), iter_rows(spec, columns, start, end), out)
+
+def to_dataframe(spec, columns=None, start=None, end=None):
+    """The export as a pandas DataFrame, for analysis in a shell or notebook"""
+    import pandas as pd
+
+    columns = spec.select_columns(columns)
+    rows = [row for batch in iter_rows(spec, columns, start, end) for row in batch]
+    return pd.DataFrame(rows, columns=headers(columns))
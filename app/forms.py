@@ -1,7 +1,8 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
-from wtforms import StringField, PasswordField, BooleanField, FloatField, IntegerField, TextAreaField, SelectField, DateField, SubmitField
+from wtforms import StringField, PasswordField, BooleanField, DecimalField, IntegerField, TextAreaField, SelectField, DateField, SubmitField
 from wtforms.validators import DataRequired, Email, Length, Optional, EqualTo
+from wtforms.widgets import HiddenInput
 
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
@@ -14,15 +15,16 @@ class ProductForm(FlaskForm):
     name = StringField('Product Name', validators=[DataRequired()])
     category_id = SelectField('Category', coerce=int, validators=[Optional()])
     description = TextAreaField('Description')
-    cost_price = FloatField('Cost Price', validators=[Optional()])
-    selling_price = FloatField('Selling Price', validators=[DataRequired()])
+    cost_price = DecimalField('Cost Price', places=2, validators=[Optional()])
+    selling_price = DecimalField('Selling Price', places=2, validators=[DataRequired()])
     stock_quantity = IntegerField('Stock Quantity', validators=[DataRequired()])
+    stock_seen = IntegerField(widget=HiddenInput(), validators=[Optional()])  # Stock shown when the edit form was opened
     reorder_level = IntegerField('Reorder Level', default=5)
     supplier_id = SelectField('Supplier', coerce=int, validators=[Optional()])
     image = FileField('Product Image', validators=[FileAllowed(['jpg', 'jpeg', 'png'], 'Images only!')])
 
 class OrderForm(FlaskForm):
-    customer_id = SelectField('Customer', coerce=int, validators=[DataRequired()])
+    customer_id = IntegerField('Customer', widget=HiddenInput(), validators=[DataRequired()])  # Filled by the customer typeahead
     status = SelectField('Status', choices=[('Pending', 'Pending'), ('Processing', 'Processing'), ('Shipped', 'Shipped'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], default='Pending')
     payment_status = SelectField('Payment Status', choices=[('Unpaid', 'Unpaid'), ('Paid', 'Paid'), ('Refunded', 'Refunded')], default='Unpaid')
     payment_method = SelectField('Payment Method', choices=[('Cash', 'Cash'), ('Card', 'Card'), ('Bank Transfer', 'Bank Transfer')], default='Cash')
@@ -43,7 +45,7 @@ class SupplierForm(FlaskForm):
 class TransactionForm(FlaskForm):
     type = SelectField('Type', choices=[('Income', 'Income'), ('Expense', 'Expense')], validators=[DataRequired()])
     category = SelectField('Category', choices=[('Sales', 'Sales'), ('Rent', 'Rent'), ('Salaries', 'Salaries'), ('Utilities', 'Utilities'), ('Inventory', 'Inventory'), ('Other', 'Other')], validators=[DataRequired()])
-    amount = FloatField('Amount', validators=[DataRequired()])
+    amount = DecimalField('Amount', places=2, validators=[DataRequired()])
     description = TextAreaField('Description')
 
 class ProductionJobForm(FlaskForm):
@@ -0,0 +1,377 @@
+"""
+Bulk CSV/XLSX import for products, customers and suppliers.
+
+Files are read as a stream (a csv reader or a read-only openpyxl workbook)
+and processed in chunks of ``BATCH_SIZE`` rows. Each row in a chunk is parsed
+and validated. Duplicate keys (``Product.sku``, ``Customer.phone`` and
+``Customer.email``, supplier name) are then checked against the database with
+one ``IN`` query per key and against earlier rows of the file, both as set
+lookups. New rows go in with one bulk ``INSERT ... RETURNING``. With
+``update=True``, rows whose first key already exists change that record in one
+bulk ``UPDATE`` instead of being rejected; blank cells keep the stored value.
+Every chunk commits on its own.
+
+A dry run does all the checks and writes nothing. Rejected rows are collected
+with their line number for the error report. Headers are matched
+case-insensitively, and the headers written by ``/reports/export/products``
+are accepted, so an export can be edited and imported back.
+"""
+import csv
+import io
+import os
+import time
+
+from sqlalchemy import insert, update, select, func
+
+from app import db, ledger, refcache, stock, money, search as fts
+from app.models import Product, Customer, Supplier, Category
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 10000
+
+# ==================== FIELD PARSERS ====================
+
+def _clean(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # Spreadsheets hand back phone numbers and SKUs as floats
+    return str(value).strip()
+
+def _text(value):
+    return _clean(value) or None
+
+def _number(value):
+    text = _clean(value).replace(',', '')
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        raise ValueError(f'"{text}" is not a number')
+
+def _amount(value):
+    text = _clean(value).replace(',', '')
+    if not text:
+        return None
+    try:
+        return money.to_decimal(text)
+    except ArithmeticError:
+        raise ValueError(f'"{text}" is not an amount')
+
+def _whole(value):
+    number = _number(value)
+    if number is None:
+        return None
+    if not number.is_integer():
+        raise ValueError(f'"{_clean(value)}" is not a whole number')
+    return int(number)
+
+class _Ref:
+    """A column holding another table's name, resolved to its id"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def bind(self):
+        ids = {name.lower(): id for id, name in db.session.query(self.model.id, self.model.name)}
+        label = self.model.__name__.lower()
+
+        def parse(value):
+            name = _clean(value)
+            if not name:
+                return None
+            if name.lower() not in ids:
+                raise ValueError(f'unknown {label} "{name}"')
+            return ids[name.lower()]
+        return parse
+
+# ==================== SPECS ====================
+
+class ImportSpec:
+    """An importable entity: its model, fields and duplicate-check keys"""
+
+    def __init__(self, name, model, fields, keys, cache=None):
+        self.name = name
+        self.model = model
+        self.fields = fields  # [(column, header aliases, parser, required, default), ...]
+        self.keys = keys      # [(column, case-insensitive)], the first one matches rows for updates
+        self.cache = cache    # refcache list to invalidate after writing
+
+    def key_expression(self, column, folded):
+        expr = getattr(self.model, column)
+        return func.lower(expr) if folded else expr
+
+    def resolve_headers(self, headers):
+        """{column: position in the file} for every recognised header"""
+        wanted = {}
+        for column, aliases, *_ in self.fields:
+            for alias in (column,) + aliases:
+                wanted[alias] = column
+        positions = {}
+        for i, header in enumerate(headers):
+            column = wanted.get(_clean(header).lower().replace(' ', '_'))
+            if column and column not in positions:
+                positions[column] = i
+        missing = [column for column, _, _, required, _ in self.fields if required and column not in positions]
+        if missing:
+            raise ValueError(f"Missing required column(s) for {self.name} import: {', '.join(missing)}")
+        return positions
+
+IMPORTS = {
+    'products': ImportSpec('products', Product, [
+        ('sku', (), _text, True, None),
+        ('name', (), _text, True, None),
+        ('category_id', ('category',), _Ref(Category), False, None),
+        ('description', (), _text, False, None),
+        ('cost_price', ('cost',), _amount, False, 0),
+        ('selling_price', ('price',), _amount, True, None),
+        ('stock_quantity', ('stock', 'quantity', 'qty'), _whole, False, 0),
+        ('reorder_level', (), _whole, False, 5),
+        ('supplier_id', ('supplier',), _Ref(Supplier), False, None),
+    ], [('sku', False)], cache='products'),
+    'customers': ImportSpec('customers', Customer, [
+        ('name', (), _text, True, None),
+        ('phone', (), _text, True, None),
+        ('email', (), _text, False, None),
+        ('address', (), _text, False, None),
+    ], [('phone', False), ('email', False)]),
+    'suppliers': ImportSpec('suppliers', Supplier, [
+        ('name', (), _text, True, None),
+        ('contact_person', ('contact',), _text, False, None),
+        ('phone', (), _text, False, None),
+        ('email', (), _text, False, None),
+        ('address', (), _text, False, None),
+    ], [('name', True)], cache='suppliers'),
+}
+
+# ==================== READING ====================
+
+def read_rows(stream, filename):
+    """Yield the header row, then (line number, values) for every non-empty row"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext == '.csv':
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='') if 'b' in getattr(stream, 'mode', 'b') else stream
+        reader = csv.reader(text)
+        yield next(reader, [])
+        for values in reader:
+            if any(v.strip() for v in values):
+                yield reader.line_num, values
+    elif ext == '.xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            yield list(next(rows, []))
+            for line, values in enumerate(rows, start=2):
+                if any(v is not None and _clean(v) for v in values):
+                    yield line, values
+        finally:
+            workbook.close()
+    else:
+        raise ValueError('Only .csv and .xlsx files can be imported')
+
+# ==================== PIPELINE ====================
+
+class ImportResult:
+    def __init__(self, entity, dry_run):
+        self.entity = entity
+        self.dry_run = dry_run
+        self.processed = 0
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = 0
+        self.errors = []  # [(line, message)], capped at MAX_REPORTED_ERRORS
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self, max_errors=None):
+        errors = self.errors if max_errors is None else self.errors[:max_errors]
+        return {
+            'entity': self.entity,
+            'dry_run': self.dry_run,
+            'processed': self.processed,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'rejected': self.rejected,
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'errors': [{'line': line, 'error': message} for line, message in errors]
+        }
+
+def write_error_report(result, out):
+    """Write the rejected rows as CSV (line, error) to a text stream"""
+    writer = csv.writer(out)
+    writer.writerow(['line', 'error'])
+    writer.writerows(result.errors)
+
+def _parse(spec, values, positions, parsers):
+    row = {}
+    for column, aliases, *_ in spec.fields:
+        if column not in positions:
+            continue
+        i = positions[column]
+        label = aliases[0] if column.endswith('_id') else column
+        try:
+            value = parsers[column](values[i] if i < len(values) else None)
+        except ValueError as e:
+            raise ValueError(f'{label}: {e}')
+        row[column] = value
+    if spec.model is Product:
+        if row.get('selling_price') is not None and row['selling_price'] < 0:
+            raise ValueError('selling_price cannot be negative')
+        if (row.get('stock_quantity') or 0) < 0:
+            raise ValueError('stock_quantity cannot be negative')
+    for column, value in row.items():
+        length = getattr(spec.model.__table__.c[column].type, 'length', None)
+        if length and isinstance(value, str) and len(value) > length:
+            raise ValueError(f'{column} is longer than {length} characters')
+    return row
+
+def _blank_required(spec, row):
+    """The first required field left blank in row, or None"""
+    for column, aliases, _, required, _ in spec.fields:
+        if required and row.get(column) is None:
+            return aliases[0] if column.endswith('_id') else column
+    return None
+
+def _existing(spec, parsed):
+    """{key column: {key value: id}} for keys in this chunk that are already stored"""
+    found = {}
+    for column, folded in spec.keys:
+        values = {_key(row.get(column), folded) for _, row in parsed} - {None}
+        expr = spec.key_expression(column, folded)
+        found[column] = dict(db.session.execute(
+            select(expr, spec.model.id).where(expr.in_(values))
+        ).all()) if values else {}
+    return found
+
+def _key(value, folded):
+    if not value:
+        return None
+    return value.lower() if folded else value
+
+def _write(spec, inserts, updates):
+    conn = db.session.connection()
+    indexed = fts.index_exists(conn)
+    _, _, _, doc_fields = fts.DOC_TYPES[spec.model]
+    columns = [getattr(spec.model, f) for f in doc_fields]
+
+    if inserts:
+        # Every row carries every field, so the rows batch into multi-row INSERTs
+        rows = [{column: row.get(column, default) for column, _, _, _, default in spec.fields} for row in inserts]
+        # RETURNING carries everything needed afterwards, so the rows can come back in any order;
+        # asking for parameter order would make SQLite insert them one at a time
+        returned = columns + ([Product.stock_quantity] if spec.model is Product else [])
+        created = db.session.execute(insert(spec.model).returning(spec.model.id, *returned), rows).all()
+        if indexed:
+            fts.index_rows(conn, spec.model, created)
+        if spec.model is Product:
+            stock.record_initial_rows([(r.id, r.stock_quantity) for r in created])
+
+    if updates:
+        # Stock only changes through the movement ledger, never by overwriting it from a file
+        rows = [{k: v for k, v in row.items() if k != 'stock_quantity'} for row in updates]
+        for group in _same_keys(rows):
+            db.session.execute(update(spec.model), group)
+        costed = [row['id'] for row in rows if 'cost_price' in row]
+        if spec.model is Product and costed:
+            # Keep the profit ledger's cost basis in step with the new cost prices
+            ledger.on_cost_prices_change(costed)
+        if indexed:
+            changed = db.session.execute(
+                select(spec.model.id, *columns).where(spec.model.id.in_([row['id'] for row in rows]))
+            ).all()
+            fts.index_rows(conn, spec.model, changed)
+
+def _same_keys(rows):
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return groups.values()
+
+def _process(spec, chunk, positions, parsers, seen, result, dry_run, allow_update):
+    parsed = []
+    for line, values in chunk:
+        try:
+            parsed.append((line, _parse(spec, values, positions, parsers)))
+        except ValueError as e:
+            result.reject(line, str(e))
+
+    existing = _existing(spec, parsed)
+    match_column = spec.keys[0][0]
+    inserts, updates = [], []
+    for line, row in parsed:
+        keys = {column: _key(row.get(column), folded) for column, folded in spec.keys}
+        repeated = next((c for c, v in keys.items() if v is not None and v in seen[c]), None)
+        if repeated:
+            result.reject(line, f'duplicate {repeated} "{row[repeated]}" earlier in the file')
+            continue
+
+        match = existing[match_column].get(keys[match_column])
+        clash = next((c for c, v in keys.items() if v is not None and c != match_column
+                      and existing[c].get(v) not in (None, match)), None)
+        if clash:
+            result.reject(line, f'{clash} "{row[clash]}" already belongs to another {spec.model.__name__.lower()}')
+            continue
+        if match is not None and not allow_update:
+            result.reject(line, f'{match_column} "{row[match_column]}" already exists')
+            continue
+        # Only new records need every required field; an update keeps the stored value for a blank cell
+        blank = _blank_required(spec, row) if match is None else None
+        if blank:
+            result.reject(line, f'{blank} is required')
+            continue
+
+        for column, value in keys.items():
+            if value is not None:
+                seen[column].add(value)
+        if match is not None:
+            # A blank cell leaves the stored value alone instead of clearing it
+            updates.append({column: value for column, value in row.items() if value is not None} | {'id': match})
+        else:
+            inserts.append(row)
+
+    result.inserted += len(inserts)
+    result.updated += len(updates)
+    if dry_run or not (inserts or updates):
+        return
+    _write(spec, inserts, updates)
+    if spec.cache:
+        refcache.invalidate(spec.cache)
+    db.session.commit()
+
+def run_import(entity, stream, filename, dry_run=False, update=False, batch_size=BATCH_SIZE):
+    """Import a CSV/XLSX file of entity rows. Returns an ImportResult."""
+    spec = IMPORTS.get(entity)
+    if spec is None:
+        raise ValueError(f'Unknown import: {entity}')
+    result = ImportResult(entity, dry_run)
+
+    rows = read_rows(stream, filename)
+    positions = spec.resolve_headers(next(rows))
+    parsers = {column: parser.bind() if isinstance(parser, _Ref) else parser
+               for column, _, parser, _, _ in spec.fields}
+    seen = {column: set() for column, _ in spec.keys}
+
+    chunk = []
+    for line, values in rows:
+        chunk.append((line, values))
+        result.processed += 1
+        if len(chunk) >= batch_size:
+            _process(spec, chunk, positions, parsers, seen, result, dry_run, update)
+            chunk = []
+    if chunk:
+        _process(spec, chunk, positions, parsers, seen, result, dry_run, update)
+
+    result.elapsed = time.perf_counter() - result.started
+    return result
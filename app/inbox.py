@@ -0,0 +1,235 @@
+"""
+Per-user notification inbox: fan-out, unread counters and the notification bar.
+
+Admin notifications fan out in one of two ways (``NOTIFICATION_FANOUT``):
+
+* ``direct`` - one ``INSERT ... SELECT`` copies the notification to every
+  admin and one ``UPDATE`` bumps their counters. There are no per-admin ORM
+  objects.
+* ``broadcast`` - the notification is stored once with ``user_id`` NULL.
+  Admins read it through per-user ``NotificationRead`` markers. The only other
+  write is a running broadcast count (a ``cache_versions`` row), so write
+  volume per event does not grow with the admin team.
+
+``NotificationCounter`` holds each user's unread count for notifications
+addressed to them, plus how many broadcasts they have read. It is updated in
+the same transaction as the notification writes. The user loader joins it onto
+``current_user``, so the badge costs no query for staff and one lookup of the
+broadcast count for admins. The five most recent notifications are cached
+in-process per user, keyed by the counter version and broadcast count with a
+short TTL (``NOTIFICATION_CACHE_TTL``).
+"""
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import update, insert, select, func, or_, exists, literal, String, Boolean, DateTime
+from sqlalchemy.exc import IntegrityError
+
+from app import db, refcache
+from app.models import Notification, NotificationCounter, NotificationRead, CacheVersion, User
+
+RECENT_LIMIT = 5
+ADMIN_ROLE = 'Admin'
+BROADCASTS = 'notifications.broadcasts'  # cache_versions row whose version counts broadcasts sent
+
+_recent = {}  # user_id -> (key, expires_at, [notification dicts])
+
+# ==================== COUNTERS ====================
+
+def _seed(user_id):
+    """A counter row computed from the notifications table (already flushed)"""
+    unread = Notification.query.filter_by(user_id=user_id, is_read=False).count()
+    read = NotificationRead.query.filter_by(user_id=user_id).count()
+    return NotificationCounter(user_id=user_id, unread_count=unread, broadcasts_read=read, version=1)
+
+def _adjust(user_id, **values):
+    values['version'] = NotificationCounter.version + 1
+    stmt = update(NotificationCounter).where(NotificationCounter.user_id == user_id).values(**values)
+    if db.session.execute(stmt).rowcount:
+        return
+
+    # First change for this user: seed the row, which already reflects this change
+    try:
+        with db.session.begin_nested():
+            db.session.add(_seed(user_id))
+    except IntegrityError:
+        # Created concurrently; its seed could not see our uncommitted rows
+        db.session.execute(stmt)
+
+def notifications_added(counts):
+    """Record new unread notifications: counts is {user_id: number added}"""
+    for user_id, count in counts.items():
+        _adjust(user_id, unread_count=NotificationCounter.unread_count + count)
+
+def rebuild_counters():
+    """Recompute every user's counter from the notifications table. Returns the number of users."""
+    db.session.execute(NotificationCounter.__table__.delete())
+    unread = select(func.count(Notification.id)).where(
+        Notification.user_id == User.id, Notification.is_read == False
+    ).scalar_subquery()
+    read = select(func.count()).select_from(NotificationRead).where(
+        NotificationRead.user_id == User.id
+    ).scalar_subquery()
+    result = db.session.execute(
+        insert(NotificationCounter).from_select(
+            ['user_id', 'unread_count', 'broadcasts_read', 'version'],
+            select(User.id, unread, read, literal(1))
+        )
+    )
+    db.session.commit()
+    _recent.clear()
+    return result.rowcount
+
+# ==================== FAN-OUT ====================
+
+def _fan_out_direct(message, type, link):
+    db.session.execute(insert(Notification).from_select(
+        ['user_id', 'message', 'type', 'is_read', 'timestamp', 'link'],
+        select(
+            User.id,
+            literal(message, String),
+            literal(type, String),
+            literal(False, Boolean),
+            literal(datetime.utcnow(), DateTime),
+            literal(link, String)
+        ).where(User.role == ADMIN_ROLE)
+    ))
+    _admin_counters_added(1)
+
+def _admin_counters_added(count):
+    admins = select(User.id).where(User.role == ADMIN_ROLE)
+    db.session.execute(
+        update(NotificationCounter)
+        .where(NotificationCounter.user_id.in_(admins))
+        .values(unread_count=NotificationCounter.unread_count + count, version=NotificationCounter.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    # Admins without a counter row yet get one seeded from the table
+    missing = db.session.scalars(admins.where(~exists().where(NotificationCounter.user_id == User.id))).all()
+    for user_id in missing:
+        _adjust(user_id)
+
+def _broadcasts_added(count):
+    refcache.invalidate(BROADCASTS)  # Creates the row on first use
+    if count > 1:
+        db.session.execute(
+            update(CacheVersion)
+            .where(CacheVersion.name == BROADCASTS)
+            .values(version=CacheVersion.version + count - 1)
+            .execution_options(synchronize_session=False)
+        )
+
+def notify_admins(message, type='info', link=None):
+    """Deliver a notification to every admin using the configured fan-out strategy; the caller commits"""
+    if current_app.config.get('NOTIFICATION_FANOUT', 'direct') == 'broadcast':
+        db.session.add(Notification(user_id=None, message=message, type=type, link=link))
+        _broadcasts_added(1)
+    else:
+        _fan_out_direct(message, type, link)
+
+def notify_admins_many(items):
+    """Deliver several (message, type, link) notifications to every admin with one bulk insert"""
+    if not items:
+        return
+    now = datetime.utcnow()
+    if current_app.config.get('NOTIFICATION_FANOUT', 'direct') == 'broadcast':
+        recipients = [None]
+    else:
+        recipients = db.session.scalars(select(User.id).where(User.role == ADMIN_ROLE)).all()
+    rows = [{'user_id': user_id, 'message': message, 'type': type, 'is_read': False, 'timestamp': now, 'link': link}
+            for message, type, link in items for user_id in recipients]
+    if rows:
+        db.session.execute(insert(Notification), rows)
+
+    if recipients == [None]:
+        _broadcasts_added(len(items))
+    elif recipients:
+        _admin_counters_added(len(items))
+
+# ==================== READING ====================
+
+def _is_admin(user):
+    return user.role == ADMIN_ROLE
+
+def visible(user):
+    """Select of every Notification user can see, newest first"""
+    stmt = select(Notification)
+    if _is_admin(user):
+        stmt = stmt.where(or_(Notification.user_id == user.id, Notification.user_id.is_(None)))
+    else:
+        stmt = stmt.where(Notification.user_id == user.id)
+    return stmt.order_by(Notification.timestamp.desc(), Notification.id.desc())
+
+def as_dicts(user, notifications):
+    """Notifications as template dicts, with is_read resolved from read markers for broadcasts"""
+    broadcast_ids = [n.id for n in notifications if n.user_id is None]
+    read = set()
+    if broadcast_ids:
+        read = set(db.session.scalars(select(NotificationRead.notification_id).where(
+            NotificationRead.user_id == user.id, NotificationRead.notification_id.in_(broadcast_ids)
+        )))
+    return [{
+        'id': n.id,
+        'message': n.message,
+        'type': n.type,
+        'is_read': n.id in read if n.user_id is None else n.is_read,
+        'timestamp': n.timestamp,
+        'link': n.link
+    } for n in notifications]
+
+def mark_read(notif, user):
+    """Mark one notification read for user (a read marker for broadcasts); the caller commits"""
+    if notif.user_id is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(NotificationRead(notification_id=notif.id, user_id=user.id))
+        except IntegrityError:
+            return  # Already read
+        _adjust(user.id, broadcasts_read=NotificationCounter.broadcasts_read + 1)
+    elif not notif.is_read:
+        notif.is_read = True
+        _adjust(user.id, unread_count=NotificationCounter.unread_count - 1)
+
+def mark_all_read(user):
+    """Mark everything user can see as read; the caller commits"""
+    Notification.query.filter_by(user_id=user.id, is_read=False).update({'is_read': True})
+    values = {'unread_count': 0}
+    if _is_admin(user):
+        unread_broadcasts = select(Notification.id, literal(user.id), literal(datetime.utcnow(), DateTime)).where(
+            Notification.user_id.is_(None),
+            ~exists().where(NotificationRead.notification_id == Notification.id, NotificationRead.user_id == user.id)
+        )
+        db.session.execute(insert(NotificationRead).from_select(['notification_id', 'user_id', 'read_at'], unread_broadcasts))
+        values['broadcasts_read'] = select(func.count()).select_from(NotificationRead).where(
+            NotificationRead.user_id == user.id
+        ).scalar_subquery()
+    _adjust(user.id, **values)
+
+# ==================== NOTIFICATION BAR ====================
+
+def _broadcast_total():
+    return db.session.query(CacheVersion.version).filter_by(name=BROADCASTS).scalar() or 0
+
+def notification_bar(user):
+    """(unread count, recent notifications) for the header dropdown"""
+    counter = user.notification_counter
+    if counter is None:
+        # No counter row yet (user predates counters and has had no changes since)
+        counter = _seed(user.id)
+        counter.version = 0
+
+    unread, key = counter.unread_count, (counter.version, 0)
+    if _is_admin(user):
+        total = _broadcast_total()
+        unread += max(total - counter.broadcasts_read, 0)
+        key = (counter.version, total)
+
+    now = time.monotonic()
+    cached = _recent.get(user.id)
+    if cached and cached[0] == key and cached[1] > now:
+        return unread, cached[2]
+
+    recent = as_dicts(user, db.session.scalars(visible(user).limit(RECENT_LIMIT)).all())
+    _recent[user.id] = (key, now + current_app.config.get('NOTIFICATION_CACHE_TTL', 30), recent)
+    return unread, recent
@@ -0,0 +1,171 @@
+"""
+Per-endpoint request and SQL instrumentation.
+
+SQLAlchemy ``before_cursor_execute`` / ``after_cursor_execute`` events time
+every statement. Flask request hooks add those timings up per request, then
+record wall time, DB time and statement count into in-process histograms
+keyed by endpoint. Each endpoint also keeps its slowest statements over a
+rolling ``METRICS_WINDOW``. Statements slower than ``SLOW_QUERY_THRESHOLD_MS``
+are logged, including ones run outside a request (CLI, job worker).
+
+``render_prometheus()`` serves ``/admin/metrics``. Each gunicorn worker
+process keeps its own numbers, and the numbers reset when the process restarts.
+"""
+import logging
+import threading
+import time
+
+from flask import g, request, has_app_context, has_request_context, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+STATEMENT_LABEL_LENGTH = 200
+
+_lock = threading.Lock()
+_endpoints = {}
+_slow_queries = 0
+_installed = False
+
+class Histogram:
+    """Cumulative Prometheus-style histogram"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+class EndpointStats:
+    def __init__(self):
+        self.wall = Histogram(DURATION_BUCKETS)
+        self.db = Histogram(DURATION_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.slowest = []  # [(seconds, observed_at, statement)], slowest first
+
+    def add_slow(self, statements, keep, window, now):
+        cutoff = now - window
+        merged = [s for s in self.slowest if s[1] >= cutoff] + [(d, now, sql) for d, sql in statements]
+        merged.sort(key=lambda s: s[0], reverse=True)
+        self.slowest = merged[:keep]
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+# ==================== HOOKS ====================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    global _slow_queries
+    starts = conn.info.get('query_start_time')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+
+    if has_request_context() and '_perf' in g:
+        perf = g._perf
+        perf['db_time'] += elapsed
+        perf['statements'] += 1
+        perf['timings'].append((elapsed, statement))
+
+    threshold = _config('SLOW_QUERY_THRESHOLD_MS', 200)
+    if threshold is not None and elapsed * 1000 >= threshold:
+        with _lock:
+            _slow_queries += 1
+        endpoint = request.endpoint if has_request_context() else None
+        logger.warning('Slow query (%.1f ms) [%s]: %s', elapsed * 1000, endpoint or '-',
+                       ' '.join(statement.split())[:1000])
+
+def _start_request():
+    g._perf = {'start': time.perf_counter(), 'db_time': 0.0, 'statements': 0, 'timings': []}
+
+def _finish_request(exc=None):
+    perf = g.pop('_perf', None)
+    if perf is None:
+        return
+    wall = time.perf_counter() - perf['start']
+    endpoint = request.endpoint or 'unmatched'
+    keep = _config('METRICS_SLOWEST_PER_ENDPOINT', 5)
+    slowest = sorted(perf['timings'], key=lambda t: t[0], reverse=True)[:keep]
+
+    with _lock:
+        stats = _endpoints.get(endpoint)
+        if stats is None:
+            stats = _endpoints[endpoint] = EndpointStats()
+        stats.wall.observe(wall)
+        stats.db.observe(perf['db_time'])
+        stats.statements.observe(perf['statements'])
+        if slowest:
+            stats.add_slow(slowest, keep, _config('METRICS_WINDOW', 900), time.time())
+
+def init_app(app):
+    """Install the SQL event listeners (once per process) and the app's request hooks"""
+    global _installed
+    if not _installed:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _installed = True
+    app.before_request(_start_request)
+    # teardown rather than after_request, so streamed responses are timed to the last chunk
+    app.teardown_request(_finish_request)
+
+def reset():
+    global _slow_queries
+    with _lock:
+        _endpoints.clear()
+        _slow_queries = 0
+
+# ==================== EXPORT ====================
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+def _histogram_lines(name, endpoint, hist, lines):
+    ep = _label(endpoint)
+    for bound, count in zip(hist.buckets, hist.counts):
+        lines.append(f'{name}_bucket{{endpoint="{ep}",le="{bound}"}} {count}')
+    lines.append(f'{name}_bucket{{endpoint="{ep}",le="+Inf"}} {hist.count}')
+    lines.append(f'{name}_sum{{endpoint="{ep}"}} {hist.sum:.6f}')
+    lines.append(f'{name}_count{{endpoint="{ep}"}} {hist.count}')
+
+def render_prometheus():
+    """All collected metrics in the Prometheus text exposition format"""
+    histograms = [
+        ('npf_request_duration_seconds', 'wall', 'Request wall time by endpoint.'),
+        ('npf_request_db_seconds', 'db', 'Time spent in SQL statements per request, by endpoint.'),
+        ('npf_request_statements', 'statements', 'SQL statements issued per request, by endpoint.'),
+    ]
+    cutoff = time.time() - _config('METRICS_WINDOW', 900)
+    lines = []
+    with _lock:
+        endpoints = sorted(_endpoints.items())
+        for name, attr, help_text in histograms:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for endpoint, stats in endpoints:
+                _histogram_lines(name, endpoint, getattr(stats, attr), lines)
+
+        lines.append('# HELP npf_slowest_statement_seconds Slowest SQL statements per endpoint in the recent window.')
+        lines.append('# TYPE npf_slowest_statement_seconds gauge')
+        for endpoint, stats in endpoints:
+            for rank, (seconds, observed_at, statement) in enumerate(s for s in stats.slowest if s[1] >= cutoff):
+                sql = _label(' '.join(statement.split())[:STATEMENT_LABEL_LENGTH])
+                lines.append(f'npf_slowest_statement_seconds{{endpoint="{_label(endpoint)}",rank="{rank + 1}",'
+                             f'statement="{sql}"}} {seconds:.6f}')
+
+        lines.append('# HELP npf_slow_queries_total Statements slower than SLOW_QUERY_THRESHOLD_MS.')
+        lines.append('# TYPE npf_slow_queries_total counter')
+        lines.append(f'npf_slow_queries_total {_slow_queries}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,430 @@
+"""
+PDF invoice rendering, caching and batch generation.
+
+Paragraph and table styles are built once per process (``_template()``).
+Rendering works from a plain ``invoice_data()`` dict rather than ORM objects,
+so it can run in a worker process. Rendered PDFs are cached on disk under
+``INVOICE_CACHE_FOLDER``. Each file is named by order id plus a hash of
+everything printed on the invoice, so an unchanged order is served from disk
+and any edit (items, totals, status, customer details) produces a new file.
+
+``merged_pdf()`` renders a batch as one document with a page break between
+invoices. ``zip_invoices()`` packs individual PDFs, rendering cache misses in
+a process pool.
+"""
+import glob
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from flask import current_app
+
+from app.models import Order, OrderItem
+
+TEMPLATE_VERSION = 1  # Bump when the layout changes so cached PDFs are re-rendered
+MIN_POOL_BATCH = 32  # Smaller batches render in-process; spawning the pool costs a few seconds
+DATA_CHUNK = 500
+
+# ==================== TEMPLATE ====================
+
+@lru_cache(maxsize=None)
+def _template():
+    """Styles shared by every invoice, built once per process"""
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
+
+    styles = getSampleStyleSheet()
+    return {
+        'normal': styles['Normal'],
+        'company_name': ParagraphStyle(
+            'CompanyName',
+            parent=styles['Heading1'],
+            fontSize=32,
+            textColor=colors.HexColor('#1a1f2e'),
+            spaceAfter=3,
+            alignment=TA_LEFT,
+            fontName='Helvetica-Bold',
+            leading=36
+        ),
+        'company_tagline': ParagraphStyle(
+            'CompanyTagline',
+            parent=styles['Normal'],
+            fontSize=11,
+            textColor=colors.HexColor('#667eea'),
+            alignment=TA_LEFT,
+            spaceAfter=5,
+            fontName='Helvetica-Oblique'
+        ),
+        'company_info': ParagraphStyle(
+            'CompanyInfo',
+            parent=styles['Normal'],
+            fontSize=9,
+            textColor=colors.HexColor('#666666'),
+            alignment=TA_LEFT,
+            spaceAfter=20
+        ),
+        'invoice_title': ParagraphStyle(
+            'InvoiceTitle',
+            parent=styles['Heading1'],
+            fontSize=36,
+            textColor=colors.HexColor('#667eea'),
+            spaceAfter=5,
+            alignment=TA_RIGHT,
+            fontName='Helvetica-Bold'
+        ),
+        'section_header': ParagraphStyle(
+            'SectionHeader',
+            parent=styles['Normal'],
+            fontSize=10,
+            textColor=colors.HexColor('#1a1f2e'),
+            spaceAfter=8,
+            fontName='Helvetica-Bold',
+            leading=12
+        ),
+        'payment_info': ParagraphStyle(
+            'PaymentInfo',
+            parent=styles['Normal'],
+            fontSize=9,
+            textColor=colors.HexColor('#555555'),
+            alignment=TA_LEFT,
+            spaceAfter=5,
+            leading=12
+        ),
+        'footer_thank_you': ParagraphStyle(
+            'FooterThankYou',
+            parent=styles['Normal'],
+            fontSize=12,
+            textColor=colors.HexColor('#667eea'),
+            alignment=TA_CENTER,
+            fontName='Helvetica-Bold',
+            spaceAfter=8
+        ),
+        'footer_contact': ParagraphStyle(
+            'FooterContact',
+            parent=styles['Normal'],
+            fontSize=9,
+            textColor=colors.HexColor('#666666'),
+            alignment=TA_CENTER,
+            spaceAfter=5
+        ),
+        'header_table': TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ]),
+        'separator_table': TableStyle([
+            ('LINEABOVE', (0, 0), (-1, 0), 3, colors.HexColor('#667eea')),
+        ]),
+        'info_table': TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('TOPPADDING', (0, 1), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
+        ]),
+        'items_table': TableStyle([
+            # Header styling
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 14),
+            ('TOPPADDING', (0, 0), (-1, 0), 14),
+
+            # Items styling
+            ('ALIGN', (0, 1), (0, -5), 'CENTER'),
+            ('ALIGN', (2, 1), (2, -5), 'CENTER'),
+            ('ALIGN', (3, 1), (-1, -5), 'RIGHT'),
+            ('FONTNAME', (0, 1), (-1, -5), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -5), 10),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -5), [colors.white, colors.HexColor('#f8f9fa')]),
+            ('GRID', (0, 0), (-1, -5), 0.5, colors.HexColor('#dee2e6')),
+            ('TOPPADDING', (0, 1), (-1, -5), 10),
+            ('BOTTOMPADDING', (0, 1), (-1, -5), 10),
+
+            # Summary section styling
+            ('ALIGN', (3, -3), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (3, -3), (-1, -2), 'Helvetica'),
+            ('FONTNAME', (3, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (3, -3), (-1, -2), 11),
+            ('FONTSIZE', (3, -1), (-1, -1), 14),
+            ('TEXTCOLOR', (3, -1), (-1, -1), colors.HexColor('#667eea')),
+            ('LINEABOVE', (3, -3), (-1, -3), 1, colors.HexColor('#dee2e6')),
+            ('LINEABOVE', (3, -1), (-1, -1), 2.5, colors.HexColor('#667eea')),
+            ('TOPPADDING', (3, -1), (-1, -1), 12),
+            ('BOTTOMPADDING', (3, -1), (-1, -1), 12),
+            ('BACKGROUND', (3, -1), (-1, -1), colors.HexColor('#f0f4ff')),
+        ]),
+        'payment_box': TableStyle([
+            ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#dee2e6')),
+            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8f9fa')),
+            ('TOPPADDING', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+            ('LEFTPADDING', (0, 0), (-1, -1), 15),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 15),
+        ]),
+    }
+
+# ==================== RENDERING ====================
+
+def invoice_data(order, items=None):
+    """Everything printed on an order's invoice, as a plain (picklable) dict"""
+    if items is None:
+        from app.loading import profile
+        items = order.items.options(*profile('order_items'))
+    customer = order.customer
+    return {
+        'id': order.id,
+        'date': order.order_date.strftime('%d %B, %Y'),
+        'status': order.status,
+        'payment_status': order.payment_status,
+        'customer': {
+            'name': customer.name,
+            'phone': customer.phone,
+            'address': customer.address,
+            'email': customer.email
+        } if customer else None,
+        'items': [[item.product.name, item.quantity, item.unit_price, item.subtotal] for item in items],
+        'total': order.total_amount
+    }
+
+def fingerprint(data):
+    """Content hash of an invoice; changes whenever anything printed on it changes"""
+    raw = json.dumps([TEMPLATE_VERSION, data], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def _elements(data):
+    """Flowables for one invoice"""
+    from reportlab.lib.units import cm
+    from reportlab.platypus import Table, Paragraph, Spacer
+
+    t = _template()
+    normal = t['normal']
+    customer = data['customer']
+
+    # Header with Company Info and Invoice Title
+    header_table = Table([
+        [
+            Paragraph("<b>NEW PINDI FURNITURE</b>", t['company_name']),
+            Paragraph("INVOICE", t['invoice_title'])
+        ],
+        [
+            Paragraph("Premium Furniture Solutions", t['company_tagline']),
+            ''
+        ],
+        [
+            Paragraph("Rawalpindi, Pakistan<br/>Phone: +92-XXX-XXXXXXX<br/>Email: info@newpindifurniture.com", t['company_info']),
+            ''
+        ]
+    ], colWidths=[10*cm, 8*cm])
+    header_table.setStyle(t['header_table'])
+
+    # Colored separator line
+    separator_table = Table([['']], colWidths=[18*cm])
+    separator_table.setStyle(t['separator_table'])
+
+    # Invoice Details and Customer Info
+    payment_color = '#28a745' if data['payment_status'] == 'Paid' else '#ffc107'
+    info_table = Table([
+        [
+            Paragraph("<b>INVOICE DETAILS</b>", t['section_header']),
+            '',
+            Paragraph("<b>BILL TO</b>", t['section_header'])
+        ],
+        [
+            Paragraph(f"<b>Invoice Number:</b> INV-{data['id']:05d}", normal),
+            '',
+            Paragraph(f"<b>{customer['name'] if customer else 'Walk-in Customer'}</b>", normal)
+        ],
+        [
+            Paragraph(f"<b>Date:</b> {data['date']}", normal),
+            '',
+            Paragraph(f"{customer['phone'] if customer else 'N/A'}", normal)
+        ],
+        [
+            Paragraph(f"<b>Status:</b> <font color='#28a745'>{data['status']}</font>", normal),
+            '',
+            Paragraph(f"{customer['address'] if customer and customer['address'] else ''}", normal)
+        ],
+        [
+            Paragraph(f"<b>Payment:</b> <font color='{payment_color}'>{data['payment_status']}</font>", normal),
+            '',
+            Paragraph(f"{customer['email'] if customer and customer['email'] else ''}", normal)
+        ],
+    ], colWidths=[6*cm, 1*cm, 11*cm])
+    info_table.setStyle(t['info_table'])
+
+    # Items Table
+    items_data = [['#', 'ITEM DESCRIPTION', 'QTY', 'UNIT PRICE', 'AMOUNT']]
+    for idx, (name, quantity, unit_price, subtotal) in enumerate(data['items'], 1):
+        items_data.append([
+            str(idx),
+            name,
+            str(quantity),
+            f'PKR {unit_price:,.0f}',
+            f'PKR {subtotal:,.0f}'
+        ])
+
+    subtotal = data['total']
+    tax = 0
+    total = subtotal + tax
+    items_data.append(['', '', '', '', ''])
+    items_data.append(['', '', '', 'Subtotal:', f'PKR {subtotal:,.0f}'])
+    items_data.append(['', '', '', 'Tax (0%):', f'PKR {tax:,.0f}'])
+    items_data.append(['', '', '', 'TOTAL:', f'PKR {total:,.0f}'])
+
+    items_table = Table(items_data, colWidths=[1*cm, 9*cm, 2*cm, 3*cm, 3*cm])
+    items_table.setStyle(t['items_table'])
+
+    # Payment Information
+    payment_box = Table([[
+        Paragraph("<b>PAYMENT INFORMATION</b>", t['section_header'])
+    ], [
+        Paragraph(
+            "Bank: Allied Bank Limited<br/>"
+            "Account Title: New Pindi Furniture<br/>"
+            "Account Number: XXXX-XXXX-XXXX-XXXX<br/>"
+            "IBAN: PK XX XXXX XXXX XXXX XXXX XXXX XXXX",
+            t['payment_info']
+        )
+    ]], colWidths=[18*cm])
+    payment_box.setStyle(t['payment_box'])
+
+    return [
+        header_table,
+        Spacer(1, 0.5*cm),
+        separator_table,
+        Spacer(1, 0.6*cm),
+        info_table,
+        Spacer(1, 0.8*cm),
+        items_table,
+        Spacer(1, 1*cm),
+        payment_box,
+        Spacer(1, 1*cm),
+        Paragraph("Thank you for your business!", t['footer_thank_you']),
+        Paragraph("For any queries, please contact us at info@newpindifurniture.com or call +92-XXX-XXXXXXX", t['footer_contact']),
+        Paragraph("This is a computer-generated invoice and does not require a signature.", t['footer_contact']),
+    ]
+
+def _build(invoices, target):
+    """Build one PDF containing the given invoice dicts, a page break between each"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, PageBreak
+
+    doc = SimpleDocTemplate(target, pagesize=A4, topMargin=0.5*cm, bottomMargin=1*cm, leftMargin=1.5*cm, rightMargin=1.5*cm)
+    elements = []
+    for data in invoices:
+        if elements:
+            elements.append(PageBreak())
+        elements.extend(_elements(data))
+    doc.build(elements)
+
+def render_invoice(data):
+    """Render a single invoice dict to PDF bytes (safe to call in a worker process)"""
+    buffer = io.BytesIO()
+    _build([data], buffer)
+    return buffer.getvalue()
+
+# ==================== CACHE ====================
+
+def _cache_folder():
+    folder = current_app.config['INVOICE_CACHE_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def _cache_path(data):
+    return os.path.join(_cache_folder(), f"invoice_{data['id']}_{fingerprint(data)[:24]}.pdf")
+
+def cached_pdf(data):
+    """Cached PDF bytes for this exact invoice content, or None"""
+    try:
+        with open(_cache_path(data), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def store_pdf(data, pdf):
+    """Write a rendered invoice to the cache and drop older renders of the same order"""
+    path = _cache_path(data)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp, path)
+    for stale in glob.glob(os.path.join(os.path.dirname(path), f"invoice_{data['id']}_*.pdf")):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+def get_invoice_pdf(order, items=None):
+    """PDF bytes for an order's invoice, from the cache when the order is unchanged"""
+    data = invoice_data(order, items)
+    pdf = cached_pdf(data)
+    if pdf is None:
+        pdf = render_invoice(data)
+        store_pdf(data, pdf)
+    return pdf
+
+# ==================== BATCHES ====================
+
+def batch_invoice_data(start=None, end=None):
+    """Invoice dicts for every order placed in [start, end), loading items with one query per chunk"""
+    from app.loading import profile
+
+    query = Order.query.options(*profile('order_list')).order_by(Order.id)
+    if start:
+        query = query.filter(Order.order_date >= start)
+    if end:
+        query = query.filter(Order.order_date < end)
+    orders = query.all()
+
+    invoices = []
+    for i in range(0, len(orders), DATA_CHUNK):
+        chunk = orders[i:i + DATA_CHUNK]
+        items = {}
+        for item in OrderItem.query.options(*profile('order_items')).filter(
+            OrderItem.order_id.in_([o.id for o in chunk])
+        ).order_by(OrderItem.id):
+            items.setdefault(item.order_id, []).append(item)
+        invoices.extend(invoice_data(o, items.get(o.id, [])) for o in chunk)
+    return invoices
+
+def render_many(invoices):
+    """PDF bytes for each invoice dict: cache hits from disk, misses rendered in a process pool"""
+    pdfs = [cached_pdf(data) for data in invoices]
+    missing = [i for i, pdf in enumerate(pdfs) if pdf is None]
+    workers = current_app.config.get('INVOICE_RENDER_WORKERS', 1)
+
+    if len(missing) < MIN_POOL_BATCH or workers <= 1:
+        rendered = [render_invoice(invoices[i]) for i in missing]
+    else:
+        # spawn rather than fork: the parent may be a threaded web worker holding DB connections
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            chunksize = max(1, len(missing) // (workers * 4))
+            rendered = list(pool.map(render_invoice, [invoices[i] for i in missing], chunksize=chunksize))
+
+    for i, pdf in zip(missing, rendered):
+        store_pdf(invoices[i], pdf)
+        pdfs[i] = pdf
+    return pdfs
+
+def merged_pdf(invoices, target):
+    """Write all invoices into one PDF document, each starting on a new page"""
+    _build(invoices, target)
+
+def zip_invoices(invoices, target):
+    """Write a ZIP archive with one cached/rendered PDF per invoice"""
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for data, pdf in zip(invoices, render_many(invoices)):
+            archive.writestr(f"invoice_{data['id']}.pdf", pdf)
@@ -0,0 +1,265 @@
+"""
+Database-backed background job queue.
+
+Jobs are rows in ``background_jobs``; no broker is needed beyond the app's own
+SQLite or PostgreSQL database. ``submit()`` enqueues a job when
+``JOB_QUEUE_ENABLED`` is set and otherwise runs it inline, so the status and
+download endpoints behave the same either way. Workers (``python worker.py``
+or ``flask jobs-worker``) claim jobs with a conditional ``UPDATE`` (plus
+``FOR UPDATE SKIP LOCKED`` on PostgreSQL), so several workers can poll the
+same table without running a job twice. Failed jobs are retried with
+exponential backoff up to ``max_attempts``.
+"""
+import json
+import os
+import socket
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app, has_request_context
+from sqlalchemy import select, update
+
+from app import db
+from app.models import BackgroundJob
+
+QUEUED, RUNNING, FINISHED, FAILED = 'Queued', 'Running', 'Finished', 'Failed'
+
+TASKS = {}
+
+def task(name):
+    """Register a function as a background task; it is called as f(job, **payload)"""
+    def decorator(f):
+        TASKS[name] = f
+        return f
+    return decorator
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+# ==================== SUBMITTING ====================
+
+def enqueue(name, created_by=None, max_attempts=3, **payload):
+    """Add a job to the queue. The caller commits, so the job is atomic with its own writes."""
+    if name not in TASKS:
+        raise ValueError(f'Unknown task: {name}')
+    job = BackgroundJob(task=name, payload=json.dumps(payload), status=QUEUED,
+                        max_attempts=max_attempts, created_by=created_by)
+    db.session.add(job)
+    db.session.flush()
+    return job
+
+def submit(name, created_by=None, **payload):
+    """Enqueue a job and commit; without a queue the job runs right away in this process"""
+    # Inline jobs get a single attempt - there is no worker to retry them
+    job = enqueue(name, created_by=created_by, max_attempts=3 if queue_enabled() else 1, **payload)
+    db.session.commit()
+    if not queue_enabled():
+        if claim(job.id):
+            run_job(db.session.get(BackgroundJob, job.id))
+    return job
+
+def queue_enabled():
+    return bool(current_app.config.get('JOB_QUEUE_ENABLED'))
+
+def result_file(job, extension):
+    """Path a task should write its downloadable output to"""
+    folder = current_app.config['JOB_RESULTS_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f'job_{job.id}_{uuid.uuid4().hex[:8]}.{extension}')
+
+def describe(job):
+    """JSON-friendly status of a job"""
+    return {
+        'id': job.id,
+        'task': job.task,
+        'status': job.status,
+        'attempts': job.attempts,
+        'result': json.loads(job.result) if job.result else None,
+        'download': bool(job.result_path) and job.status == FINISHED,
+        'error': job.error.strip().splitlines()[-1] if job.error else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+# ==================== WORKER ====================
+
+def claim(job_id, worker=None):
+    """Atomically move a Queued job to Running. Returns True if this caller won it."""
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(BackgroundJob)
+        .where(BackgroundJob.id == job_id, BackgroundJob.status == QUEUED)
+        .values(status=RUNNING, locked_by=worker or worker_id(), locked_at=now,
+                attempts=BackgroundJob.attempts + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+def claim_next(worker=None, tries=5):
+    """Claim the oldest runnable job, or return None if the queue is empty"""
+    for _ in range(tries):
+        candidate = select(BackgroundJob.id).where(
+            BackgroundJob.status == QUEUED,
+            BackgroundJob.run_after <= datetime.utcnow()
+        ).order_by(BackgroundJob.id).limit(1)
+        if db.session.get_bind().dialect.name == 'postgresql':
+            candidate = candidate.with_for_update(skip_locked=True)
+
+        job_id = db.session.execute(candidate).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+        if claim(job_id, worker):
+            return db.session.get(BackgroundJob, job_id)
+        # Another worker got there first - look again
+    return None
+
+def requeue_stale(timeout=None):
+    """Put Running jobs whose worker died (lock older than timeout seconds) back in the queue"""
+    timeout = timeout or current_app.config.get('JOB_LOCK_TIMEOUT', 900)
+    result = db.session.execute(
+        update(BackgroundJob)
+        .where(BackgroundJob.status == RUNNING,
+               BackgroundJob.locked_at < datetime.utcnow() - timedelta(seconds=timeout))
+        .values(status=QUEUED, locked_by=None, locked_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+def purge_results(days=None):
+    """Delete finished/failed jobs older than JOB_RESULT_RETENTION_DAYS and their files"""
+    days = days or current_app.config.get('JOB_RESULT_RETENTION_DAYS', 7)
+    old = BackgroundJob.query.filter(
+        BackgroundJob.status.in_([FINISHED, FAILED]),
+        BackgroundJob.finished_at < datetime.utcnow() - timedelta(days=days)
+    ).all()
+    for job in old:
+        if job.result_path and os.path.exists(job.result_path):
+            os.remove(job.result_path)
+        db.session.delete(job)
+    db.session.commit()
+    return len(old)
+
+def run_job(job):
+    """Execute a claimed job and record the outcome, scheduling a retry on failure"""
+    job_id = job.id
+    try:
+        payload = json.loads(job.payload or '{}')
+        if has_request_context():
+            outcome = TASKS[job.task](job, **payload)
+        else:
+            # Tasks build links with url_for, which needs a request context
+            with current_app.test_request_context():
+                outcome = TASKS[job.task](job, **payload)
+        job.result = json.dumps(outcome) if outcome is not None else None
+        job.status = FINISHED
+        job.error = None
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        job = db.session.get(BackgroundJob, job_id)
+        job.error = traceback.format_exc()[-4000:]
+        if job.attempts < job.max_attempts:
+            delay = current_app.config.get('JOB_RETRY_DELAY', 30) * 2 ** (job.attempts - 1)
+            job.status = QUEUED
+            job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        else:
+            job.status = FAILED
+            job.finished_at = datetime.utcnow()
+        job.locked_by = None
+        db.session.commit()
+    return job
+
+def run_worker(once=False, poll_interval=None, log=print):
+    """Poll for and run jobs until interrupted (or until the queue is empty if once=True)"""
+    poll_interval = poll_interval or current_app.config.get('JOB_POLL_INTERVAL', 2)
+    worker = worker_id()
+    log(f'Job worker {worker} started')
+    last_maintenance = None
+    while True:
+        if last_maintenance is None or time.monotonic() - last_maintenance > 60:
+            requeued = requeue_stale()
+            if requeued:
+                log(f'Requeued {requeued} stale job(s)')
+            purge_results()
+            last_maintenance = time.monotonic()
+
+        job = claim_next(worker)
+        if job is None:
+            db.session.remove()
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        job = run_job(job)
+        log(f'Job {job.id} ({job.task}): {job.status}')
+        db.session.remove()
+
+# ==================== TASKS ====================
+
+@task('export')
+def export_task(job, export, format='xlsx', columns=None, start=None, end=None):
+    from app import exports
+
+    spec = exports.EXPORTS[export]
+    selected = spec.select_columns(columns)
+    start, end = exports.parse_date_range(start, end)
+    writer = exports.get_writer(format)
+
+    path = result_file(job, writer.extension)
+    with open(path, 'wb') as f:
+        exports.write_export(spec, selected, format, f, start, end)
+
+    job.result_path = path
+    job.result_name = f'{export}_export.{writer.extension}'
+    job.result_mimetype = writer.mimetype
+
+@task('invoice')
+def invoice_task(job, order_id):
+    from app.models import Order
+    from app.invoices import get_invoice_pdf
+
+    order = db.session.get(Order, order_id)
+    if order is None:
+        raise ValueError(f'Order {order_id} not found')
+    path = result_file(job, 'pdf')
+    with open(path, 'wb') as f:
+        f.write(get_invoice_pdf(order))
+
+    job.result_path = path
+    job.result_name = f'invoice_{order_id}.pdf'
+    job.result_mimetype = 'application/pdf'
+
+@task('invoice_batch')
+def invoice_batch_task(job, format='pdf', start=None, end=None):
+    from app import exports, invoices
+
+    data = invoices.batch_invoice_data(*exports.parse_date_range(start, end))
+    format = 'zip' if format == 'zip' else 'pdf'
+    path = result_file(job, format)
+    with open(path, 'wb') as f:
+        if format == 'zip':
+            invoices.zip_invoices(data, f)
+        else:
+            invoices.merged_pdf(data, f)
+
+    job.result_path = path
+    job.result_name = f"invoices_{start or 'all'}_{end or 'all'}.{format}"
+    job.result_mimetype = 'application/zip' if format == 'zip' else 'application/pdf'
+    return {'invoices': len(data)}
+
+@task('low_stock_sweep')
+def low_stock_task(job):
+    from app.alerts import sweep
+    return sweep()
+
+@task('notify')
+def notify_task(job, message, user_id=None, type='info', link=None):
+    from app.utils import deliver_notification
+    deliver_notification(message, user_id=user_id, type=type, link=link)
@@ -0,0 +1,141 @@
+"""
+Dashboard KPI snapshot store.
+
+The dashboard reads a single ``KpiSnapshot`` row instead of running every
+aggregate on each hit. Each metric carries its own ``computed_at`` and is only
+recomputed once it is older than its staleness budget (``KPI_STALENESS`` in
+``Config``). ``flask kpi-refresh`` recomputes everything, e.g. from cron.
+"""
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import func, desc
+from sqlalchemy.exc import IntegrityError
+
+from app import db, ledger
+from app.models import KpiSnapshot, Product, Order, Customer, ProductionJob
+
+SNAPSHOT_ID = 1
+
+METRICS = {}
+
+def metric(name):
+    """Register a function that computes one dashboard metric"""
+    def decorator(f):
+        METRICS[name] = f
+        return f
+    return decorator
+
+# ==================== METRICS ====================
+
+@metric('total_sales')
+def compute_total_sales():
+    return float(db.session.query(func.sum(Order.total_amount)).filter(Order.payment_status == 'Paid').scalar() or 0)
+
+@metric('pending_orders')
+def compute_pending_orders():
+    return Order.query.filter_by(status='Pending').count()
+
+@metric('low_stock_count')
+def compute_low_stock_count():
+    return Product.query.filter(Product.stock_quantity <= Product.reorder_level).count()
+
+@metric('active_jobs')
+def compute_active_jobs():
+    return ProductionJob.query.filter(ProductionJob.status != 'Finished').count()
+
+@metric('sales_trend')
+def compute_sales_trend(days=7):
+    since = datetime.utcnow() - timedelta(days=days)
+    daily_sales = db.session.query(
+        func.date(Order.order_date).label('date'),
+        func.sum(Order.total_amount).label('total')
+    ).filter(Order.order_date >= since, Order.payment_status == 'Paid').group_by(func.date(Order.order_date)).all()
+
+    return {
+        'dates': [str(sale.date) for sale in daily_sales],
+        'amounts': [float(sale.total) for sale in daily_sales]
+    }
+
+@metric('profit_analysis')
+def compute_profit_analysis():
+    # Stored as JSON, so amounts become floats like the other metrics
+    return [{k: float(v) if isinstance(v, Decimal) else v for k, v in row.items()}
+            for row in ledger.profit_analysis()]
+
+@metric('inventory_value')
+def compute_inventory_value():
+    return float(db.session.query(func.sum(Product.cost_price * Product.stock_quantity)).scalar() or 0)
+
+@metric('top_customers')
+def compute_top_customers(limit=5):
+    rows = db.session.query(
+        Customer.name,
+        Customer.email,
+        Customer.phone,
+        func.count(Order.id).label('orders_count'),
+        func.sum(Order.total_amount).label('total_spent')
+    ).join(Order).filter(
+        Order.payment_status == 'Paid'
+    ).group_by(Customer.id, Customer.name, Customer.email, Customer.phone).order_by(desc('total_spent')).limit(limit).all()
+
+    return [{
+        'name': r.name,
+        'email': r.email,
+        'phone': r.phone,
+        'orders_count': r.orders_count,
+        'total_spent': float(r.total_spent or 0)
+    } for r in rows]
+
+# ==================== SNAPSHOT ====================
+
+def staleness_budget(name):
+    """Seconds a metric may be served from the snapshot before it is recomputed"""
+    budgets = current_app.config.get('KPI_STALENESS', {})
+    return budgets.get(name, current_app.config.get('KPI_DEFAULT_STALENESS', 120))
+
+def _is_stale(entry, budget, now):
+    if not entry:
+        return True
+    computed_at = datetime.fromisoformat(entry['computed_at'])
+    return (now - computed_at).total_seconds() > budget
+
+def refresh_kpis(names=None, snapshot=None):
+    """
+    Recompute the given metrics (all of them if names is None) and store them
+    in the snapshot row. Returns the full metrics dict.
+    """
+    names = list(METRICS) if names is None else names
+    if snapshot is None:
+        snapshot = db.session.get(KpiSnapshot, SNAPSHOT_ID)
+
+    data = json.loads(snapshot.metrics) if snapshot else {}
+    now = datetime.utcnow()
+    for name in names:
+        data[name] = {'value': METRICS[name](), 'computed_at': now.isoformat()}
+
+    try:
+        if snapshot is None:
+            snapshot = KpiSnapshot(id=SNAPSHOT_ID)
+            db.session.add(snapshot)
+        snapshot.metrics = json.dumps(data)
+        snapshot.updated_at = now
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created the row first - our values are still good to serve
+        db.session.rollback()
+    return data
+
+def get_dashboard_kpis():
+    """Read the snapshot row, refreshing only the metrics past their staleness budget"""
+    snapshot = db.session.get(KpiSnapshot, SNAPSHOT_ID)
+    data = json.loads(snapshot.metrics) if snapshot else {}
+
+    now = datetime.utcnow()
+    stale = [name for name in METRICS if _is_stale(data.get(name), staleness_budget(name), now)]
+    if stale:
+        data = refresh_kpis(stale, snapshot)
+
+    return {name: data[name]['value'] for name in METRICS}
@@ -0,0 +1,198 @@
+"""
+Incremental profit-analysis ledger.
+
+``ProductSalesRollup`` keeps units sold, revenue and cost basis per product for
+Paid orders. Order-entry routes call into this module inside their own
+transaction, so the rollup commits (or rolls back) together with the change
+that caused it. ``flask profit-ledger verify`` compares it with a full
+recomputation and ``flask profit-ledger rebuild`` regenerates it. Amounts are
+whole paisa (``app/money.py``), so the two must match exactly.
+"""
+from sqlalchemy import func, update, insert, delete, select, case, exists, literal
+
+from app import db
+from app.money import amount, paisa, paisa_array, from_paisa
+from app.models import Product, Order, OrderItem, ProductSalesRollup
+
+PAID = 'Paid'
+
+def _bump(product_id, units, revenue):
+    """Add units/revenue to a product's rollup row, creating it if needed"""
+    cost_price = select(Product.cost_price).where(Product.id == product_id).scalar_subquery()
+    result = db.session.execute(
+        update(ProductSalesRollup)
+        .where(ProductSalesRollup.product_id == product_id)
+        .values(
+            units_sold=ProductSalesRollup.units_sold + units,
+            revenue=ProductSalesRollup.revenue + revenue,
+            cost_basis=ProductSalesRollup.cost_basis + units * func.coalesce(cost_price, 0)
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        return
+
+    cost = db.session.query(Product.cost_price).filter_by(id=product_id).scalar() or 0
+    db.session.execute(insert(ProductSalesRollup).values(
+        product_id=product_id,
+        units_sold=units,
+        revenue=revenue,
+        cost_basis=units * cost
+    ))
+
+def record_item(item, sign=1):
+    """Apply a single order line to the ledger (sign=-1 to reverse it)"""
+    _bump(item.product_id, sign * item.quantity, sign * item.subtotal)
+
+def record_order(order, sign=1):
+    """Apply (or reverse) every line of an order: one grouped query, one insert and one update"""
+    lines = db.session.query(
+        OrderItem.product_id,
+        func.sum(OrderItem.quantity).label('units'),
+        func.sum(OrderItem.subtotal).label('revenue')
+    ).filter(OrderItem.order_id == order.id).group_by(OrderItem.product_id).all()
+
+    if not lines:
+        return
+    product_ids = [line.product_id for line in lines]
+
+    # Products sold for the first time get an empty row, then one UPDATE applies every line
+    db.session.execute(insert(ProductSalesRollup).from_select(
+        ['product_id', 'units_sold', 'revenue', 'cost_basis'],
+        select(Product.id, literal(0), literal(0), literal(0)).where(
+            Product.id.in_(product_ids),
+            ~exists().where(ProductSalesRollup.product_id == Product.id)
+        )
+    ))
+    units = case({line.product_id: sign * line.units for line in lines}, value=ProductSalesRollup.product_id)
+    revenue = case({line.product_id: amount(sign * (line.revenue or 0)) for line in lines},
+                   value=ProductSalesRollup.product_id)
+    cost_price = select(Product.cost_price).where(Product.id == ProductSalesRollup.product_id).scalar_subquery()
+    db.session.execute(
+        update(ProductSalesRollup)
+        .where(ProductSalesRollup.product_id.in_(product_ids))
+        .values(
+            units_sold=ProductSalesRollup.units_sold + units,
+            revenue=ProductSalesRollup.revenue + revenue,
+            cost_basis=ProductSalesRollup.cost_basis + units * func.coalesce(cost_price, 0)
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def on_payment_status_change(order, old_status):
+    """Move an order's lines in or out of the ledger when it becomes (un)paid"""
+    if old_status != PAID and order.payment_status == PAID:
+        record_order(order, 1)
+    elif old_status == PAID and order.payment_status != PAID:
+        record_order(order, -1)
+
+def on_cost_price_change(product):
+    """Re-base the cost basis when a product's cost price is edited"""
+    db.session.execute(
+        update(ProductSalesRollup)
+        .where(ProductSalesRollup.product_id == product.id)
+        .values(cost_basis=ProductSalesRollup.units_sold * amount(product.cost_price))
+        .execution_options(synchronize_session=False)
+    )
+
+def on_cost_prices_change(product_ids):
+    """Re-base the cost basis of several products at once, from their stored cost prices"""
+    cost_price = select(Product.cost_price).where(Product.id == ProductSalesRollup.product_id).scalar_subquery()
+    db.session.execute(
+        update(ProductSalesRollup)
+        .where(ProductSalesRollup.product_id.in_(product_ids))
+        .values(cost_basis=ProductSalesRollup.units_sold * cost_price)
+        .execution_options(synchronize_session=False)
+    )
+
+def forget_product(product_id):
+    """Drop a product's rollup row before the product itself is deleted"""
+    db.session.execute(
+        delete(ProductSalesRollup)
+        .where(ProductSalesRollup.product_id == product_id)
+        .execution_options(synchronize_session=False)
+    )
+
+def profit_analysis():
+    """Per-product profit rows for the dashboard and reports, read from the ledger"""
+    rows = db.session.query(
+        Product.name,
+        Product.selling_price,
+        Product.cost_price,
+        ProductSalesRollup.units_sold,
+        paisa(ProductSalesRollup.revenue).label('revenue'),
+        paisa(ProductSalesRollup.cost_basis).label('cost_basis')
+    ).join(ProductSalesRollup, ProductSalesRollup.product_id == Product.id).filter(
+        ProductSalesRollup.units_sold != 0
+    ).all()
+    if not rows:
+        return []
+
+    # Whole-column int64 arithmetic: profit is exact, margins come out in one pass
+    import numpy as np
+    revenue = paisa_array(p.revenue for p in rows)
+    total_cost = paisa_array(p.cost_basis for p in rows)
+    profit = revenue - total_cost
+    margin = np.divide(profit * 100.0, revenue, out=np.zeros(len(rows)), where=revenue > 0)
+
+    return [{
+        'name': p.name,
+        'selling_price': p.selling_price,
+        'cost_price': p.cost_price,
+        'profit_per_unit': p.selling_price - p.cost_price,
+        'units_sold': p.units_sold,
+        'revenue': from_paisa(revenue[i]),
+        'total_cost': from_paisa(total_cost[i]),
+        'profit': from_paisa(profit[i]),
+        'margin': float(margin[i])
+    } for i, p in enumerate(rows)]
+
+# ==================== REBUILD / VERIFY ====================
+
+def _full_recomputation():
+    """The original O(order_items) aggregation, used as the source of truth"""
+    return select(
+        OrderItem.product_id,
+        func.sum(OrderItem.quantity).label('units_sold'),
+        func.sum(OrderItem.subtotal).label('revenue'),
+        func.sum(OrderItem.quantity * Product.cost_price).label('cost_basis')
+    ).join(Product, Product.id == OrderItem.product_id).join(Order, Order.id == OrderItem.order_id).where(
+        Order.payment_status == PAID
+    ).group_by(OrderItem.product_id)
+
+def rebuild_profit_ledger(conn=None):
+    """
+    Replace the ledger with a full recomputation. Returns the number of rows written.
+    With conn (a migration step) it runs on that connection and leaves the commit to the caller.
+    """
+    target = db.session if conn is None else conn
+    target.execute(delete(ProductSalesRollup))
+    rows = [{
+        'product_id': r.product_id,
+        'units_sold': r.units_sold or 0,
+        'revenue': r.revenue or 0,
+        'cost_basis': r.cost_basis or 0
+    } for r in target.execute(_full_recomputation())]
+    if rows:
+        target.execute(insert(ProductSalesRollup), rows)
+    if conn is None:
+        db.session.commit()
+    return len(rows)
+
+def verify_profit_ledger(tolerance=0):
+    """
+    Compare the ledger against a full recomputation.
+    Returns a list of (product_id, field, ledger_value, expected_value) mismatches.
+    """
+    expected = {r.product_id: r for r in db.session.execute(_full_recomputation())}
+    actual = {r.product_id: r for r in ProductSalesRollup.query.all()}
+
+    mismatches = []
+    for product_id in set(expected) | set(actual):
+        exp, act = expected.get(product_id), actual.get(product_id)
+        for field in ('units_sold', 'revenue', 'cost_basis'):
+            exp_value = (getattr(exp, field) or 0) if exp else 0
+            act_value = (getattr(act, field) or 0) if act else 0
+            if abs(exp_value - act_value) > tolerance:
+                mismatches.append((product_id, field, act_value, exp_value))
+    return mismatches
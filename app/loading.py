@@ -0,0 +1,28 @@
+"""
+Named eager-loading profiles for read paths.
+
+Templates and exports dereference relationships per row (``order.customer``,
+``item.product``, ``product.category``), which lazy-loads one query per row.
+Each profile builds the loader options that fetch those relationships up
+front (lazily, because backref attributes only exist once mappers are
+configured). Apply them with ``query.options(*profile('order_list'))``.
+``scripts/check_query_budgets.py`` guards the resulting statement counts.
+"""
+from sqlalchemy.orm import joinedload
+
+from app.models import Order, OrderItem, Product, Payment
+
+PROFILES = {
+    # Orders shown with their customer (orders list, order page, dashboard, exports, search)
+    'order_list': lambda: (joinedload(Order.customer),),
+    # Order lines that show product name/SKU (order page, PDF invoice)
+    'order_items': lambda: (joinedload(OrderItem.product),),
+    # Product rows that show the category name (inventory list, low stock, exports)
+    'product_list': lambda: (joinedload(Product.category),),
+    # Payment history with the recording user
+    'payment_list': lambda: (joinedload(Payment.user),),
+}
+
+def profile(name):
+    """Loader options for a named read path"""
+    return PROFILES[name]()
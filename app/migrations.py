@@ -0,0 +1,231 @@
+"""
+Versioned schema migrations.
+
+``MIGRATIONS`` is an ordered list of numbered steps. ``upgrade()`` runs the
+steps not yet recorded in ``schema_version`` and records each one as it
+finishes. Every step is idempotent (``CREATE ... IF NOT EXISTS``, creating
+only missing tables), so a step that was interrupted can simply run again.
+Index steps are written against the index names declared in
+``app/models.py``. On PostgreSQL they use ``CREATE INDEX CONCURRENTLY``
+outside a transaction, so building an index does not block writes to a busy
+table. On SQLite every step runs in one transaction.
+
+Step 4 converts the amount columns from FLOAT rupees to BIGINT paisa (see
+``app/money.py``). PostgreSQL changes the column type; SQLite cannot alter a
+column, so it rewrites the values in place and keeps the declared type.
+
+Step 5 turns ``audit_logs`` into a table partitioned by month on PostgreSQL
+(see ``app/audit_archive.py``); on SQLite it changes nothing.
+
+Step 6 fills the profit ledger (``app/ledger.py``) from the orders already
+in the database, which step 1 only created an empty table for. Step 7 does
+the same for the stock movement ledger (``app/stock.py``), recording each
+product's current stock as its opening balance.
+
+Add a schema change by declaring it on the model and appending a new step;
+never edit a step that has shipped. Run ``flask db-upgrade`` on deploy, and
+``flask db-explain`` to check that the hot list and join queries use their
+indexes.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, insert, text, inspect, Integer
+from sqlalchemy.schema import CreateIndex
+
+from app import db
+from app.database import without_statement_timeout
+from app.models import (SchemaVersion, Order, OrderItem, Transaction, Payment, ProductionJob,
+                        AuditLog, Notification)
+
+# ==================== HELPERS ====================
+
+def _index(name):
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(f'No index named {name} is declared in app/models.py')
+
+def create_indexes(conn, *names):
+    """Create the named model indexes if they do not exist yet"""
+    postgres = conn.dialect.name == 'postgresql'
+    for name in names:
+        sql = str(CreateIndex(_index(name), if_not_exists=True).compile(dialect=conn.dialect))
+        if postgres:
+            # An interrupted CONCURRENTLY build leaves an invalid index behind; rebuild it
+            invalid = conn.execute(text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ), {'name': name}).first()
+            if invalid:
+                drop_index(conn, name)
+            sql = sql.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1).replace(
+                'CREATE UNIQUE INDEX', 'CREATE UNIQUE INDEX CONCURRENTLY', 1)
+        conn.exec_driver_sql(sql)
+
+def drop_index(conn, name):
+    concurrently = 'CONCURRENTLY ' if conn.dialect.name == 'postgresql' else ''
+    conn.exec_driver_sql(f'DROP INDEX {concurrently}IF EXISTS {name}')
+
+# ==================== MIGRATIONS ====================
+
+def _tables_since_1_0(conn):
+    # Creates only missing tables (with their indexes); existing tables are left alone
+    db.metadata.create_all(conn)
+
+def _search_and_pagination_indexes(conn):
+    create_indexes(
+        conn,
+        'ix_products_name_lower', 'ix_customers_name_lower', 'ix_suppliers_name_lower',
+        'ix_notifications_user_read_time', 'ix_notifications_user_time_id',
+        'ix_orders_date_id', 'ix_orders_status_date_id',
+        'ix_transactions_date_id', 'ix_transactions_type_date_id',
+        'ix_audit_logs_timestamp_id', 'ix_customers_created_id',
+    )
+    # Superseded by ix_audit_logs_timestamp_id
+    drop_index(conn, 'ix_audit_logs_timestamp')
+
+def _hot_column_indexes(conn):
+    create_indexes(
+        conn,
+        'ix_orders_customer_date', 'ix_orders_payment_date',
+        'ix_order_items_order_id', 'ix_order_items_product_id',
+        'ix_transactions_related_order_id', 'ix_payments_order_date',
+        'ix_production_jobs_status_due', 'ix_order_history_order_id',
+    )
+
+# Every amount column as of version 4
+MONEY_COLUMNS = [
+    ('products', 'cost_price'), ('products', 'selling_price'),
+    ('orders', 'total_amount'), ('order_items', 'unit_price'), ('order_items', 'subtotal'),
+    ('transactions', 'amount'), ('payments', 'amount'),
+    ('product_sales_rollups', 'revenue'), ('product_sales_rollups', 'cost_basis'),
+]
+
+def _money_to_paisa(conn):
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    for table, column in MONEY_COLUMNS:
+        if table not in tables:
+            continue
+        declared = {c['name']: c['type'] for c in inspector.get_columns(table)}[column]
+        if isinstance(declared, Integer):
+            continue  # Created by step 1 with the money type already
+        if conn.dialect.name == 'postgresql':
+            conn.exec_driver_sql(
+                f'ALTER TABLE {table} ALTER COLUMN {column} TYPE BIGINT USING ROUND({column} * 100)::BIGINT')
+        else:
+            conn.exec_driver_sql(
+                f'UPDATE {table} SET {column} = CAST(ROUND({column} * 100) AS INTEGER) WHERE {column} IS NOT NULL')
+
+def _partition_audit_log(conn):
+    if conn.dialect.name != 'postgresql':
+        return  # SQLite keeps one audit table; archiving deletes by timestamp range
+    from app import audit_archive
+    if not audit_archive.is_partitioned(conn):
+        audit_archive.partition_audit_logs(conn)
+
+def _fill_profit_ledger(conn):
+    # product_sales_rollups starts empty on a database that predates it; fill it from the order history
+    from app import ledger
+    ledger.rebuild_profit_ledger(conn)
+
+def _open_stock_ledger(conn):
+    # Products that predate stock_movements get an opening balance matching their stock
+    from app import stock
+    stock.reconcile(conn)
+
+# (version, description, step, transactional); steps that are not transactional
+# run in autocommit mode on PostgreSQL so they can build indexes concurrently
+MIGRATIONS = [
+    (1, 'Create tables added since 1.0.0', _tables_since_1_0, True),
+    (2, 'Typeahead, notification and keyset pagination indexes', _search_and_pagination_indexes, False),
+    (3, 'Indexes on hot filter, join and sort columns', _hot_column_indexes, False),
+    (4, 'Store amounts as whole paisa', _money_to_paisa, True),
+    (5, 'Partition the audit log by month', _partition_audit_log, True),
+    (6, 'Fill the profit ledger from existing orders', _fill_profit_ledger, True),
+    (7, 'Record opening stock balances in the movement ledger', _open_stock_ledger, True),
+]
+
+def applied_versions():
+    SchemaVersion.__table__.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        return set(conn.execute(select(SchemaVersion.version)).scalars())
+
+def pending():
+    applied = applied_versions()
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+def _record(conn, version, description):
+    if conn.execute(select(SchemaVersion.version).where(SchemaVersion.version == version)).first():
+        return  # Recorded by a concurrent upgrade
+    conn.execute(insert(SchemaVersion).values(version=version, description=description, applied_at=datetime.utcnow()))
+
+def upgrade(log=None):
+    """Apply every pending migration in order. Returns the versions applied."""
+    db.session.remove()  # DDL must not wait on this session's open transaction
+    done = []
+    for version, description, step, transactional in pending():
+        if log:
+            log(f'Applying {version}: {description}')
+        if transactional or db.engine.dialect.name != 'postgresql':
+            with db.engine.begin() as conn, without_statement_timeout(conn):
+                step(conn)
+                _record(conn, version, description)
+        else:
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn, \
+                    without_statement_timeout(conn):
+                step(conn)
+            with db.engine.begin() as conn:
+                _record(conn, version, description)
+        done.append(version)
+    return done
+
+# ==================== PLAN CHECK ====================
+
+# (description, query, index the plan should use)
+HOT_QUERIES = [
+    ('Orders list filtered by status', lambda: select(Order.id).where(Order.status == 'Pending')
+        .order_by(Order.order_date.desc(), Order.id.desc()).limit(10), 'ix_orders_status_date_id'),
+    ('Orders list', lambda: select(Order.id)
+        .order_by(Order.order_date.desc(), Order.id.desc()).limit(10), 'ix_orders_date_id'),
+    ("A customer's orders", lambda: select(Order.id).where(Order.customer_id == 1)
+        .order_by(Order.order_date.desc()), 'ix_orders_customer_date'),
+    ('Paid orders for revenue reports', lambda: select(Order.order_date, Order.total_amount)
+        .where(Order.payment_status == 'Paid', Order.order_date >= '2000-01-01'), 'ix_orders_payment_date'),
+    ("An order's items", lambda: select(OrderItem.id).where(OrderItem.order_id == 1), 'ix_order_items_order_id'),
+    ("A product's order lines", lambda: select(OrderItem.id).where(OrderItem.product_id == 1),
+        'ix_order_items_product_id'),
+    ("An order's transactions", lambda: select(Transaction.id).where(Transaction.related_order_id == 1),
+        'ix_transactions_related_order_id'),
+    ('Finance list filtered by type', lambda: select(Transaction.id).where(Transaction.type == 'Expense')
+        .order_by(Transaction.date.desc(), Transaction.id.desc()).limit(15), 'ix_transactions_type_date_id'),
+    ("An order's payments", lambda: select(Payment.id).where(Payment.order_id == 1)
+        .order_by(Payment.payment_date.desc()), 'ix_payments_order_date'),
+    ('Production jobs by status', lambda: select(ProductionJob.id).where(ProductionJob.status == 'Queued')
+        .order_by(ProductionJob.due_date), 'ix_production_jobs_status_due'),
+    ('Audit log', lambda: select(AuditLog.id)
+        .order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(50), 'ix_audit_logs_timestamp_id'),
+    ("A user's notifications", lambda: select(Notification.id).where(Notification.user_id == 1)
+        .order_by(Notification.timestamp.desc(), Notification.id.desc()).limit(20), 'ix_notifications_user_time_id'),
+]
+
+def explain(conn, stmt):
+    """The query plan of stmt as one string"""
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    if conn.dialect.name == 'sqlite':
+        return '\n'.join(row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql))
+    return '\n'.join(row[0] for row in conn.exec_driver_sql('EXPLAIN ' + sql))
+
+def check_query_plans():
+    """[(description, expected index, used, plan)] for every hot query"""
+    results = []
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Small tables make sequential scans cheapest; ask whether the index is usable at all
+            conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        for description, query, index in HOT_QUERIES:
+            plan = explain(conn, query())
+            results.append((description, index, index in plan, plan))
+        conn.rollback()
+    return results
@@ -2,10 +2,12 @@ from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, login_manager
+from app.money import Money
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # The notification counter rides along so the notification bar needs no extra query
+    return db.session.get(User, int(user_id), options=[db.joinedload(User.notification_counter)])
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -15,6 +17,9 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256))
     role = db.Column(db.String(20), default='Staff') # Admin, Staff, Workshop
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Declared here, not as a backref, so load_user can eager-load it before the mappers are configured
+    notification_counter = db.relationship('NotificationCounter', uselist=False, back_populates='user')
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -32,6 +37,11 @@ class Customer(db.Model):
     loyalty_points = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     orders = db.relationship('Order', backref='customer', lazy='dynamic')
+    
+    __table_args__ = (
+        db.Index('ix_customers_name_lower', db.func.lower(name)),  # Typeahead prefix lookups
+        db.Index('ix_customers_created_id', 'created_at', 'id'),  # Keyset pagination
+    )
 
 class Supplier(db.Model):
     __tablename__ = 'suppliers'
@@ -43,6 +53,8 @@ class Supplier(db.Model):
     address = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     products = db.relationship('Product', backref='supplier', lazy='dynamic')
+    
+    __table_args__ = (db.Index('ix_suppliers_name_lower', db.func.lower(name)),)  # Typeahead prefix lookups
 
 class Category(db.Model):
     __tablename__ = 'categories'
@@ -58,13 +70,15 @@ class Product(db.Model):
     name = db.Column(db.String(100), nullable=False)
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'))
     description = db.Column(db.Text)
-    cost_price = db.Column(db.Float, default=0.0)
-    selling_price = db.Column(db.Float, default=0.0)
+    cost_price = db.Column(Money, default=0)
+    selling_price = db.Column(Money, default=0)
     stock_quantity = db.Column(db.Integer, default=0)
     reorder_level = db.Column(db.Integer, default=5)
     supplier_id = db.Column(db.Integer, db.ForeignKey('suppliers.id'))
     image_url = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_products_name_lower', db.func.lower(name)),)  # Typeahead prefix lookups
 
 class Order(db.Model):
     __tablename__ = 'orders'
@@ -72,21 +86,28 @@ class Order(db.Model):
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'))
     order_date = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='Pending') # Pending, Processing, Shipped, Delivered, Cancelled
-    total_amount = db.Column(db.Float, default=0.0)
+    total_amount = db.Column(Money, default=0)
     payment_status = db.Column(db.String(20), default='Unpaid') # Unpaid, Paid, Partial
     payment_method = db.Column(db.String(50))
     items = db.relationship('OrderItem', backref='order', lazy='dynamic', cascade='all, delete-orphan')
     transactions = db.relationship('Transaction', backref='related_order', lazy='dynamic', cascade='all, delete-orphan')
     production_jobs = db.relationship('ProductionJob', backref='order_ref', lazy='dynamic', cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_orders_date_id', 'order_date', 'id'),  # Keyset pagination
+        db.Index('ix_orders_status_date_id', 'status', 'order_date', 'id'),  # Status filter + pagination
+        db.Index('ix_orders_customer_date', 'customer_id', 'order_date'),  # Customer order history
+        db.Index('ix_orders_payment_date', 'payment_status', 'order_date'),  # Paid revenue reports
+    )
 
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'))
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'))
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), index=True)
     quantity = db.Column(db.Integer, default=1)
-    unit_price = db.Column(db.Float)
-    subtotal = db.Column(db.Float)
+    unit_price = db.Column(Money)
+    subtotal = db.Column(Money)
     
     product = db.relationship('Product')
 
@@ -100,16 +121,24 @@ class ProductionJob(db.Model):
     due_date = db.Column(db.DateTime)
     status = db.Column(db.String(20), default='Queued') # Queued, Cutting, Assembling, Polishing, Finished
     assigned_worker = db.Column(db.String(100))
+    
+    __table_args__ = (db.Index('ix_production_jobs_status_due', 'status', 'due_date'),)
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(10), nullable=False) # Income, Expense
     category = db.Column(db.String(50)) # Rent, Utilities, Sales, etc.
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     description = db.Column(db.String(200))
-    related_order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=True)
+    related_order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=True, index=True)
+    
+    # Keyset pagination, unfiltered and by type
+    __table_args__ = (
+        db.Index('ix_transactions_date_id', 'date', 'id'),
+        db.Index('ix_transactions_type_date_id', 'type', 'date', 'id'),
+    )
 
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
@@ -121,9 +150,11 @@ class AuditLog(db.Model):
     entity_id = db.Column(db.Integer)  # ID of the affected entity
     details = db.Column(db.Text)  # JSON or text details of the action
     ip_address = db.Column(db.String(45))  # IPv4 or IPv6
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User', backref='audit_logs')
+    
+    __table_args__ = (db.Index('ix_audit_logs_timestamp_id', 'timestamp', 'id'),)  # Keyset pagination
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
@@ -136,12 +167,32 @@ class Notification(db.Model):
     link = db.Column(db.String(200)) # Optional link to related resource (e.g. /orders/5)
     
     user = db.relationship('User', backref='notifications')
+    
+    __table_args__ = (
+        db.Index('ix_notifications_user_read_time', 'user_id', 'is_read', 'timestamp'),
+        db.Index('ix_notifications_user_time_id', 'user_id', 'timestamp', 'id'),  # Keyset pagination
+    )
+
+class NotificationCounter(db.Model):
+    __tablename__ = 'notification_counters'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    unread_count = db.Column(db.Integer, default=0, nullable=False)  # Unread notifications addressed to this user
+    broadcasts_read = db.Column(db.Integer, default=0, nullable=False)  # Broadcast notifications this user has read
+    version = db.Column(db.Integer, default=0, nullable=False)  # Bumped on every change; keys the recent-list cache
+    
+    user = db.relationship('User', back_populates='notification_counter')
+
+class NotificationRead(db.Model):
+    __tablename__ = 'notification_reads'  # Per-user read markers for broadcast notifications
+    notification_id = db.Column(db.Integer, db.ForeignKey('notifications.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    read_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Payment(db.Model):
     __tablename__ = 'payments'
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     payment_method = db.Column(db.String(50))  # Cash, Bank Transfer, Card, etc.
     payment_date = db.Column(db.DateTime, default=datetime.utcnow)
     notes = db.Column(db.Text)
@@ -149,11 +200,13 @@ class Payment(db.Model):
     
     order = db.relationship('Order', backref='payments')
     user = db.relationship('User', backref='payments_recorded')
+    
+    __table_args__ = (db.Index('ix_payments_order_date', 'order_id', 'payment_date'),)
 
 class OrderHistory(db.Model):
     __tablename__ = 'order_history'
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
     action = db.Column(db.String(100), nullable=False)  # e.g., "Status changed to Processing"
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     username = db.Column(db.String(64))
@@ -162,3 +215,78 @@ class OrderHistory(db.Model):
     
     order = db.relationship('Order', backref='history')
     user = db.relationship('User', backref='order_actions')
+
+class KpiSnapshot(db.Model):
+    __tablename__ = 'kpi_snapshots'
+    id = db.Column(db.Integer, primary_key=True)
+    metrics = db.Column(db.Text, nullable=False, default='{}')  # JSON: {metric: {"value": ..., "computed_at": iso}}
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ProductSalesRollup(db.Model):
+    __tablename__ = 'product_sales_rollups'
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    units_sold = db.Column(db.Integer, nullable=False, default=0)  # Paid orders only
+    revenue = db.Column(Money, nullable=False, default=0)
+    cost_basis = db.Column(Money, nullable=False, default=0)  # units_sold * current cost_price
+    
+    product = db.relationship('Product')
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+    name = db.Column(db.String(50), primary_key=True)  # e.g. "customers", "products"
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class BackgroundJob(db.Model):
+    __tablename__ = 'background_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    task = db.Column(db.String(50), nullable=False)  # e.g. "export", "invoice", "low_stock_sweep"
+    payload = db.Column(db.Text)  # JSON keyword arguments for the task
+    status = db.Column(db.String(20), default='Queued')  # Queued, Running, Finished, Failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))  # worker "host:pid" while Running
+    locked_at = db.Column(db.DateTime)
+    result = db.Column(db.Text)  # JSON summary returned by the task
+    result_path = db.Column(db.String(300))  # Downloadable file produced by the task
+    result_name = db.Column(db.String(200))
+    result_mimetype = db.Column(db.String(100))
+    error = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (db.Index('ix_background_jobs_status_run_after', 'status', 'run_after'),)
+
+class LowStockAlert(db.Model):
+    __tablename__ = 'low_stock_alerts'
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    alert_date = db.Column(db.Date, nullable=False)  # At most one alert per product per day
+    stock_quantity = db.Column(db.Integer)  # Stock when the alert was raised
+    reorder_level = db.Column(db.Integer)
+    notified_at = db.Column(db.DateTime)  # Set once admins have been notified
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    product = db.relationship('Product')
+    
+    __table_args__ = (db.UniqueConstraint('product_id', 'alert_date', name='uq_low_stock_alerts_product_date'),)
+
+class StockMovement(db.Model):
+    __tablename__ = 'stock_movements'  # Append-only; stock_quantity always equals the sum of a product's movements
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)  # Signed change: negative takes stock, positive returns it
+    reason = db.Column(db.String(30), nullable=False)  # initial, order_item, order_item_removed, order_deleted, adjustment, opening_balance
+    balance_after = db.Column(db.Integer)
+    order_id = db.Column(db.Integer, nullable=True)  # Not a foreign key: movements outlive deleted orders
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_stock_movements_product_created', 'product_id', 'created_at'),)
+
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'  # One row per applied migration (app/migrations.py)
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200))
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,83 @@
+"""
+Money stored as whole paisa.
+
+``Money`` is the column type of every amount in the schema. The database holds
+a BIGINT count of paisa; Python sees a ``Decimal`` of rupees with two places.
+Floats from forms and spreadsheets are rounded to the nearest paisa when they
+are bound, so ``order.total_amount += item.subtotal`` cannot drift and
+``SUM()`` over a money column is an exact integer sum. Arithmetic that keeps
+the unit (``price * quantity``, ``revenue - cost``, ``SUM(amount)``) stays
+``Money``, so those results come back as rupees too.
+
+For Python-side aggregation over many rows, select ``paisa(column)`` to get
+the raw integers and feed them to ``paisa_array()``.
+"""
+import operator
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlalchemy import BigInteger, Integer, Numeric, literal, type_coerce
+from sqlalchemy.types import TypeDecorator
+
+CENT = Decimal('0.01')
+
+def to_decimal(value):
+    """An amount (float, int, str or Decimal) as rupees rounded to the paisa"""
+    if value is None:
+        return None
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value).replace(',', '').strip())
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+def to_paisa(value):
+    if value is None:
+        return None
+    return int(to_decimal(value).scaleb(2))
+
+def from_paisa(value):
+    if value is None:
+        return None
+    # int() as well: SQLite hands back REAL for columns migrated from FLOAT
+    return Decimal(int(value)).scaleb(-2)
+
+class Money(TypeDecorator):
+    impl = BigInteger
+    cache_ok = True
+
+    class Comparator(TypeDecorator.Comparator):
+        def _adapt_expression(self, op, other_comparator):
+            other = other_comparator.type
+            if isinstance(other, Money):
+                if op in (operator.add, operator.sub):
+                    return op, self.type
+                if op is operator.truediv:
+                    return op, Numeric()  # A ratio, not an amount
+            elif op in (operator.mul, operator.truediv) and other._type_affinity is Integer:
+                return op, self.type
+            return super()._adapt_expression(op, other_comparator)
+
+    comparator_factory = Comparator
+
+    def coerce_compared_value(self, op, value):
+        # Quantities multiply money; everything else compared or added to it is money
+        if op in (operator.mul, operator.truediv):
+            return Integer() if isinstance(value, int) else Numeric()
+        return self
+
+    def process_bind_param(self, value, dialect):
+        return to_paisa(value)
+
+    def process_result_value(self, value, dialect):
+        return from_paisa(value)
+
+def amount(value):
+    """A bound money value, for expressions that do not infer the type from a column"""
+    return literal(to_decimal(value or 0), Money())
+
+def paisa(expression):
+    """Select a money expression as raw integer paisa"""
+    return type_coerce(expression, BigInteger)
+
+def paisa_array(values):
+    """An int64 NumPy array of paisa; sums and differences over it stay exact"""
+    import numpy as np
+    return np.fromiter((int(v or 0) for v in values), dtype=np.int64)
@@ -0,0 +1,110 @@
+"""
+Keyset (cursor) pagination for the long, newest-first list views.
+
+``paginate()`` seeks past the last row shown with
+``WHERE (sort, id) < (:sort, :id)`` instead of ``OFFSET``. Every page is then
+a range scan on a composite ``(sort column, id)`` index, however deep it is.
+Cursors are opaque (``encode_cursor``): ``after`` moves to older rows and
+``before`` moves to newer ones. Instead of a ``COUNT(*)`` over the whole
+filtered set, the total is optional and approximate: rows are counted up to
+``COUNT_CAP``, and anything beyond that shows as "1,000+". Rows whose sort
+column is NULL are never reached, so the sort columns all have defaults.
+"""
+from datetime import date, datetime
+
+from flask import request, abort
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.orm import Query
+
+from app import db
+from app.utils import encode_cursor, decode_cursor
+
+COUNT_CAP = 1000
+
+class KeysetPage:
+    def __init__(self, items, per_page, next_cursor, prev_cursor, total=None, total_exact=True):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor  # older rows
+        self.prev_cursor = prev_cursor  # newer rows
+        self.total = total
+        self.total_exact = total_exact
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def total_label(self):
+        if self.total is None:
+            return ''
+        return f'{self.total:,}' if self.total_exact else f'{self.total:,}+'
+
+def decode_position(cursor, sort_column):
+    """(sort value, id) from a cursor; raises ValueError if it is malformed"""
+    values = decode_cursor(cursor)
+    if len(values) != 2 or not isinstance(values[1], int):
+        raise ValueError('Invalid cursor')
+    value, row_id = values
+    python_type = sort_column.type.python_type
+    if python_type is datetime:
+        value = datetime.fromisoformat(value)
+    elif python_type is date:
+        value = date.fromisoformat(value)
+    return value, row_id
+
+def _fetch(query):
+    if isinstance(query, Query):
+        return query.all()
+    return db.session.scalars(query).all()
+
+def approximate_count(query, cap=COUNT_CAP):
+    """(count, exact): counts matching rows, but stops after cap"""
+    stmt = query.statement if isinstance(query, Query) else query
+    limited = stmt.order_by(None).limit(cap + 1).subquery()
+    count = db.session.execute(select(func.count()).select_from(limited)).scalar()
+    return (cap, False) if count > cap else (count, True)
+
+def paginate(query, sort_column, id_column, per_page=20, after=None, before=None, count=False):
+    """
+    One page of query (an ORM Query or a Select of entities), newest first.
+    Raises ValueError for a malformed cursor.
+    """
+    total, exact = approximate_count(query) if count else (None, True)
+    query = query.order_by(None)
+    key = tuple_(sort_column, id_column)
+
+    if before:
+        query = query.filter(key > tuple_(*decode_position(before, sort_column)))
+        rows = _fetch(query.order_by(sort_column.asc(), id_column.asc()).limit(per_page + 1))
+        more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_prev, has_next = more, True
+    else:
+        if after:
+            query = query.filter(key < tuple_(*decode_position(after, sort_column)))
+        rows = _fetch(query.order_by(sort_column.desc(), id_column.desc()).limit(per_page + 1))
+        items = rows[:per_page]
+        has_prev, has_next = bool(after), len(rows) > per_page
+
+    def cursor(item):
+        return encode_cursor(getattr(item, sort_column.key), getattr(item, id_column.key))
+
+    return KeysetPage(
+        items, per_page,
+        next_cursor=cursor(items[-1]) if has_next and items else None,
+        prev_cursor=cursor(items[0]) if has_prev and items else None,
+        total=total, total_exact=exact
+    )
+
+def paginate_request(query, sort_column, id_column, per_page=20, count=False):
+    """paginate() with the after/before cursor taken from the query string; 400 on a bad cursor"""
+    try:
+        return paginate(query, sort_column, id_column, per_page,
+                        after=request.args.get('after'), before=request.args.get('before'), count=count)
+    except ValueError:
+        abort(400)
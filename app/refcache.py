@@ -0,0 +1,67 @@
+"""
+Process-wide reference-data cache for form dropdowns.
+
+Choices are cached per worker as lightweight ``(id, label)`` tuples. Each list
+has a version counter in the ``cache_versions`` table; write routes call
+``invalidate()`` before committing, so every gunicorn worker sees the bump on
+its next read and reloads. A form render costs one small version lookup
+instead of hydrating every row as an ORM object.
+"""
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import CacheVersion, Category, Supplier, Product
+
+SOURCES = {
+    'categories': lambda: db.session.query(Category.id, Category.name).order_by(Category.id),
+    'suppliers': lambda: db.session.query(Supplier.id, Supplier.name).order_by(Supplier.id),
+    'products': lambda: db.session.query(Product.id, Product.name).order_by(Product.id),
+}
+
+_cache = {}  # name -> (version, choices)
+
+def _versions(names):
+    rows = db.session.query(CacheVersion.name, CacheVersion.version).filter(CacheVersion.name.in_(names)).all()
+    versions = dict.fromkeys(names, 0)
+    versions.update(dict(rows))
+    return versions
+
+def get_choices(name):
+    """Return the cached [(id, label), ...] list for a reference table"""
+    return get_many(name)[0]
+
+def get_many(*names):
+    """Return choice lists for several reference tables with a single version lookup"""
+    versions = _versions(names)
+    result = []
+    for name in names:
+        cached = _cache.get(name)
+        if cached is None or cached[0] != versions[name]:
+            cached = (versions[name], [(row[0], row[1]) for row in SOURCES[name]()])
+            _cache[name] = cached
+        result.append(list(cached[1]))
+    return result
+
+def invalidate(*names):
+    """Bump the version of the given lists in the current transaction"""
+    for name in names:
+        result = db.session.execute(
+            update(CacheVersion)
+            .where(CacheVersion.name == name)
+            .values(version=CacheVersion.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.add(CacheVersion(name=name, version=1))
+        except IntegrityError:
+            # Created concurrently by another worker - bump that row instead
+            db.session.execute(
+                update(CacheVersion)
+                .where(CacheVersion.name == name)
+                .values(version=CacheVersion.version + 1)
+                .execution_options(synchronize_session=False)
+            )
@@ -0,0 +1,125 @@
+"""
+Read-replica routing for the heavy read-only pages.
+
+When ``DATABASE_REPLICA_URL`` is set it becomes the ``replica`` bind
+(``SQLALCHEMY_BINDS``). Views decorated with ``@read_only`` (dashboard,
+reports, exports, audit log) send their session queries there; every other
+view, the CLI and the job worker use the primary as before.
+
+Writes always go to the primary: ``RoutingSession`` sends flushes,
+``INSERT``/``UPDATE``/``DELETE`` statements and ``SELECT ... FOR UPDATE`` to
+the primary, and after the first write the rest of the request stays there
+so it reads its own writes (the dashboard storing a refreshed KPI snapshot,
+an export submitting a job).
+
+A replica is used only when it answers and is less than
+``REPLICA_MAX_LAG_SECONDS`` behind. The check runs at most every
+``REPLICA_CHECK_INTERVAL`` seconds per process, in one request thread; in
+between, and while that check runs, requests use its cached result. The
+replica bind connects with a ``REPLICA_CONNECT_TIMEOUT``, so an unreachable
+replica fails its check quickly. A replica that is missing, unreachable or
+lagging sends ``@read_only`` views to the primary until a later check finds
+it healthy.
+"""
+import logging
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+
+logger = logging.getLogger(__name__)
+
+BIND = 'replica'
+
+_lock = threading.Lock()
+_status = {'checked_at': None, 'healthy': False, 'checking': False}
+
+# ==================== HEALTH ====================
+
+def _lag_seconds(conn):
+    """Replication lag of a PostgreSQL standby; 0 for a primary or any other database"""
+    if conn.dialect.name != 'postgresql':
+        return 0
+    return conn.exec_driver_sql(
+        "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    ).scalar()
+
+def check(engine):
+    """Whether the replica answers and is within the lag budget"""
+    from sqlalchemy import select
+    from app.models import SchemaVersion
+    try:
+        with engine.connect() as conn:
+            # A missing or empty replica has no schema_version table
+            conn.execute(select(SchemaVersion.version).limit(1)).all()
+            lag = _lag_seconds(conn)
+    except Exception as e:
+        logger.warning('Read replica unavailable, using the primary: %s', getattr(e, 'orig', e))
+        return False
+    if lag > current_app.config.get('REPLICA_MAX_LAG_SECONDS', 10):
+        logger.warning('Read replica is %.1fs behind, using the primary', lag)
+        return False
+    return True
+
+def replica_engine():
+    from app import db
+    return db.engines.get(BIND)
+
+def available():
+    """
+    The cached health of the replica bind, re-checked every REPLICA_CHECK_INTERVAL seconds.
+    One thread runs the check, outside the lock; the others keep using the cached result meanwhile.
+    """
+    engine = replica_engine()
+    if engine is None:
+        return False
+    interval = current_app.config.get('REPLICA_CHECK_INTERVAL', 5)
+    with _lock:
+        now = time.monotonic()
+        due = _status['checked_at'] is None or now - _status['checked_at'] >= interval
+        if not due or _status['checking']:
+            return _status['healthy']
+        _status['checking'] = True
+    healthy = False
+    try:
+        healthy = check(engine)
+    finally:
+        with _lock:
+            _status['healthy'] = healthy
+            _status['checked_at'] = time.monotonic()
+            _status['checking'] = False
+    return healthy
+
+def reset():
+    with _lock:
+        _status['checked_at'] = None
+
+# ==================== ROUTING ====================
+
+def read_only(view):
+    """Run a view's session queries on the read replica when one is healthy"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = available()
+        return view(*args, **kwargs)
+    return wrapper
+
+def _is_write(clause):
+    return clause is not None and (getattr(clause, 'is_dml', False)
+                                   or getattr(clause, '_for_update_arg', None) is not None)
+
+class RoutingSession(Session):
+    """db.session: reads of @read_only views go to the replica bind, everything else to the primary"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get('use_replica'):
+            if self._flushing or _is_write(clause):
+                g.use_replica = False  # Read this request's own writes from the primary
+            else:
+                engine = self._db.engines.get(BIND)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -1,16 +1,23 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, send_file
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, send_file, abort, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
-from sqlalchemy import func, desc, or_
+from sqlalchemy import func, desc, or_, and_, insert
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 import os
 import io
 import csv
+import tempfile
 
 from app import db
-from app.models import User, Product, Supplier, Customer, Order, OrderItem, Category, ProductionJob, Transaction, Payment, OrderHistory, Notification
+from app.models import User, Product, Supplier, Customer, Order, OrderItem, Category, ProductionJob, Transaction, Payment, OrderHistory, Notification, BackgroundJob
 from app.forms import LoginForm, ProductForm, SupplierForm, CustomerForm, OrderForm, ProductionJobForm, TransactionForm, RegistrationForm
-from app.utils import role_required, log_action, send_notification, get_low_stock_items, generate_pdf_invoice, export_to_excel
+from app.utils import role_required, log_action, send_notification, get_low_stock_items, generate_pdf_invoice, encode_cursor, decode_cursor
+from app.kpi import get_dashboard_kpis
+from app import ledger, refcache, exports, jobs, invoices, inbox, stock, money, search as fts
+from app.loading import profile
+from app.pagination import paginate_request
+from app.replica import read_only
 
 main_bp = Blueprint('main', __name__)
 
@@ -60,32 +67,29 @@ def logout():
 @main_bp.context_processor
 def inject_notifications():
     if current_user.is_authenticated:
-        from app.models import Notification
-        unread_count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
-        notifications = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.timestamp.desc()).limit(5).all()
+        unread_count, notifications = inbox.notification_bar(current_user)
         return dict(unread_notif_count=unread_count, recent_notifications=notifications)
     return dict(unread_notif_count=0, recent_notifications=[])
 
 @main_bp.route('/notifications')
 @login_required
 def notifications():
-    from app.models import Notification
-    page = request.args.get('page', 1, type=int)
-    notifications = Notification.query.filter_by(user_id=current_user.id)\
-        .order_by(Notification.timestamp.desc())\
-        .paginate(page=page, per_page=20, error_out=False)
+    notifications = paginate_request(inbox.visible(current_user), Notification.timestamp, Notification.id, per_page=20)
+    notifications.items = inbox.as_dicts(current_user, notifications.items)
     
     return render_template('notifications.html', notifications=notifications)
 
 @main_bp.route('/notifications/mark-read/<int:id>')
 @login_required
 def mark_notification_read(id):
-    from app.models import Notification
     notif = Notification.query.get_or_404(id)
-    if notif.user_id != current_user.id:
+    if notif.user_id is None:
+        if current_user.role != 'Admin':
+            abort(403)
+    elif notif.user_id != current_user.id:
         abort(403)
     
-    notif.is_read = True
+    inbox.mark_read(notif, current_user)
     db.session.commit()
     
     if notif.link:
@@ -95,8 +99,7 @@ def mark_notification_read(id):
 @main_bp.route('/notifications/mark-all-read')
 @login_required
 def mark_all_notifications_read():
-    from app.models import Notification
-    Notification.query.filter_by(user_id=current_user.id, is_read=False).update({'is_read': True})
+    inbox.mark_all_read(current_user)
     db.session.commit()
     flash('All notifications marked as read.', 'success')
     return redirect(url_for('main.notifications'))
@@ -105,59 +108,16 @@ def mark_all_notifications_read():
 
 @main_bp.route('/')
 @login_required
+@read_only
 def index():
-    # Basic KPIs
-    total_sales = db.session.query(func.sum(Order.total_amount)).filter(Order.payment_status == 'Paid').scalar() or 0
-    pending_orders = Order.query.filter_by(status='Pending').count()
-    low_stock_count = Product.query.filter(Product.stock_quantity <= Product.reorder_level).count()
-    active_jobs = ProductionJob.query.filter(ProductionJob.status != 'Finished').count()
+    # Aggregate KPIs come from the snapshot store, refreshed per staleness budget
+    kpis = get_dashboard_kpis()
+    
     active_jobs_list = ProductionJob.query.filter(ProductionJob.status != 'Finished').order_by(ProductionJob.due_date).limit(5).all()
+    recent_orders = Order.query.options(*profile('order_list')).order_by(Order.order_date.desc()).limit(5).all()
+    low_stock_items = get_low_stock_items(limit=5)
     
-    recent_orders = Order.query.order_by(Order.order_date.desc()).limit(5).all()
-    low_stock_items = get_low_stock_items()[:5]
-    
-    # Sales trend data (last 7 days)
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    daily_sales = db.session.query(
-        func.date(Order.order_date).label('date'),
-        func.sum(Order.total_amount).label('total')
-    ).filter(Order.order_date >= seven_days_ago, Order.payment_status == 'Paid').group_by(func.date(Order.order_date)).all()
-    
-    sales_dates = [str(sale.date) for sale in daily_sales]
-    sales_amounts = [float(sale.total) for sale in daily_sales]
-    
-    # Profit Analysis
-    products_query = db.session.query(
-        Product.name,
-        Product.selling_price,
-        Product.cost_price,
-        (Product.selling_price - Product.cost_price).label('profit_per_unit'),
-        func.sum(OrderItem.quantity).label('units_sold'),
-        func.sum(OrderItem.subtotal).label('revenue'),
-        func.sum(OrderItem.quantity * Product.cost_price).label('total_cost')
-    ).join(OrderItem).join(Order).filter(
-        Order.payment_status == 'Paid'
-    ).group_by(Product.id, Product.name, Product.selling_price, Product.cost_price).all()
-    
-    # Process products to add calculated fields
-    products_with_profit = []
-    for p in products_query:
-        revenue = p.revenue or 0
-        total_cost = p.total_cost or 0
-        profit = revenue - total_cost
-        margin = (profit / revenue * 100) if revenue > 0 else 0
-        
-        products_with_profit.append({
-            'name': p.name,
-            'selling_price': p.selling_price,
-            'cost_price': p.cost_price,
-            'profit_per_unit': p.profit_per_unit,
-            'units_sold': p.units_sold,
-            'revenue': revenue,
-            'total_cost': total_cost,
-            'profit': profit,
-            'margin': margin
-        })
+    products_with_profit = kpis['profit_analysis']
     
     # Calculate total profit
     total_revenue = sum([p['revenue'] for p in products_with_profit])
@@ -165,42 +125,26 @@ def index():
     total_profit = total_revenue - total_cost
     profit_margin = (total_profit/total_revenue*100 if total_revenue > 0 else 0)
     
-    # Inventory valuation
-    inventory_value = db.session.query(
-        func.sum(Product.cost_price * Product.stock_quantity)
-    ).scalar() or 0
-    
-    # Top customers by revenue
-    top_customers = db.session.query(
-        Customer.name,
-        Customer.email,
-        Customer.phone,
-        func.count(Order.id).label('orders_count'),
-        func.sum(Order.total_amount).label('total_spent')
-    ).join(Order).filter(
-        Order.payment_status == 'Paid'
-    ).group_by(Customer.id, Customer.name, Customer.email, Customer.phone).order_by(desc('total_spent')).limit(5).all()
-    
     # Top products for chart
     top_products_chart = sorted(products_with_profit, key=lambda x: x['revenue'] or 0, reverse=True)[:5]
     
     return render_template('dashboard.html', title='Dashboard', 
-                           total_sales=total_sales, 
-                           pending_orders=pending_orders, 
-                           low_stock_count=low_stock_count,
-                           active_jobs=active_jobs,
+                           total_sales=kpis['total_sales'], 
+                           pending_orders=kpis['pending_orders'], 
+                           low_stock_count=kpis['low_stock_count'],
+                           active_jobs=kpis['active_jobs'],
                            active_jobs_list=active_jobs_list,
                            recent_orders=recent_orders,
                            low_stock_items=low_stock_items,
-                           sales_dates=sales_dates,
-                           sales_amounts=sales_amounts,
+                           sales_dates=kpis['sales_trend']['dates'],
+                           sales_amounts=kpis['sales_trend']['amounts'],
                            products_with_profit=products_with_profit,
                            total_revenue=total_revenue,
                            total_cost=total_cost,
                            total_profit=total_profit,
                            profit_margin=profit_margin,
-                           inventory_value=inventory_value,
-                           top_customers=top_customers,
+                           inventory_value=kpis['inventory_value'],
+                           top_customers=kpis['top_customers'],
                            top_products_chart=top_products_chart)
 
 # ==================== INVENTORY ====================
@@ -212,13 +156,10 @@ def inventory():
     search = request.args.get('search', '')
     category_filter = request.args.get('category', '')
     
-    query = Product.query
+    query = Product.query.options(*profile('product_list'))
     
     if search:
-        query = query.filter(
-            (Product.name.contains(search)) | 
-            (Product.sku.contains(search))
-        )
+        query = query.filter(fts.filter_clause(Product, search, [Product.name, Product.sku]))
     
     if category_filter:
         query = query.filter_by(category_id=category_filter)
@@ -227,21 +168,20 @@ def inventory():
         page=page, per_page=10, error_out=False
     )
     
-    categories = Category.query.all()
-    all_product_names = [p.name for p in Product.query.with_entities(Product.name).all()]
+    categories = refcache.get_choices('categories')
     
     return render_template('inventory/list.html', products=products, 
                           categories=categories, search=search, 
-                          category_filter=category_filter,
-                          all_product_names=all_product_names)
+                          category_filter=category_filter)
 
 @main_bp.route('/inventory/add', methods=['GET', 'POST'])
 @login_required
 @role_required('Admin', 'Staff')
 def add_product():
     form = ProductForm()
-    form.category_id.choices = [(0, 'Select Category')] + [(c.id, c.name) for c in Category.query.all()]
-    form.supplier_id.choices = [(0, 'Select Supplier')] + [(s.id, s.name) for s in Supplier.query.all()]
+    categories, suppliers = refcache.get_many('categories', 'suppliers')
+    form.category_id.choices = [(0, 'Select Category')] + categories
+    form.supplier_id.choices = [(0, 'Select Supplier')] + suppliers
     
     if form.validate_on_submit():
         # Check for duplicate SKU
@@ -273,6 +213,8 @@ def add_product():
             image_url=image_filename
         )
         db.session.add(product)
+        stock.record_initial(product)
+        refcache.invalidate('products')
         db.session.commit()
         
         send_notification(
@@ -284,9 +226,7 @@ def add_product():
         flash(f'Product "{product.name}" added successfully!', 'success')
         return redirect(url_for('main.inventory'))
     
-    all_product_names = [p.name for p in Product.query.with_entities(Product.name).all()]
-    
-    return render_template('inventory/form.html', form=form, title='Add Product', action='add', all_product_names=all_product_names)
+    return render_template('inventory/form.html', form=form, title='Add Product', action='add')
 
 @main_bp.route('/inventory/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -295,10 +235,23 @@ def edit_product(id):
     product = Product.query.get_or_404(id)
     form = ProductForm(obj=product)
     
-    form.category_id.choices = [(0, 'Select Category')] + [(c.id, c.name) for c in Category.query.all()]
-    form.supplier_id.choices = [(0, 'Select Supplier')] + [(s.id, s.name) for s in Supplier.query.all()]
+    categories, suppliers = refcache.get_many('categories', 'suppliers')
+    form.category_id.choices = [(0, 'Select Category')] + categories
+    form.supplier_id.choices = [(0, 'Select Supplier')] + suppliers
+    
+    if request.method == 'GET':
+        form.stock_seen.data = product.stock_quantity
     
     if form.validate_on_submit():
+        # Apply the edit as a change relative to what the user saw, so orders taken meanwhile are kept
+        seen = form.stock_seen.data if form.stock_seen.data is not None else product.stock_quantity
+        try:
+            stock.adjust(product.id, form.stock_quantity.data - seen)
+        except stock.InsufficientStock as e:
+            db.session.rollback()
+            flash(f'Cannot reduce stock of {product.name} by {e.requested}: only {e.available} in stock.', 'danger')
+            return redirect(url_for('main.edit_product', id=product.id))
+        
         if form.image.data:
             file = form.image.data
             filename = secure_filename(file.filename)
@@ -307,23 +260,25 @@ def edit_product(id):
             file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
             product.image_url = filename
 
+        old_cost_price = product.cost_price
         product.sku = form.sku.data
         product.name = form.name.data
         product.category_id = form.category_id.data if form.category_id.data != 0 else None
         product.description = form.description.data
         product.cost_price = form.cost_price.data or 0
         product.selling_price = form.selling_price.data
-        product.stock_quantity = form.stock_quantity.data
         product.reorder_level = form.reorder_level.data
         product.supplier_id = form.supplier_id.data if form.supplier_id.data != 0 else None
         
+        if product.cost_price != old_cost_price:
+            ledger.on_cost_price_change(product)
+        refcache.invalidate('products')
+        
         db.session.commit()
         flash(f'Product "{product.name}" updated successfully!', 'success')
         return redirect(url_for('main.inventory'))
     
-    all_product_names = [p.name for p in Product.query.with_entities(Product.name).all()]
-    
-    return render_template('inventory/form.html', form=form, title='Edit Product', action='edit', product=product, all_product_names=all_product_names)
+    return render_template('inventory/form.html', form=form, title='Edit Product', action='edit', product=product)
 
 @main_bp.route('/inventory/delete/<int:id>', methods=['POST'])
 @login_required
@@ -332,6 +287,8 @@ def delete_product(id):
     product = Product.query.get_or_404(id)
     name = product.name
     try:
+        ledger.forget_product(product.id)
+        refcache.invalidate('products')
         db.session.delete(product)
         db.session.commit()
         flash(f'Product "{name}" deleted successfully!', 'warning')
@@ -345,17 +302,14 @@ def delete_product(id):
 @main_bp.route('/orders')
 @login_required
 def orders():
-    page = request.args.get('page', 1, type=int)
     status_filter = request.args.get('status', '')
     
-    query = Order.query
+    query = Order.query.options(*profile('order_list'))
     
     if status_filter:
         query = query.filter_by(status=status_filter)
     
-    orders = query.order_by(Order.order_date.desc()).paginate(
-        page=page, per_page=10, error_out=False
-    )
+    orders = paginate_request(query, Order.order_date, Order.id, per_page=10, count=True)
     
     return render_template('orders/list.html', orders=orders, status_filter=status_filter)
 
@@ -364,9 +318,12 @@ def orders():
 @role_required('Admin', 'Staff')
 def create_order():
     form = OrderForm()
-    form.customer_id.choices = [(c.id, c.name) for c in Customer.query.all()]
     
     if form.validate_on_submit():
+        if db.session.get(Customer, form.customer_id.data) is None:
+            flash('Please pick a customer from the list.', 'danger')
+            return render_template('orders/form.html', form=form, title='Create Order', action='create')
+        
         order = Order(
             customer_id=form.customer_id.data,
             status=form.status.data,
@@ -401,9 +358,9 @@ def create_order():
 @main_bp.route('/orders/<int:id>')
 @login_required
 def view_order(id):
-    order = Order.query.get_or_404(id)
-    products = Product.query.filter(Product.stock_quantity > 0).all()
-    return render_template('orders/view.html', order=order, products=products)
+    order = Order.query.options(*profile('order_list')).get_or_404(id)
+    items = order.items.options(*profile('order_items')).all()
+    return render_template('orders/view.html', order=order, items=items)
 
 @main_bp.route('/orders/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -411,9 +368,12 @@ def view_order(id):
 def edit_order(id):
     order = Order.query.get_or_404(id)
     form = OrderForm(obj=order)
-    form.customer_id.choices = [(c.id, c.name) for c in Customer.query.all()]
     
     if form.validate_on_submit():
+        if db.session.get(Customer, form.customer_id.data) is None:
+            flash('Please pick a customer from the list.', 'danger')
+            return render_template('orders/form.html', form=form, title='Edit Order', action='edit', order=order)
+        
         old_payment_status = order.payment_status
         order.customer_id = form.customer_id.data
         order.status = form.status.data
@@ -430,6 +390,8 @@ def edit_order(id):
             )
             db.session.add(txn)
         
+        ledger.on_payment_status_change(order, old_payment_status)
+        
         db.session.commit()
         flash(f'Order #{order.id} updated successfully!', 'success')
         return redirect(url_for('main.view_order', id=order.id))
@@ -443,11 +405,17 @@ def add_order_item(id):
     order = Order.query.get_or_404(id)
     product_id = request.form.get('product_id')
     quantity = int(request.form.get('quantity', 1))
+    if quantity < 1:
+        flash('Quantity must be at least 1.', 'danger')
+        return redirect(url_for('main.view_order', id=id))
     
     product = Product.query.get(product_id)
     if product:
-        if product.stock_quantity < quantity:
-            flash(f'Insufficient stock for {product.name}. Available: {product.stock_quantity}', 'danger')
+        try:
+            stock.reserve(product.id, quantity, order_id=order.id)
+        except stock.InsufficientStock as e:
+            db.session.rollback()
+            flash(f'Insufficient stock for {product.name}. Available: {e.available}', 'danger')
         else:
             item = OrderItem(
                 order_id=order.id,
@@ -459,7 +427,6 @@ def add_order_item(id):
             db.session.add(item)
             
             order.total_amount += item.subtotal
-            product.stock_quantity -= quantity
             
             if order.customer:
                 points_earned = int(item.subtotal / 100)
@@ -480,6 +447,8 @@ def add_order_item(id):
                     db.session.add(txn)
                 else:
                     existing_txn.amount = order.total_amount
+                
+                ledger.record_item(item)
             
             db.session.commit()
             flash(f'{product.name} added to order.', 'success')
@@ -493,8 +462,7 @@ def remove_order_item(order_id, item_id):
     item = OrderItem.query.get_or_404(item_id)
     order = item.order
     
-    product = item.product
-    product.stock_quantity += item.quantity
+    stock.release(item.product_id, item.quantity, order.id)
     
     order.total_amount -= item.subtotal
     
@@ -504,6 +472,8 @@ def remove_order_item(order_id, item_id):
             existing_txn.amount = order.total_amount - item.subtotal
             if existing_txn.amount <= 0:
                 db.session.delete(existing_txn)
+        
+        ledger.record_item(item, -1)
     
     db.session.delete(item)
     db.session.commit()
@@ -515,6 +485,10 @@ def remove_order_item(order_id, item_id):
 @login_required
 def download_invoice(id):
     order = Order.query.get_or_404(id)
+    if request.args.get('background'):
+        job = jobs.submit('invoice', created_by=current_user.id, order_id=order.id)
+        return jsonify(jobs.describe(job)), 202
+    
     pdf_buffer = generate_pdf_invoice(order)
     
     return send_file(
@@ -530,34 +504,173 @@ def download_invoice(id):
 def delete_order(id):
     order = Order.query.get_or_404(id)
     
-    for item in order.items:
-        item.product.stock_quantity += item.quantity
+    stock.release_order(order)
+    
+    if order.payment_status == 'Paid':
+        ledger.record_order(order, -1)
     
     db.session.delete(order)
     db.session.commit()
     flash(f'Order #{id} deleted successfully!', 'warning')
     return redirect(url_for('main.orders'))
 
+BULK_ORDER_MAX_LINES = 200
+
+def _bulk_order_error(message, status=400, **extra):
+    return jsonify({'error': message, **extra}), status
+
+def _is_json_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+@main_bp.route('/api/orders/bulk', methods=['POST'])
+@login_required
+@role_required('Admin', 'Staff')
+def create_order_bulk():
+    """
+    Create an order and all its lines from one JSON request, in one transaction:
+    {"customer_id": 1, "payment_status": "Paid", "items": [{"product_id": 3, "quantity": 2}, ...]}
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return _bulk_order_error('Expected a JSON object.')
+    
+    lines = data.get('items')
+    if not isinstance(lines, list) or not lines:
+        return _bulk_order_error('items must be a non-empty list.')
+    if len(lines) > BULK_ORDER_MAX_LINES:
+        return _bulk_order_error(f'At most {BULK_ORDER_MAX_LINES} items per order.')
+    # JSON integers only: 1.7, "2" and true are rejected rather than cast
+    if not all(isinstance(line, dict) and _is_json_int(line.get('product_id')) and _is_json_int(line.get('quantity'))
+               for line in lines):
+        return _bulk_order_error('Each item needs an integer product_id and quantity.')
+    lines = [(line['product_id'], line['quantity']) for line in lines]
+    if any(quantity < 1 for _, quantity in lines):
+        return _bulk_order_error('Quantities must be at least 1.')
+    
+    # Same field rules as the order form, fed from the JSON body
+    fields = ('customer_id', 'status', 'payment_status', 'payment_method')
+    form = OrderForm(formdata=None, data={f: data[f] for f in fields if f in data}, meta={'csrf': False})
+    if not form.validate():
+        return _bulk_order_error('Invalid order fields.', fields=form.errors)
+    customer = db.session.get(Customer, form.customer_id.data)
+    if customer is None:
+        return _bulk_order_error('Unknown customer.')
+    
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    
+    # One IN query for every product on the order
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(list(quantities)))}
+    unknown = sorted(set(quantities) - set(products))
+    if unknown:
+        return _bulk_order_error('Unknown products.', product_ids=unknown)
+    shortages = [{'product_id': pid, 'name': products[pid].name, 'requested': qty, 'available': products[pid].stock_quantity}
+                 for pid, qty in quantities.items() if products[pid].stock_quantity < qty]
+    if shortages:
+        return _bulk_order_error('Insufficient stock.', 409, shortages=shortages)
+    
+    order = Order(
+        customer_id=customer.id,
+        status=form.status.data,
+        payment_status=form.payment_status.data,
+        payment_method=form.payment_method.data
+    )
+    db.session.add(order)
+    db.session.flush()
+    
+    try:
+        stock.reserve_many(quantities, order_id=order.id)
+    except stock.InsufficientStock as e:
+        # Taken by a concurrent order since the check above
+        db.session.rollback()
+        return _bulk_order_error('Insufficient stock.', 409, shortages=[{
+            'product_id': e.product_id, 'name': products[e.product_id].name,
+            'requested': e.requested, 'available': e.available
+        }])
+    
+    rows = [{
+        'order_id': order.id,
+        'product_id': product_id,
+        'quantity': quantity,
+        'unit_price': products[product_id].selling_price,
+        'subtotal': products[product_id].selling_price * quantity
+    } for product_id, quantity in lines]
+    db.session.execute(insert(OrderItem), rows)
+    
+    # Loyalty points accrue per line, as when items are added one at a time
+    order.total_amount = sum(row['subtotal'] for row in rows)
+    points_earned = sum(int(row['subtotal'] / 100) for row in rows)
+    customer.loyalty_points = (customer.loyalty_points or 0) + points_earned
+    
+    if order.payment_status == 'Paid':
+        db.session.add(Transaction(
+            type='Income',
+            category='Sales',
+            amount=order.total_amount,
+            description=f'Order #{order.id} - {customer.name}',
+            related_order_id=order.id
+        ))
+        ledger.record_order(order)
+    
+    db.session.commit()
+    
+    send_notification(
+        message=f"New Order #{order.id} created by {current_user.username} (Total: PKR {order.total_amount:,.0f})",
+        type='info',
+        link=url_for('main.view_order', id=order.id)
+    )
+    
+    return jsonify({
+        'order_id': order.id,
+        'total_amount': float(order.total_amount),
+        'items': len(rows),
+        'loyalty_points_earned': points_earned,
+        'url': url_for('main.view_order', id=order.id)
+    }), 201
+
+# ==================== IMPORT ====================
+
+@main_bp.route('/import/<entity>', methods=['POST'])
+@login_required
+@role_required('Admin')
+def import_data(entity):
+    """Bulk-import an uploaded CSV/XLSX file; ?dry_run=1 only validates, ?update=1 updates existing rows"""
+    from app.imports import IMPORTS, run_import
+    if entity not in IMPORTS:
+        abort(404)
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': 'Attach a .csv or .xlsx file as "file".'}), 400
+    
+    try:
+        result = run_import(entity, upload.stream, upload.filename,
+                            dry_run=bool(request.values.get('dry_run')), update=bool(request.values.get('update')))
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    if not result.dry_run and (result.inserted or result.updated):
+        log_action(
+            action=f'Bulk import of {entity}: {upload.filename}',
+            entity_type=IMPORTS[entity].model.__name__,
+            details=f'{result.inserted} added, {result.updated} updated, {result.rejected} rejected'
+        )
+    return jsonify(result.as_dict(max_errors=500))
+
 # ==================== CUSTOMERS ====================
 
 @main_bp.route('/customers')
 @login_required
 def customers():
-    page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
     
     query = Customer.query
     
     if search:
-        query = query.filter(
-            (Customer.name.contains(search)) | 
-            (Customer.phone.contains(search)) |
-            (Customer.email.contains(search))
-        )
+        query = query.filter(fts.filter_clause(Customer, search, [Customer.name, Customer.phone, Customer.email]))
     
-    customers = query.order_by(Customer.created_at.desc()).paginate(
-        page=page, per_page=10, error_out=False
-    )
+    customers = paginate_request(query, Customer.created_at, Customer.id, per_page=10, count=True)
     
     return render_template('customers/list.html', customers=customers, search=search)
 
@@ -652,6 +765,7 @@ def add_supplier():
             address=form.address.data
         )
         db.session.add(supplier)
+        refcache.invalidate('suppliers')
         db.session.commit()
         flash(f'Supplier "{supplier.name}" added successfully!', 'success')
         return redirect(url_for('main.suppliers'))
@@ -671,6 +785,7 @@ def edit_supplier(id):
         supplier.phone = form.phone.data
         supplier.email = form.email.data
         supplier.address = form.address.data
+        refcache.invalidate('suppliers')
         
         db.session.commit()
         flash(f'Supplier "{supplier.name}" updated successfully!', 'success')
@@ -685,6 +800,7 @@ def delete_supplier(id):
     supplier = Supplier.query.get_or_404(id)
     name = supplier.name
     db.session.delete(supplier)
+    refcache.invalidate('suppliers')
     db.session.commit()
     flash(f'Supplier "{name}" deleted successfully!', 'warning')
     return redirect(url_for('main.suppliers'))
@@ -710,7 +826,7 @@ def production():
 @role_required('Admin', 'Staff')
 def add_job():
     form = ProductionJobForm()
-    form.product_id.choices = [(p.id, p.name) for p in Product.query.all()]
+    form.product_id.choices = refcache.get_choices('products')
     
     if form.validate_on_submit():
         product = Product.query.get(form.product_id.data)
@@ -733,7 +849,7 @@ def add_job():
 def edit_job(id):
     job = ProductionJob.query.get_or_404(id)
     form = ProductionJobForm(obj=job)
-    form.product_id.choices = [(p.id, p.name) for p in Product.query.all()]
+    form.product_id.choices = refcache.get_choices('products')
     
     if request.method == 'GET':
         product = Product.query.filter_by(name=job.product_name).first()
@@ -770,7 +886,6 @@ def delete_job(id):
 @login_required
 @role_required('Admin')
 def finance():
-    page = request.args.get('page', 1, type=int)
     type_filter = request.args.get('type', '')
     
     query = Transaction.query
@@ -778,9 +893,7 @@ def finance():
     if type_filter:
         query = query.filter_by(type=type_filter)
     
-    transactions = query.order_by(Transaction.date.desc()).paginate(
-        page=page, per_page=15, error_out=False
-    )
+    transactions = paginate_request(query, Transaction.date, Transaction.id, per_page=15)
     
     total_income = db.session.query(func.sum(Transaction.amount)).filter_by(type='Income').scalar() or 0
     total_expense = db.session.query(func.sum(Transaction.amount)).filter_by(type='Expense').scalar() or 0
@@ -846,6 +959,7 @@ def delete_transaction(id):
             total_paid = db.session.query(func.sum(Transaction.amount))\
                 .filter_by(related_order_id=order.id, type='Income').scalar() or 0
             
+            old_payment_status = order.payment_status
             if total_paid >= order.total_amount:
                 order.payment_status = 'Paid'
             elif total_paid > 0:
@@ -853,6 +967,7 @@ def delete_transaction(id):
             else:
                 order.payment_status = 'Unpaid'
             
+            ledger.on_payment_status_change(order, old_payment_status)
             db.session.commit()
             
     flash('Transaction deleted successfully!', 'warning')
@@ -863,6 +978,7 @@ def delete_transaction(id):
 @main_bp.route('/reports')
 @login_required
 @role_required('Admin')
+@read_only
 def reports():
     # --- Existing Reports Logic ---
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
@@ -876,38 +992,8 @@ def reports():
     
     # --- Advanced Analytics Logic (Merged) ---
     
-    # Profit Analysis
-    products_query = db.session.query(
-        Product.name,
-        Product.selling_price,
-        Product.cost_price,
-        (Product.selling_price - Product.cost_price).label('profit_per_unit'),
-        func.sum(OrderItem.quantity).label('units_sold'),
-        func.sum(OrderItem.subtotal).label('revenue'),
-        func.sum(OrderItem.quantity * Product.cost_price).label('total_cost')
-    ).join(OrderItem).join(Order).filter(
-        Order.payment_status == 'Paid'
-    ).group_by(Product.id, Product.name, Product.selling_price, Product.cost_price).all()
-    
-    # Process products to add calculated fields
-    products_with_profit = []
-    for p in products_query:
-        revenue = p.revenue or 0
-        total_cost = p.total_cost or 0
-        profit = revenue - total_cost
-        margin = (profit / revenue * 100) if revenue > 0 else 0
-        
-        products_with_profit.append({
-            'name': p.name,
-            'selling_price': p.selling_price,
-            'cost_price': p.cost_price,
-            'profit_per_unit': p.profit_per_unit,
-            'units_sold': p.units_sold,
-            'revenue': revenue,
-            'total_cost': total_cost,
-            'profit': profit,
-            'margin': margin
-        })
+    # Profit Analysis (incremental ledger)
+    products_with_profit = ledger.profit_analysis()
     
     # Calculate total profit
     total_revenue = sum([p['revenue'] for p in products_with_profit])
@@ -947,62 +1033,97 @@ def reports():
                           top_products=top_products,
                           low_stock=low_stock)
 
-@main_bp.route('/reports/export/products')
-@login_required
-@role_required('Admin')
-def export_products():
-    products = Product.query.all()
-    data = [[p.sku, p.name, p.category.name if p.category else '', 
-             p.stock_quantity, p.cost_price, p.selling_price] 
-            for p in products]
-    columns = ['SKU', 'Name', 'Category', 'Stock', 'Cost Price', 'Selling Price']
-    
-    buffer = export_to_excel(data, columns, 'products')
+def _export_response(name):
+    """Stream an export as CSV or XLSX, honouring ?format=, ?start=, ?end= and ?columns="""
+    spec = exports.EXPORTS[name]
+    try:
+        keys = [k for k in request.args.get('columns', '').split(',') if k]
+        columns = spec.select_columns(keys)
+        start, end = exports.parse_date_range(request.args.get('start'), request.args.get('end'))
+        writer = exports.get_writer(request.args.get('format', 'xlsx'))
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.reports'))
+    
+    if request.args.get('background'):
+        job = jobs.submit('export', created_by=current_user.id, export=name,
+                          format=writer.extension, columns=keys,
+                          start=request.args.get('start'), end=request.args.get('end'))
+        return jsonify(jobs.describe(job)), 202
+    
+    filename = f'{name}_export.{writer.extension}'
+    rows = exports.iter_rows(spec, columns, start, end)
+    if writer.streams:
+        return Response(
+            stream_with_context(writer.chunks(exports.headers(columns), rows)),
+            mimetype=writer.mimetype,
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
     
     return send_file(
-        buffer,
+        writer.spool(exports.headers(columns), rows),
         as_attachment=True,
-        download_name='products_export.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        download_name=filename,
+        mimetype=writer.mimetype
     )
 
+@main_bp.route('/reports/export/products')
+@login_required
+@role_required('Admin')
+@read_only
+def export_products():
+    return _export_response('products')
+
 @main_bp.route('/reports/export/orders')
 @login_required
 @role_required('Admin')
+@read_only
 def export_orders():
-    orders = Order.query.all()
-    data = [[f'#{o.id}', o.order_date.strftime('%Y-%m-%d'), 
-             o.customer.name if o.customer else '', 
-             o.status, o.payment_status, o.total_amount] 
-            for o in orders]
-    columns = ['Order ID', 'Date', 'Customer', 'Status', 'Payment', 'Total']
-    
-    buffer = export_to_excel(data, columns, 'orders')
-    
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name='orders_export.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    return _export_response('orders')
 
 @main_bp.route('/reports/export/transactions')
 @login_required
 @role_required('Admin')
+@read_only
 def export_transactions():
-    transactions = Transaction.query.all()
-    data = [[t.date.strftime('%Y-%m-%d'), t.type, t.category, 
-             t.description, t.amount] 
-            for t in transactions]
-    columns = ['Date', 'Type', 'Category', 'Description', 'Amount']
-    
-    buffer = export_to_excel(data, columns, 'transactions')
+    return _export_response('transactions')
+
+@main_bp.route('/reports/export/invoices')
+@login_required
+@role_required('Admin')
+@read_only
+def export_invoices():
+    """Invoices for orders placed between ?start= and ?end= (default: this month) as one PDF or a ZIP"""
+    fmt = 'zip' if request.args.get('format') == 'zip' else 'pdf'
+    start_arg = request.args.get('start') or datetime.utcnow().strftime('%Y-%m-01')
+    end_arg = request.args.get('end')
+    try:
+        start, end = exports.parse_date_range(start_arg, end_arg)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.reports'))
+    
+    if request.args.get('background'):
+        job = jobs.submit('invoice_batch', created_by=current_user.id, format=fmt, start=start_arg, end=end_arg)
+        return jsonify(jobs.describe(job)), 202
+    
+    data = invoices.batch_invoice_data(start, end)
+    if not data:
+        flash('No orders in that date range.', 'info')
+        return redirect(url_for('main.reports'))
+    
+    spool = tempfile.TemporaryFile()
+    if fmt == 'zip':
+        invoices.zip_invoices(data, spool)
+    else:
+        invoices.merged_pdf(data, spool)
+    spool.seek(0)
     
     return send_file(
-        buffer,
+        spool,
         as_attachment=True,
-        download_name='transactions_export.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        download_name=f"invoices_{start_arg}_{end_arg or 'today'}.{fmt}",
+        mimetype='application/zip' if fmt == 'zip' else 'application/pdf'
     )
 
 # ==================== SETTINGS ====================
@@ -1024,6 +1145,7 @@ def add_category():
     
     category = Category(name=name, type=cat_type)
     db.session.add(category)
+    refcache.invalidate('categories')
     db.session.commit()
     
     flash(f'Category "{name}" added successfully!', 'success')
@@ -1036,6 +1158,7 @@ def delete_category(id):
     category = Category.query.get_or_404(id)
     name = category.name
     db.session.delete(category)
+    refcache.invalidate('categories')
     db.session.commit()
     flash(f'Category "{name}" deleted successfully!', 'warning')
     return redirect(url_for('main.settings'))
@@ -1089,26 +1212,49 @@ def change_password(user_id):
 @main_bp.route('/settings/audit-log')
 @login_required
 @role_required('Admin')
+@read_only
 def audit_log():
     from app.models import AuditLog
-    page = request.args.get('page', 1, type=int)
+    from app import audit, audit_archive
+    audit.flush()  # Show this worker's queued entries too
     user_filter = request.args.get('user', '')
     action_filter = request.args.get('action', '')
+    start_filter = request.args.get('start', '')
+    end_filter = request.args.get('end', '')
+    try:
+        start, end = exports.parse_date_range(start_filter, end_filter)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.audit_log'))
     
     query = AuditLog.query
     
     if user_filter:
-        query = query.filter(AuditLog.username.contains(user_filter))
+        query = query.filter(fts.filter_clause(AuditLog, user_filter, [AuditLog.username], column='body'))
     
     if action_filter:
-        query = query.filter(AuditLog.action.contains(action_filter))
-    
-    logs = query.order_by(AuditLog.timestamp.desc()).paginate(
-        page=page, per_page=50, error_out=False
-    )
+        query = query.filter(fts.filter_clause(AuditLog, action_filter, [AuditLog.action], column='title'))
+    
+    if start:
+        query = query.filter(AuditLog.timestamp >= start)
+    if end:
+        query = query.filter(AuditLog.timestamp < end)
+    
+    archived = audit_archive.reaches_archive(start, end)
+    if archived:
+        # Months older than AUDIT_HOT_MONTHS are only in the archive files
+        try:
+            logs = audit_archive.paginate_with_archive(query, start, end, user_filter, action_filter, per_page=50,
+                                                       after=request.args.get('after'), before=request.args.get('before'))
+        except ValueError:
+            abort(400)
+    else:
+        logs = paginate_request(query, AuditLog.timestamp, AuditLog.id, per_page=50)
     
-    return render_template('settings/audit_log.html', logs=logs, 
-                          user_filter=user_filter, action_filter=action_filter)
+    return render_template('settings/audit_log.html', logs=logs, archived=archived,
+                          hot_months=current_app.config.get('AUDIT_HOT_MONTHS', 3),
+                          user_filter=user_filter, action_filter=action_filter,
+                          start_filter=start_filter, end_filter=end_filter)
 
 # ==================== USER MANAGEMENT ROUTES ====================
 
@@ -1196,9 +1342,12 @@ def delete_user(id):
 
 @main_bp.route('/update-schema-2024')
 def update_schema():
+    from app import migrations
     try:
-        db.create_all()
-        return "Schema updated successfully! Missing tables created."
+        applied = migrations.upgrade()
+        if not applied:
+            return "Schema is up to date."
+        return f"Schema updated successfully! Applied migrations: {', '.join(map(str, applied))}."
     except Exception as e:
         return f"Error updating schema: {str(e)}"
 
@@ -1228,7 +1377,8 @@ def init_database():
             """
         
         # Create all tables (safe - doesn't delete existing data)
-        db.create_all()
+        from app import migrations
+        migrations.upgrade()
         
         # Create Admin User
         admin = User(username='admin', email='admin@newpindi.com', role='Admin')
@@ -1379,6 +1529,11 @@ def init_database():
         db.session.add_all([txn1, txn2, txn3, txn4, txn5])
         db.session.commit()
         
+        ledger.rebuild_profit_ledger()
+        fts.rebuild_index()
+        inbox.rebuild_counters()
+        stock.reconcile()
+        
         return """
         <html>
         <head><title>Database Initialized Successfully</title></head>
@@ -1431,7 +1586,10 @@ def add_payment(order_id):
     from app.models import Payment, OrderHistory
     order = Order.query.get_or_404(order_id)
     
-    amount = float(request.form.get('amount', 0))
+    try:
+        amount = money.to_decimal(request.form.get('amount') or 0)
+    except ArithmeticError:
+        amount = 0
     payment_method = request.form.get('payment_method', 'Cash')
     notes = request.form.get('notes', '')
     
@@ -1439,6 +1597,10 @@ def add_payment(order_id):
         flash('Payment amount must be greater than 0!', 'danger')
         return redirect(url_for('main.view_order', id=order_id))
     
+    # Paid so far, read before this payment is added (the SUM would autoflush it)
+    total_paid = db.session.query(func.sum(Payment.amount)).filter_by(order_id=order.id).scalar() or 0
+    total_paid += amount
+    
     # Create payment record
     payment = Payment(
         order_id=order.id,
@@ -1449,11 +1611,8 @@ def add_payment(order_id):
     )
     db.session.add(payment)
     
-    # Calculate total paid
-    total_paid = db.session.query(func.sum(Payment.amount)).filter_by(order_id=order.id).scalar() or 0
-    total_paid += amount
-    
     # Update order payment status
+    old_payment_status = order.payment_status
     if total_paid >= order.total_amount:
         order.payment_status = 'Paid'
         status_msg = 'Paid in Full'
@@ -1464,6 +1623,8 @@ def add_payment(order_id):
         order.payment_status = 'Unpaid'
         status_msg = 'Unpaid'
     
+    ledger.on_payment_status_change(order, old_payment_status)
+    
     # Add to order history
     history = OrderHistory(
         order_id=order.id,
@@ -1501,7 +1662,7 @@ def add_payment(order_id):
 def view_payments(order_id):
     from app.models import Payment
     order = Order.query.get_or_404(order_id)
-    payments = Payment.query.filter_by(order_id=order.id).order_by(Payment.payment_date.desc()).all()
+    payments = Payment.query.options(*profile('payment_list')).filter_by(order_id=order.id).order_by(Payment.payment_date.desc()).all()
     
     total_paid = db.session.query(func.sum(Payment.amount)).filter_by(order_id=order.id).scalar() or 0
     remaining = order.total_amount - total_paid
@@ -1512,6 +1673,61 @@ def view_payments(order_id):
                           total_paid=total_paid,
                           remaining=remaining)
 
+# ==================== LOOKUP API ====================
+
+LOOKUP_PAGE_SIZE = 10
+LOOKUP_MAX_PAGE_SIZE = 50
+
+def _lookup_detail(entity, row):
+    if entity == 'products':
+        return f'SKU: {row.sku} | Stock: {row.stock_quantity} | PKR {row.selling_price:,.0f}'
+    if entity == 'customers':
+        return row.phone or ''
+    return row.contact_person or ''
+
+@main_bp.route('/api/lookup/<entity>')
+@login_required
+def lookup(entity):
+    """Paginated prefix lookup for typeahead inputs, ordered by (lower(name), id)"""
+    if entity == 'products':
+        model, extra = Product, [Product.sku, Product.stock_quantity, Product.selling_price]
+    elif entity == 'customers':
+        model, extra = Customer, [Customer.phone]
+    elif entity == 'suppliers':
+        model, extra = Supplier, [Supplier.contact_person]
+    else:
+        abort(404)
+    
+    prefix = request.args.get('q', '').strip().lower()
+    limit = min(max(request.args.get('limit', LOOKUP_PAGE_SIZE, type=int), 1), LOOKUP_MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
+    
+    sort_key = func.lower(model.name)
+    query = db.session.query(model.id, model.name, sort_key.label('sort_key'), *extra)
+    
+    if prefix:
+        # Range scan on the lower(name) index instead of LIKE '%q%'
+        query = query.filter(sort_key >= prefix, sort_key < prefix + '\uffff')
+    
+    if entity == 'products' and request.args.get('in_stock'):
+        query = query.filter(Product.stock_quantity > 0)
+    
+    if cursor:
+        try:
+            last_key, last_id = decode_cursor(cursor)
+        except ValueError:
+            abort(400)
+        query = query.filter(or_(sort_key > last_key, and_(sort_key == last_key, model.id > last_id)))
+    
+    rows = query.order_by(sort_key, model.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    return jsonify({
+        'results': [{'id': r.id, 'label': r.name, 'detail': _lookup_detail(entity, r)} for r in rows],
+        'next_cursor': encode_cursor(rows[-1].sort_key, rows[-1].id) if has_more else None
+    })
+
 # ==================== GLOBAL SEARCH ====================
 
 @main_bp.route('/search')
@@ -1525,10 +1741,7 @@ def global_search():
     results = []
     
     # Search Products
-    products = Product.query.filter(
-        (Product.name.contains(query)) | 
-        (Product.sku.contains(query))
-    ).limit(5).all()
+    products = fts.search_objects(Product, query, limit=5, like_columns=[Product.name, Product.sku])
     
     for p in products:
         results.append({
@@ -1540,11 +1753,8 @@ def global_search():
         })
     
     # Search Customers
-    customers = Customer.query.filter(
-        (Customer.name.contains(query)) | 
-        (Customer.phone.contains(query)) |
-        (Customer.email.contains(query))
-    ).limit(5).all()
+    customers = fts.search_objects(Customer, query, limit=5,
+                                   like_columns=[Customer.name, Customer.phone, Customer.email])
     
     for c in customers:
         results.append({
@@ -1558,7 +1768,7 @@ def global_search():
     # Search Orders
     try:
         order_id = int(query.replace('#', ''))
-        orders = Order.query.filter_by(id=order_id).limit(5).all()
+        orders = Order.query.options(*profile('order_list')).filter_by(id=order_id).limit(5).all()
     except:
         orders = []
     
@@ -1572,10 +1782,8 @@ def global_search():
         })
     
     # Search Suppliers
-    suppliers = Supplier.query.filter(
-        (Supplier.name.contains(query)) |
-        (Supplier.contact_person.contains(query))
-    ).limit(5).all()
+    suppliers = fts.search_objects(Supplier, query, limit=5,
+                                   like_columns=[Supplier.name, Supplier.contact_person])
     
     for s in suppliers:
         results.append({
@@ -1590,29 +1798,60 @@ def global_search():
 
 # ==================== LOW STOCK ALERTS ====================
 
-@main_bp.route('/check-low-stock')
+@main_bp.route('/check-low-stock', methods=['POST'])
 @login_required
+@role_required('Admin')
 def check_low_stock():
-    """Background task to send low stock notifications"""
-    low_stock_items = Product.query.filter(
-        Product.stock_quantity <= Product.reorder_level
-    ).all()
-    
-    if low_stock_items:
-        for item in low_stock_items:
-            # Check if notification already sent today
-            from app.models import Notification
-            today = datetime.utcnow().date()
-            existing = Notification.query.filter(
-                Notification.message.contains(f'Low stock: {item.name}'),
-                func.date(Notification.timestamp) == today
-            ).first()
-            
-            if not existing:
-                send_notification(
-                    message=f'⚠️ Low stock: {item.name} (Only {item.stock_quantity} left, reorder at {item.reorder_level})',
-                    type='warning',
-                    link=url_for('main.edit_product', id=item.id)
-                )
-    
-    return jsonify({'checked': len(low_stock_items), 'alerts_sent': len([i for i in low_stock_items])})
+    """Run the low stock sweep on demand (normally `flask low-stock-sweep` from cron); poll /jobs/<id> for the result"""
+    job = jobs.submit('low_stock_sweep', created_by=current_user.id)
+    return jsonify(jobs.describe(job)), 202
+
+# ==================== BACKGROUND JOBS ====================
+
+def _get_job_or_404(id):
+    job = db.session.get(BackgroundJob, id)
+    if job is None:
+        abort(404)
+    if job.created_by != current_user.id and current_user.role != 'Admin':
+        abort(403)
+    return job
+
+@main_bp.route('/jobs/<int:id>')
+@login_required
+def job_status(id):
+    job = _get_job_or_404(id)
+    data = jobs.describe(job)
+    if data['download']:
+        data['download_url'] = url_for('main.job_download', id=job.id)
+    return jsonify(data)
+
+@main_bp.route('/jobs/<int:id>/download')
+@login_required
+def job_download(id):
+    job = _get_job_or_404(id)
+    if job.status != jobs.FINISHED or not job.result_path or not os.path.exists(job.result_path):
+        abort(404)
+    return send_file(
+        job.result_path,
+        as_attachment=True,
+        download_name=job.result_name,
+        mimetype=job.result_mimetype
+    )
+
+# ==================== METRICS ====================
+
+@main_bp.route('/admin/metrics')
+def metrics():
+    """Prometheus metrics; Admin session or 'Authorization: Bearer <METRICS_TOKEN>'"""
+    import hmac
+    from app.instrumentation import render_prometheus
+    
+    token = current_app.config.get('METRICS_TOKEN')
+    supplied = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(supplied, f'Bearer {token}')):
+        if not current_user.is_authenticated:
+            return current_app.login_manager.unauthorized()
+        if current_user.role != 'Admin':
+            abort(403)
+    
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,208 @@
+"""
+Full-text search index for products, customers, suppliers and audit log entries.
+
+SQLite uses an FTS5 virtual table (``search_index``); PostgreSQL uses a
+``search_documents`` table with a weighted ``tsvector`` column (GIN index) and a
+trigram index on the title for substring matches. Each document is keyed by
+``entity_id * 8 + type code`` so updates and deletes are primary-key lookups.
+
+The index is kept in sync from an ``after_flush`` hook on the session, so any
+ORM write path updates it in the same transaction. Bulk writes that bypass the
+ORM must call ``index_rows()`` themselves. Until ``flask search-rebuild`` has
+created the index, writes skip it and searches fall back to ``LIKE``; other
+workers notice a newly built index within ``MISSING_RECHECK_SECONDS``.
+"""
+import re
+import time
+
+from sqlalchemy import event, inspect, text, or_, select, Integer
+from sqlalchemy.exc import DBAPIError
+
+from app import db
+from app.models import Product, Customer, Supplier, AuditLog
+
+DOC_TYPES = {
+    Product: (1, lambda p: p.name, lambda p: ' '.join(filter(None, [p.sku, p.description])),
+              ('name', 'sku', 'description')),
+    Customer: (2, lambda c: c.name, lambda c: ' '.join(filter(None, [c.phone, c.email])),
+               ('name', 'phone', 'email')),
+    Supplier: (3, lambda s: s.name, lambda s: ' '.join(filter(None, [s.contact_person, s.phone, s.email])),
+               ('name', 'contact_person', 'phone', 'email')),
+    AuditLog: (4, lambda a: a.action, lambda a: a.username or '',
+               ('action', 'username')),
+}
+TYPE_SLOTS = 8
+# How long a missing index is remembered before asking the database again (another process may build it)
+MISSING_RECHECK_SECONDS = 30
+
+_status = {'exists': False, 'checked_at': None}
+
+def doc_id(model, entity_id):
+    return entity_id * TYPE_SLOTS + DOC_TYPES[model][0]
+
+def _dialect(conn):
+    return conn.dialect.name
+
+def index_exists(conn):
+    """Whether the search index has been created (cached; a missing index is re-checked every MISSING_RECHECK_SECONDS)"""
+    now = time.monotonic()
+    if not _status['exists'] and (_status['checked_at'] is None or now - _status['checked_at'] >= MISSING_RECHECK_SECONDS):
+        table = 'search_index' if _dialect(conn) == 'sqlite' else 'search_documents'
+        _status['exists'] = inspect(conn).has_table(table)
+        _status['checked_at'] = now
+    return _status['exists']
+
+# ==================== INDEX MAINTENANCE ====================
+
+def create_index(conn):
+    if _dialect(conn) == 'sqlite':
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+            "title, body, tokenize='unicode61', prefix='2 3')"
+        ))
+    elif _dialect(conn) == 'postgresql':
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS search_documents ("
+            "id BIGINT PRIMARY KEY, title TEXT, body TEXT, "
+            "tsv tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED)"
+        ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON search_documents USING GIN (tsv)"))
+        try:
+            with conn.begin_nested():
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_search_documents_title_trgm "
+                    "ON search_documents USING GIN (lower(title) gin_trgm_ops)"
+                ))
+        except DBAPIError:
+            pass  # pg_trgm not available - substring matches fall back to a scan of search_documents
+    _status['exists'] = True
+
+def drop_index(conn):
+    table = 'search_index' if _dialect(conn) == 'sqlite' else 'search_documents'
+    conn.execute(text(f'DROP TABLE IF EXISTS {table}'))
+    _status['exists'], _status['checked_at'] = False, time.monotonic()
+
+def index_rows(conn, model, rows):
+    """Upsert documents for model instances (or row objects with the same attributes)"""
+    code, title, body, _ = DOC_TYPES[model]
+    params = [{'id': r.id * TYPE_SLOTS + code, 'title': title(r) or '', 'body': body(r) or ''} for r in rows]
+    if not params:
+        return
+    if _dialect(conn) == 'sqlite':
+        conn.execute(text("INSERT OR REPLACE INTO search_index(rowid, title, body) VALUES (:id, :title, :body)"), params)
+    else:
+        conn.execute(text(
+            "INSERT INTO search_documents (id, title, body) VALUES (:id, :title, :body) "
+            "ON CONFLICT (id) DO UPDATE SET title = excluded.title, body = excluded.body"
+        ), params)
+
+def unindex_ids(conn, model, entity_ids):
+    params = [{'id': doc_id(model, entity_id)} for entity_id in entity_ids]
+    if not params:
+        return
+    table, key = ('search_index', 'rowid') if _dialect(conn) == 'sqlite' else ('search_documents', 'id')
+    conn.execute(text(f'DELETE FROM {table} WHERE {key} = :id'), params)
+
+def rebuild_index(batch_size=1000):
+    """Drop, recreate and backfill the index. Returns {model name: documents indexed}."""
+    counts = {}
+    with db.engine.begin() as conn:
+        drop_index(conn)
+        create_index(conn)
+        for model in DOC_TYPES:
+            counts[model.__name__] = 0
+            result = conn.execute(select(model.__table__).execution_options(yield_per=batch_size))
+            for batch in result.partitions():
+                index_rows(conn, model, batch)
+                counts[model.__name__] += len(batch)
+    return counts
+
+def _changed(obj, fields):
+    state = inspect(obj)
+    return any(state.attrs[f].history.has_changes() for f in fields)
+
+@event.listens_for(db.session, 'after_flush')
+def _sync_after_flush(session, flush_context):
+    upserts, deletes = {}, {}
+    for obj in session.new:
+        if type(obj) in DOC_TYPES:
+            upserts.setdefault(type(obj), []).append(obj)
+    for obj in session.dirty:
+        if type(obj) in DOC_TYPES and _changed(obj, DOC_TYPES[type(obj)][3]):
+            upserts.setdefault(type(obj), []).append(obj)
+    for obj in session.deleted:
+        if type(obj) in DOC_TYPES:
+            deletes.setdefault(type(obj), []).append(obj.id)
+
+    if not upserts and not deletes:
+        return
+    conn = session.connection()
+    if not index_exists(conn):
+        return
+    for model, objs in upserts.items():
+        index_rows(conn, model, objs)
+    for model, ids in deletes.items():
+        unindex_ids(conn, model, ids)
+
+# ==================== QUERIES ====================
+
+def _terms(query_text):
+    return [t.lower() for t in re.findall(r'\w+', query_text or '')]
+
+def _match_sql(conn, model, terms, column):
+    """Return (sql, params) selecting entity_id and rank for documents matching all terms"""
+    code = DOC_TYPES[model][0]
+    params = {'code': code, 'slots': TYPE_SLOTS}
+    if _dialect(conn) == 'sqlite':
+        expr = ' AND '.join(f'"{t}"*' for t in terms)
+        params['match'] = f'{column} : ({expr})' if column else expr
+        sql = ("SELECT rowid / :slots AS entity_id, rank FROM search_index "
+               "WHERE search_index MATCH :match AND rowid % :slots = :code")
+    else:
+        weight = {'title': 'A', 'body': 'B'}.get(column, '')
+        params['tsquery'] = ' & '.join(f'{t}:*{weight}' for t in terms)
+        params['like'] = '%' + ' '.join(terms) + '%'
+        sql = ("SELECT id / :slots AS entity_id, -ts_rank(tsv, to_tsquery('simple', :tsquery)) AS rank "
+               "FROM search_documents WHERE id % :slots = :code AND "
+               "(tsv @@ to_tsquery('simple', :tsquery)" + ("" if column else " OR lower(title) LIKE :like") + ")")
+    return sql, params
+
+def search(model, query_text, limit=5):
+    """
+    Ranked entity ids matching query_text, best first.
+    Returns None when the index is unavailable so callers can fall back to LIKE.
+    """
+    terms = _terms(query_text)
+    if not terms:
+        return []
+    conn = db.session.connection()
+    if not index_exists(conn):
+        return None
+    sql, params = _match_sql(conn, model, terms, None)
+    params['limit'] = limit
+    rows = db.session.execute(text(sql + ' ORDER BY rank LIMIT :limit'), params).all()
+    return [r.entity_id for r in rows]
+
+def search_objects(model, query_text, limit=5, like_columns=()):
+    """Ranked model instances for query_text, using LIKE on like_columns if the index is missing"""
+    ids = search(model, query_text, limit)
+    if ids is None:
+        return model.query.filter(or_(*[c.contains(query_text) for c in like_columns])).limit(limit).all()
+    objects = {o.id: o for o in model.query.filter(model.id.in_(ids)).all()} if ids else {}
+    return [objects[i] for i in ids if i in objects]
+
+def filter_clause(model, query_text, like_columns, column=None):
+    """
+    SQL filter restricting model to rows matching query_text, for list pages.
+    column='title' or 'body' restricts the match to that document field.
+    """
+    terms = _terms(query_text)
+    conn = db.session.connection()
+    if not terms or not index_exists(conn):
+        return or_(*[c.contains(query_text) for c in like_columns])
+    sql, params = _match_sql(conn, model, terms, column)
+    matches = text(sql).bindparams(**params).columns(entity_id=Integer).subquery('matches')
+    return model.id.in_(select(matches.c.entity_id))
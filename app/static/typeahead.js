@@ -0,0 +1,45 @@
+// Server-side typeahead for <input data-lookup-url="..."> elements.
+// Suggestions are fetched from the lookup API into the input's <datalist>.
+// With data-target="<hidden input id>", the id of the picked result is written
+// to that hidden input (and cleared again while the user is still typing).
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('input[data-lookup-url]').forEach(function (input) {
+        const datalist = document.getElementById(input.getAttribute('list'));
+        const target = input.dataset.target ? document.getElementById(input.dataset.target) : null;
+        const params = input.dataset.lookupParams || '';
+        let results = [];
+        let timer = null;
+
+        function optionText(result) {
+            return target && result.detail ? result.label + ' — ' + result.detail : result.label;
+        }
+
+        input.addEventListener('input', function () {
+            if (target) {
+                const picked = results.find(r => optionText(r) === input.value);
+                target.value = picked ? picked.id : '';
+                if (picked) {
+                    input.value = picked.label;
+                    return;
+                }
+            }
+
+            clearTimeout(timer);
+            timer = setTimeout(function () {
+                const q = input.value.trim();
+                if (!q) return;
+                fetch(input.dataset.lookupUrl + '?limit=10&q=' + encodeURIComponent(q) + params)
+                    .then(response => response.json())
+                    .then(function (data) {
+                        results = data.results;
+                        datalist.innerHTML = '';
+                        results.forEach(function (result) {
+                            const option = document.createElement('option');
+                            option.value = optionText(result);
+                            datalist.appendChild(option);
+                        });
+                    });
+            }, 200);
+        });
+    });
+});
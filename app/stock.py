@@ -0,0 +1,200 @@
+"""
+Stock reservations and the append-only stock movement ledger.
+
+Stock changes never read a product's quantity in Python and then write it
+back. A reservation is one conditional
+``UPDATE products SET stock_quantity = stock_quantity - :qty
+WHERE id = :id AND stock_quantity >= :qty``. Either it matches the row and
+takes the stock, or it matches nothing and raises ``InsufficientStock``. The
+database serialises concurrent updates of the row (the row lock on
+PostgreSQL, the write lock on SQLite), so two orders can never both take the
+last unit. Every change appends a ``StockMovement`` row in the same
+transaction. ``scripts/stress_stock.py`` hammers ``reserve()`` from many
+threads and checks nothing is oversold.
+"""
+from datetime import datetime
+
+from sqlalchemy import update, select, insert, func, case
+
+from app import db
+from app.models import Product, OrderItem, StockMovement
+
+# Movement reasons
+INITIAL = 'initial'
+ORDER_ITEM = 'order_item'
+ORDER_ITEM_REMOVED = 'order_item_removed'
+ORDER_DELETED = 'order_deleted'
+ADJUSTMENT = 'adjustment'
+OPENING_BALANCE = 'opening_balance'
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested, available):
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+        super().__init__(f'Product {product_id}: requested {requested}, only {available} available')
+
+def _actor():
+    from flask import has_request_context
+    from flask_login import current_user
+    if has_request_context() and current_user.is_authenticated:
+        return current_user.id
+    return None
+
+def _change(product_id, delta, condition=None):
+    """Atomically add delta to a product's stock. Returns the new balance, or None if condition failed."""
+    stmt = update(Product).where(Product.id == product_id)
+    if condition is not None:
+        stmt = stmt.where(condition)
+    stmt = stmt.values(stock_quantity=Product.stock_quantity + delta).execution_options(synchronize_session=False)
+
+    if db.session.get_bind().dialect.update_returning:
+        balance = db.session.execute(stmt.returning(Product.stock_quantity)).scalar()
+    else:
+        balance = None
+        if db.session.execute(stmt).rowcount:
+            balance = db.session.query(Product.stock_quantity).filter_by(id=product_id).scalar()
+
+    _expire(product_id)
+    return balance
+
+def _expire(*product_ids):
+    """Keep already-loaded Products in step with their rows"""
+    for product_id in product_ids:
+        product = db.session.identity_map.get(db.session.identity_key(Product, product_id))
+        if product is not None:
+            db.session.expire(product, ['stock_quantity'])
+
+def _record(product_id, delta, reason, balance, order_id=None):
+    db.session.add(StockMovement(
+        product_id=product_id,
+        quantity=delta,
+        reason=reason,
+        balance_after=balance,
+        order_id=order_id,
+        user_id=_actor()
+    ))
+
+def reserve(product_id, quantity, order_id=None, reason=ORDER_ITEM):
+    """Take quantity units of stock or raise InsufficientStock. Returns the remaining stock."""
+    if quantity <= 0:
+        raise ValueError('Quantity must be positive')
+    balance = _change(product_id, -quantity, Product.stock_quantity >= quantity)
+    if balance is None:
+        available = db.session.query(Product.stock_quantity).filter_by(id=product_id).scalar()
+        raise InsufficientStock(product_id, quantity, available or 0)
+    _record(product_id, -quantity, reason, balance, order_id)
+    return balance
+
+def reserve_many(quantities, order_id=None, reason=ORDER_ITEM):
+    """
+    Take stock for several products at once: quantities is {product_id: quantity}.
+    One UPDATE covers every product. Raises InsufficientStock for a product that
+    is short, after which the caller must roll back. Returns {product_id: remaining}.
+    """
+    if any(q <= 0 for q in quantities.values()):
+        raise ValueError('Quantity must be positive')
+    if not db.session.get_bind().dialect.update_returning:
+        return {pid: reserve(pid, q, order_id, reason) for pid, q in quantities.items()}
+
+    wanted = case(quantities, value=Product.id)
+    balances = dict(db.session.execute(
+        update(Product)
+        .where(Product.id.in_(list(quantities)), Product.stock_quantity >= wanted)
+        .values(stock_quantity=Product.stock_quantity - wanted)
+        .returning(Product.id, Product.stock_quantity)
+        .execution_options(synchronize_session=False)
+    ).all())
+    _expire(*quantities)
+
+    for product_id, quantity in quantities.items():
+        if product_id not in balances:
+            # This row was not touched, so it still shows what was available
+            available = db.session.query(Product.stock_quantity).filter_by(id=product_id).scalar()
+            raise InsufficientStock(product_id, quantity, available or 0)
+
+    user_id = _actor()
+    db.session.execute(insert(StockMovement), [{
+        'product_id': product_id,
+        'quantity': -quantity,
+        'reason': reason,
+        'balance_after': balances[product_id],
+        'order_id': order_id,
+        'user_id': user_id,
+        'created_at': datetime.utcnow()
+    } for product_id, quantity in quantities.items()])
+    return balances
+
+def release(product_id, quantity, order_id=None, reason=ORDER_ITEM_REMOVED):
+    """Return quantity units to stock. Returns the new stock level."""
+    balance = _change(product_id, quantity)
+    _record(product_id, quantity, reason, balance, order_id)
+    return balance
+
+def release_order(order):
+    """Return every line of an order to stock, one update per product"""
+    lines = db.session.query(
+        OrderItem.product_id, func.sum(OrderItem.quantity).label('quantity')
+    ).filter(OrderItem.order_id == order.id).group_by(OrderItem.product_id).all()
+    for line in lines:
+        release(line.product_id, line.quantity, order.id, ORDER_DELETED)
+
+def adjust(product_id, delta, reason=ADJUSTMENT):
+    """Apply a manual stock correction; refuses to take stock below zero"""
+    if delta == 0:
+        return None
+    if delta < 0:
+        return reserve(product_id, -delta, reason=reason)
+    return release(product_id, delta, reason=reason)
+
+def record_initial(product):
+    """Log the opening stock of a newly created product (flushes to get its id)"""
+    db.session.flush()
+    if product.stock_quantity:
+        _record(product.id, product.stock_quantity, INITIAL, product.stock_quantity)
+
+def record_initial_rows(rows):
+    """Log opening stock for bulk-inserted products: rows is [(product_id, quantity)]"""
+    user_id = _actor()
+    movements = [{
+        'product_id': product_id,
+        'quantity': quantity,
+        'reason': INITIAL,
+        'balance_after': quantity,
+        'user_id': user_id,
+        'created_at': datetime.utcnow()
+    } for product_id, quantity in rows if quantity]
+    if movements:
+        db.session.execute(insert(StockMovement), movements)
+
+def verify(conn=None):
+    """Products whose stock differs from the sum of their movements: [(product_id, stock, ledger_sum)]"""
+    ledger = select(StockMovement.product_id, func.sum(StockMovement.quantity).label('total')) \
+        .group_by(StockMovement.product_id).subquery()
+    rows = (db.session if conn is None else conn).execute(
+        select(Product.id, Product.stock_quantity, func.coalesce(ledger.c.total, 0))
+        .outerjoin(ledger, ledger.c.product_id == Product.id)
+        .where(Product.stock_quantity != func.coalesce(ledger.c.total, 0))
+    ).all()
+    return [tuple(r) for r in rows]
+
+def reconcile(conn=None):
+    """
+    Append an opening-balance movement wherever stock and ledger disagree (e.g. pre-ledger data).
+    With conn (a migration step) it runs on that connection and leaves the commit to the caller.
+    """
+    mismatches = verify(conn)
+    user_id = _actor()
+    movements = [{
+        'product_id': product_id,
+        'quantity': stock_quantity - total,
+        'reason': OPENING_BALANCE,
+        'balance_after': stock_quantity,
+        'user_id': user_id,
+        'created_at': datetime.utcnow()
+    } for product_id, stock_quantity, total in mismatches]
+    if movements:
+        (db.session if conn is None else conn).execute(insert(StockMovement), movements)
+    if conn is None:
+        db.session.commit()
+    return len(mismatches)
@@ -1,5 +1,47 @@
 import os
 
+# Engine tuning per deployment profile; pool sizes scale with the threads per worker
+DB_PROFILES = {
+    # Local development: the driver defaults
+    'sqlite-dev': {},
+    # One SQLite file shared by several workers: readers no longer block the writer and vice versa
+    'sqlite-wal-prod': {
+        'pragmas': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -20000,
+                    'temp_store': 'MEMORY', 'mmap_size': 128 * 1024 * 1024},
+        'pool': True,
+    },
+    'postgres-prod': {'pool': True, 'pre_ping': True, 'server_timeouts': True},
+}
+
+def engine_options(profile, threads, statement_timeout_ms, lock_timeout_ms):
+    """SQLALCHEMY_ENGINE_OPTIONS for a DB_PROFILE"""
+    if profile not in DB_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {profile!r}; expected one of {', '.join(DB_PROFILES)}")
+    settings, options = DB_PROFILES[profile], {}
+    if settings.get('pool'):
+        # One connection per request thread plus the audit writer thread; overflow covers streamed exports
+        options.update(pool_size=threads + 1, max_overflow=max(2, threads // 2), pool_timeout=10,
+                       pool_recycle=1800, pool_use_lifo=True)
+    if settings.get('pre_ping'):
+        options['pool_pre_ping'] = True
+    if settings.get('server_timeouts'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout_ms} '
+                                              f'-c lock_timeout={lock_timeout_ms} '
+                                              f'-c idle_in_transaction_session_timeout={statement_timeout_ms * 2}'}
+    return options
+
+def replica_bind(url, connect_timeout):
+    """SQLALCHEMY_BINDS entry for the read replica"""
+    bind = {'url': url}
+    if url.startswith('postgresql'):
+        # An unreachable replica fails its health check after connect_timeout instead of the OS connect timeout
+        bind['connect_args'] = {'connect_timeout': connect_timeout}
+    return bind
+
+def sqlite_pragmas(profile, busy_timeout_ms):
+    """PRAGMAs run on every new SQLite connection of a DB_PROFILE"""
+    return {'busy_timeout': busy_timeout_ms, **DB_PROFILES[profile].get('pragmas', {})}
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'hard-to-guess-string-change-in-production'
     
@@ -11,6 +53,70 @@ class Config:
     SQLALCHEMY_DATABASE_URI = database_url
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Read replica - @read_only views (dashboard, reports, exports, audit log) query it while it is healthy
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url and replica_url.startswith('postgres://'):
+        replica_url = replica_url.replace('postgres://', 'postgresql://', 1)
+    REPLICA_CONNECT_TIMEOUT = int(os.environ.get('REPLICA_CONNECT_TIMEOUT', 2))  # seconds
+    SQLALCHEMY_BINDS = {'replica': replica_bind(replica_url, REPLICA_CONNECT_TIMEOUT)} if replica_url else {}
+    REPLICA_MAX_LAG_SECONDS = int(os.environ.get('REPLICA_MAX_LAG_SECONDS', 10))  # further behind, the primary is used
+    REPLICA_CHECK_INTERVAL = 5  # seconds between health checks per worker
+    
+    # Database engine profile - 'sqlite-dev', 'sqlite-wal-prod' or 'postgres-prod' (default follows DATABASE_URL)
+    DB_PROFILE = os.environ.get('DB_PROFILE') or ('postgres-prod' if database_url.startswith('postgresql') else 'sqlite-dev')
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 2))  # worker processes; each has its own pool
+    WEB_THREADS = int(os.environ.get('WEB_THREADS', 1))  # request threads per worker
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))  # PostgreSQL; 0 disables it
+    DB_LOCK_TIMEOUT_MS = int(os.environ.get('DB_LOCK_TIMEOUT_MS', 5000))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))  # how long a writer waits for the lock
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(DB_PROFILE, WEB_THREADS, DB_STATEMENT_TIMEOUT_MS, DB_LOCK_TIMEOUT_MS)
+    SQLITE_PRAGMAS = sqlite_pragmas(DB_PROFILE, SQLITE_BUSY_TIMEOUT_MS)
+    
     # Upload Configuration
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max size
+    
+    # Dashboard KPI snapshot - how many seconds each metric may be served stale
+    KPI_DEFAULT_STALENESS = int(os.environ.get('KPI_DEFAULT_STALENESS', 120))
+    KPI_STALENESS = {
+        'total_sales': 60,
+        'pending_orders': 30,
+        'low_stock_count': 60,
+        'active_jobs': 60,
+        'sales_trend': 300,
+        'profit_analysis': 600,
+        'inventory_value': 600,
+        'top_customers': 600,
+    }
+    
+    # Background jobs - when disabled, submitted jobs run inline in the request
+    JOB_QUEUE_ENABLED = os.environ.get('JOB_QUEUE_ENABLED', '').lower() in ('1', 'true', 'yes')
+    JOB_RESULTS_FOLDER = os.environ.get('JOB_RESULTS_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'job_results')
+    JOB_POLL_INTERVAL = 2  # seconds between polls when the queue is empty
+    JOB_LOCK_TIMEOUT = 15 * 60  # Running jobs older than this are assumed dead and requeued
+    JOB_RETRY_DELAY = 30  # seconds, doubled on every retry
+    JOB_RESULT_RETENTION_DAYS = 7
+    
+    # Invoices - rendered PDFs are cached by content; batches render in a process pool
+    INVOICE_CACHE_FOLDER = os.environ.get('INVOICE_CACHE_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'invoice_cache')
+    INVOICE_RENDER_WORKERS = int(os.environ.get('INVOICE_RENDER_WORKERS') or min(4, os.cpu_count() or 1))
+    
+    # Instrumentation - statements slower than this are logged; /admin/metrics also accepts "Bearer <METRICS_TOKEN>"
+    SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+    METRICS_WINDOW = 15 * 60  # seconds the per-endpoint slowest statements are kept
+    METRICS_SLOWEST_PER_ENDPOINT = 5
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
+    # Notifications - admin fan-out is 'direct' (one row per admin) or 'broadcast' (one shared row + read markers)
+    NOTIFICATION_FANOUT = os.environ.get('NOTIFICATION_FANOUT', 'direct')
+    NOTIFICATION_CACHE_TTL = 30  # seconds the recent-notifications list is cached per user
+    
+    # Audit log - entries are queued and written in batches by a background thread per worker
+    AUDIT_ASYNC = os.environ.get('AUDIT_ASYNC', 'true').lower() in ('1', 'true', 'yes')
+    AUDIT_QUEUE_SIZE = 10000  # when full, entries are written synchronously by the request
+    AUDIT_BATCH_SIZE = 200
+    AUDIT_FLUSH_INTERVAL = 1.0  # seconds an entry may wait for its batch to fill
+    AUDIT_HOT_MONTHS = 3  # months kept in the database; `flask audit-archive` moves older ones to files
+    AUDIT_ARCHIVE_FOLDER = os.environ.get('AUDIT_ARCHIVE_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'audit_archive')
+    AUDIT_ARCHIVE_RETENTION_MONTHS = int(os.environ.get('AUDIT_ARCHIVE_RETENTION_MONTHS', 84))  # 0 keeps archives forever
+    AUDIT_PARTITIONS_AHEAD = 3  # PostgreSQL: monthly partitions created ahead of time
@@ -0,0 +1,62 @@
+"""
+Gunicorn settings: gunicorn -c gunicorn.conf.py run:app
+
+GUNICORN_PROFILE picks the worker model:
+
+  sync     one request at a time per worker process (gunicorn's default); a
+           slow PDF invoice or export blocks the whole worker
+  gthread  WEB_THREADS request threads per worker, so a slow request ties up
+           one thread and the worker keeps serving the others (default)
+  preload  gthread, with the app imported once in the master before forking;
+           workers share the imported modules copy-on-write and start faster
+
+WEB_CONCURRENCY sets the number of worker processes. WEB_THREADS is exported
+to the app as well, so each worker's connection pool (see DB_PROFILES in
+config.py) matches its thread count.
+"""
+import gc
+import os
+
+PROFILES = {
+    'sync': {'worker_class': 'sync', 'threads': 1, 'preload_app': False},
+    'gthread': {'worker_class': 'gthread', 'threads': None, 'preload_app': False},
+    'preload': {'worker_class': 'gthread', 'threads': None, 'preload_app': True},
+}
+
+profile = os.environ.get('GUNICORN_PROFILE', 'gthread')
+if profile not in PROFILES:
+    raise ValueError(f"Unknown GUNICORN_PROFILE {profile!r}; expected one of {', '.join(PROFILES)}")
+settings = PROFILES[profile]
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = settings['worker_class']
+threads = settings['threads'] or int(os.environ.get('WEB_THREADS', 4))
+preload_app = settings['preload_app']
+os.environ['WEB_THREADS'] = str(threads)
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))  # large exports and invoice batches
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so a leak cannot grow without bound; jitter avoids restarting them all at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+
+def when_ready(server):
+    if preload_app:
+        # Keep the collector from touching (and so copying) the pages of the preloaded objects
+        gc.freeze()
+
+def post_fork(server, worker):
+    if preload_app:
+        # Connections opened in the master must not be shared with the workers
+        from app import app, db
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+def worker_exit(server, worker):
+    # Write the audit entries still queued in this worker
+    from app import audit
+    audit.shutdown()
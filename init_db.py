@@ -2,19 +2,22 @@
 Database Initialization Script
 Run this script to create all tables and seed initial data
 """
-from app import create_app, db
+from app import app, db
 from app.models import User, Customer, Supplier, Category, Product, Order, OrderItem, ProductionJob, Transaction
+from app.ledger import rebuild_profit_ledger
+from app.search import rebuild_index
+from app.inbox import rebuild_counters
+from app.stock import reconcile as reconcile_stock
+from app.migrations import upgrade
 from datetime import datetime, timedelta
 
-app = create_app()
-
 with app.app_context():
     # Drop all tables and recreate
     print("Dropping existing tables...")
     db.drop_all()
     
     print("Creating tables...")
-    db.create_all()
+    upgrade()
     
     # Create Admin User
     print("Creating admin user...")
@@ -175,6 +178,14 @@ with app.app_context():
     db.session.add_all([txn1, txn2, txn3, txn4, txn5])
     db.session.commit()
     
+    print("Building profit ledger...")
+    rebuild_profit_ledger()
+    
+    print("Building search index...")
+    rebuild_index()
+    rebuild_counters()
+    reconcile_stock()
+    
     print("\n" + "="*50)
     print("Database initialized successfully!")
     print("="*50)
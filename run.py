@@ -1,8 +1,7 @@
-from app import create_app, db
+# The app is created once, when the app package is imported
+from app import app, db
 from app.models import User, Customer, Supplier, Category, Product, Order, OrderItem, ProductionJob, Transaction
 
-app = create_app()
-
 @app.shell_context_processor
 def make_shell_context():
     return {
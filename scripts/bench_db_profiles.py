@@ -0,0 +1,128 @@
+"""
+Load test: throughput of the DB_PROFILE engine settings under concurrent load.
+
+Seeds a throwaway database, then starts PROCESSES worker processes (as
+gunicorn would) with THREADS threads each. For DURATION seconds every thread
+runs a mix of the app's queries: mostly order-list and sales-total reads,
+and one write in five that reserves stock and records a transaction. The
+report shows reads and writes per second, and how many operations failed
+with "database is locked" (or any other OperationalError).
+
+Runs sqlite-dev and sqlite-wal-prod against a temporary SQLite file, and
+postgres-prod as well when BENCH_POSTGRES_URL points at a scratch database
+(its tables are dropped and recreated).
+
+Usage: python scripts/bench_db_profiles.py [duration] [processes] [threads]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+DURATION = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+PROCESSES = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+THREADS = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SEED = '''
+from datetime import datetime
+from app import app, db
+from app.migrations import upgrade
+from app.models import Customer, Product, Order
+with app.app_context():
+    db.drop_all()
+    upgrade()
+    customers = [Customer(name=f'Load {i}', phone=f'0300-{i:07d}') for i in range(50)]
+    products = [Product(sku=f'L-{i}', name=f'Load product {i}', selling_price=1000 + i, cost_price=600,
+                        stock_quantity=10 ** 6) for i in range(50)]
+    db.session.add_all(customers + products)
+    db.session.flush()
+    db.session.add_all(Order(customer_id=customers[i % 50].id, total_amount=1000 + i, status='Pending',
+                             order_date=datetime.utcnow()) for i in range(2000))
+    db.session.commit()
+'''
+
+LOAD = '''
+import json, random, sys, threading, time
+from datetime import datetime
+from sqlalchemy import select, func
+from sqlalchemy.exc import OperationalError
+from app import app, db, stock
+from app.models import Order, Transaction
+
+counts = {'reads': 0, 'writes': 0, 'locked': 0, 'errors': 0}
+lock = threading.Lock()
+
+def read():
+    db.session.execute(select(Order.id, Order.total_amount).where(Order.status == 'Pending')
+                       .order_by(Order.order_date.desc(), Order.id.desc()).limit(20)).all()
+    db.session.execute(select(func.count(), func.sum(Order.total_amount))).one()
+    db.session.rollback()
+    return 'reads'
+
+def write():
+    stock.reserve(random.randint(1, 50), 1)
+    db.session.add(Transaction(type='Income', category='Sale', amount=1000, description='Load test',
+                               date=datetime.utcnow()))
+    db.session.commit()
+    return 'writes'
+
+def run(deadline):
+    done = {'reads': 0, 'writes': 0, 'locked': 0, 'errors': 0}
+    with app.app_context():
+        while time.monotonic() < deadline:
+            try:
+                done[write() if random.random() < 0.2 else read()] += 1
+            except OperationalError as e:
+                db.session.rollback()
+                done['locked' if 'locked' in str(e) else 'errors'] += 1
+        db.session.remove()
+    with lock:
+        for key, value in done.items():
+            counts[key] += value
+
+deadline = time.monotonic() + float(sys.argv[1])
+threads = [threading.Thread(target=run, args=(deadline,)) for _ in range(int(sys.argv[2]))]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+print(json.dumps(counts))
+'''
+
+def python(code, env, *args):
+    return subprocess.Popen([sys.executable, '-c', code, *map(str, args)], cwd=ROOT, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+def bench(profile, url):
+    env = dict(os.environ, DATABASE_URL=url, DB_PROFILE=profile, WEB_THREADS=str(THREADS), AUDIT_ASYNC='false')
+    if python(SEED, env).wait():
+        raise SystemExit(f'Seeding the {profile} database failed')
+    workers = [python(LOAD, env, DURATION, THREADS) for _ in range(PROCESSES)]
+    totals = {'reads': 0, 'writes': 0, 'locked': 0, 'errors': 0}
+    for worker in workers:
+        out = worker.communicate()[0].strip().splitlines()
+        for key, value in json.loads(out[-1]).items():
+            totals[key] += value
+    return totals
+
+scenarios = []
+for profile in ('sqlite-dev', 'sqlite-wal-prod'):
+    db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    scenarios.append((profile, f'sqlite:///{db_file}', db_file))
+if os.environ.get('BENCH_POSTGRES_URL'):
+    scenarios.append(('postgres-prod', os.environ['BENCH_POSTGRES_URL'], None))
+
+print(f'{PROCESSES} processes x {THREADS} threads, {DURATION:g}s each')
+print(f'{"profile":<16} {"reads/s":>10} {"writes/s":>10} {"locked":>8} {"errors":>8}')
+for profile, url, db_file in scenarios:
+    try:
+        result = bench(profile, url)
+    finally:
+        if db_file:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_file + suffix):
+                    os.remove(db_file + suffix)
+    print(f'{profile:<16} {result["reads"] / DURATION:>10.1f} {result["writes"] / DURATION:>10.1f} '
+          f'{result["locked"]:>8} {result["errors"]:>8}')
@@ -0,0 +1,162 @@
+"""
+Benchmark: gunicorn worker profiles (GUNICORN_PROFILE in gunicorn.conf.py).
+
+Seeds a throwaway SQLite database with init_db.py, then for each profile
+starts ``gunicorn -c gunicorn.conf.py run:app``, logs in, and has CLIENTS
+concurrent keep-alive clients request the dashboard, the orders list and an
+order page for DURATION seconds. Reports requests/sec, p50 and p99 latency,
+errors, the time until the server answered, and the memory of the master
+plus workers (PSS, so pages shared copy-on-write are counted once).
+
+--with-exports adds one client that downloads the XLSX orders export over
+and over, as a slow request sharing the workers with the page traffic.
+
+Usage: python scripts/bench_gunicorn.py [duration] [clients] [--with-exports] [profile ...]
+"""
+import http.client
+import os
+import re
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+ARGS = [a for a in sys.argv[1:] if not a.startswith('--')]
+DURATION = float(ARGS[0]) if len(ARGS) > 0 else 10
+CLIENTS = int(ARGS[1]) if len(ARGS) > 1 else 8
+PROFILES = ARGS[2:] or ['sync', 'gthread', 'preload']
+WITH_EXPORTS = '--with-exports' in sys.argv
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ['/', '/orders', '/orders/1']
+SLOW_PATH = '/reports/export/orders?format=xlsx'
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise SystemExit(f'gunicorn did not answer on port {port}')
+
+def login(port):
+    """A session cookie for the seeded admin user"""
+    jar = CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    page = opener.open(f'http://127.0.0.1:{port}/login').read().decode()
+    token = re.search(r'name="csrf_token"[^>]*value="([^"]+)"', page)
+    data = {'username': 'admin', 'password': 'admin123', 'csrf_token': token.group(1) if token else ''}
+    opener.open(f'http://127.0.0.1:{port}/login', urllib.parse.urlencode(data).encode()).read()
+    return '; '.join(f'{c.name}={c.value}' for c in jar)
+
+def process_tree(pid):
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+def memory_mb(pid):
+    """PSS of the process and its children (RSS where smaps_rollup is unavailable)"""
+    total = 0
+    for p in process_tree(pid):
+        for path, field in ((f'/proc/{p}/smaps_rollup', 'Pss:'), (f'/proc/{p}/status', 'VmRSS:')):
+            try:
+                with open(path) as f:
+                    line = next((l for l in f if l.startswith(field)), None)
+            except OSError:
+                continue
+            if line:
+                total += int(line.split()[1])
+                break
+    return total / 1024
+
+def client(port, cookie, paths, deadline, latencies, errors):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    i = 0
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path, headers={'Cookie': cookie})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            conn.close()
+            continue
+        if latencies is not None:
+            latencies.append(time.perf_counter() - start)
+    conn.close()
+
+def bench(profile, env):
+    port = free_port()
+    env = dict(env, GUNICORN_PROFILE=profile, PORT=str(port))
+    started = time.monotonic()
+    server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', 'run:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port)
+        ready = time.monotonic() - started
+        cookie = login(port)
+        deadline = time.monotonic() + DURATION
+        latencies, errors = [], []
+        threads = [threading.Thread(target=client, args=(port, cookie, PATHS[i % len(PATHS):] + PATHS[:i % len(PATHS)],
+                                                          deadline, latencies, errors))
+                   for i in range(CLIENTS)]
+        if WITH_EXPORTS:
+            threads.append(threading.Thread(target=client, args=(port, cookie, [SLOW_PATH], deadline, None, errors)))
+        for t in threads:
+            t.start()
+        time.sleep(DURATION / 2)
+        memory = memory_mb(server.pid)
+        for t in threads:
+            t.join()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(30)
+    latencies.sort()
+    return {
+        'rps': len(latencies) / DURATION,
+        'p50': statistics.median(latencies) * 1000 if latencies else 0,
+        'p99': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+        'errors': len(errors),
+        'ready': ready,
+        'memory': memory,
+    }
+
+workdir = tempfile.mkdtemp()
+env = dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.join(workdir, "bench.db")}', DB_PROFILE='sqlite-wal-prod',
+           WEB_CONCURRENCY=os.environ.get('WEB_CONCURRENCY', '2'), WEB_THREADS=os.environ.get('WEB_THREADS', '4'),
+           JOB_RESULTS_FOLDER=os.path.join(workdir, 'jobs'), INVOICE_CACHE_FOLDER=os.path.join(workdir, 'invoices'),
+           AUDIT_ARCHIVE_FOLDER=os.path.join(workdir, 'audit'))
+subprocess.run([sys.executable, 'init_db.py'], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, check=True)
+
+print(f'{env["WEB_CONCURRENCY"]} workers, {CLIENTS} clients, {DURATION:g}s per profile'
+      f'{", with a concurrent XLSX export client" if WITH_EXPORTS else ""}')
+print(f'{"profile":<10} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"errors":>7} {"ready s":>8} {"PSS MB":>8}')
+for name in PROFILES:
+    r = bench(name, env)
+    print(f'{name:<10} {r["rps"]:>8.1f} {r["p50"]:>8.1f} {r["p99"]:>8.1f} {r["errors"]:>7} '
+          f'{r["ready"]:>8.2f} {r["memory"]:>8.1f}')
@@ -0,0 +1,81 @@
+"""
+Benchmark: bulk CSV import vs one-row-at-a-time form inserts.
+
+Writes a synthetic product catalogue and customer list (with a few duplicate
+and malformed rows mixed in) to CSV, imports both into a throwaway SQLite
+database with the search index built, and reports throughput. For
+comparison, a sample is also inserted the way the add forms do it: a
+duplicate-check query, an insert and a commit for every row.
+
+Usage: python scripts/bench_import.py [rows]
+"""
+import csv
+import os
+import sys
+import random
+import tempfile
+import time
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+NAIVE_SAMPLE = min(ROWS, 2000)
+db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+os.environ['DATABASE_URL'] = f'sqlite:///{db_file}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+from app.models import Product, Customer
+from app.imports import run_import
+from app.search import rebuild_index
+
+ITEMS = ['Sofa', 'Bed', 'Table', 'Chair', 'Wardrobe', 'Dresser', 'Cabinet', 'Desk']
+FIRST = ['Ali', 'Fatima', 'Usman', 'Ayesha', 'Bilal', 'Hina', 'Kamran', 'Sana']
+
+def write_csv(header, rows):
+    path = tempfile.NamedTemporaryFile(suffix='.csv', delete=False).name
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return path
+
+rng = random.Random(42)
+product_rows = [[f'CAT-{i:07d}', f'{rng.choice(ITEMS)} Model {i}', f'{rng.randint(5, 90) * 1000}',
+                 f'{rng.randint(10, 150) * 1000}', rng.randint(0, 40)] for i in range(ROWS)]
+customer_rows = [[f'{rng.choice(FIRST)} Customer {i}', f'03{i:09d}', f'customer{i}@example.com', 'Rawalpindi']
+                 for i in range(ROWS)]
+# Every 100th row is a repeat of the row before it, every 250th has a bad price
+for i in range(100, ROWS, 100):
+    product_rows[i][0] = product_rows[i - 1][0]
+    customer_rows[i][1] = customer_rows[i - 1][1]
+for i in range(250, ROWS, 250):
+    product_rows[i][3] = 'n/a'
+
+products_csv = write_csv(['SKU', 'Name', 'Cost Price', 'Selling Price', 'Stock'], product_rows)
+customers_csv = write_csv(['name', 'phone', 'email', 'address'], customer_rows)
+
+with app.app_context():
+    db.create_all()
+    rebuild_index()
+
+    print(f'{"import":<22} {"rows":>8} {"inserted":>9} {"rejected":>9} {"seconds":>8} {"rows/s":>10}')
+    for entity, path in (('products', products_csv), ('customers', customers_csv)):
+        for dry_run in (True, False):
+            with open(path, 'rb') as f:
+                r = run_import(entity, f, path, dry_run=dry_run)
+            label = f'{entity}{" (dry run)" if dry_run else ""}'
+            print(f'{label:<22} {r.processed:>8} {r.inserted:>9} {r.rejected:>9} {r.elapsed:>8.2f} {r.rows_per_second:>10,.0f}')
+
+    # The add-product form path: duplicate check, insert and commit per row
+    start = time.perf_counter()
+    for i in range(NAIVE_SAMPLE):
+        sku = f'FORM-{i:07d}'
+        if Product.query.filter_by(sku=sku).first() is None:
+            db.session.add(Product(sku=sku, name=f'Form Product {i}', selling_price=1000, stock_quantity=1))
+            db.session.commit()
+    elapsed = time.perf_counter() - start
+    print(f'{"per-row form inserts":<22} {NAIVE_SAMPLE:>8} {NAIVE_SAMPLE:>9} {0:>9} {elapsed:>8.2f} {NAIVE_SAMPLE / elapsed:>10,.0f}')
+
+    print(f'\nProducts: {Product.query.count()}, customers: {Customer.query.count()}')
+
+for path in (db_file, products_csv, customers_csv):
+    os.remove(path)
@@ -0,0 +1,77 @@
+"""
+Benchmark: LIKE '%q%' filtering vs the full-text search index.
+
+Seeds a throwaway SQLite database with synthetic customers and products,
+builds the search index and times both query paths.
+
+Usage: python scripts/bench_search.py [rows]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+os.environ['DATABASE_URL'] = f'sqlite:///{db_file}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, or_
+from app import app, db
+from app.models import Customer, Product
+from app.search import rebuild_index, search, filter_clause
+
+FIRST = ['Ali', 'Fatima', 'Usman', 'Ayesha', 'Bilal', 'Hina', 'Kamran', 'Sana', 'Imran', 'Zara']
+LAST = ['Hassan', 'Ahmed', 'Malik', 'Khan', 'Qureshi', 'Butt', 'Sheikh', 'Raza']
+ITEMS = ['Sofa', 'Bed', 'Table', 'Chair', 'Wardrobe', 'Dresser', 'Cabinet', 'Desk']
+QUERIES = ['ali', 'qureshi', 'war', 'sofa', '0300', 'customer777', 'model 4242']
+
+def timed(fn, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, len(result)
+
+with app.app_context():
+    db.create_all()
+    rng = random.Random(42)
+    db.session.execute(insert(Customer), [{
+        'name': f'{rng.choice(FIRST)} {rng.choice(LAST)} {i}',
+        'phone': f'03{rng.randint(0, 49):02d}-{rng.randint(0, 9999999):07d}',
+        'email': f'customer{i}@example.com'
+    } for i in range(ROWS)])
+    db.session.execute(insert(Product), [{
+        'sku': f'SKU-{i:07d}',
+        'name': f'{rng.choice(ITEMS)} Model {i}',
+        'selling_price': 1000
+    } for i in range(ROWS)])
+    db.session.commit()
+
+    start = time.perf_counter()
+    rebuild_index()
+    print(f'Indexed {2 * ROWS} documents in {time.perf_counter() - start:.2f}s\n')
+
+    # Global search box: top 5 customers + top 5 products
+    print(f'{"global search":<14} {"LIKE ms":>10} {"FTS ms":>10}')
+    for q in QUERIES:
+        like_ms, _ = timed(lambda: Customer.query.filter(or_(
+            Customer.name.contains(q), Customer.phone.contains(q), Customer.email.contains(q)
+        )).limit(5).all() + Product.query.filter(or_(
+            Product.name.contains(q), Product.sku.contains(q)
+        )).limit(5).all())
+        fts_ms, _ = timed(lambda: search(Customer, q) + search(Product, q))
+        print(f'{q:<14} {like_ms:>10.2f} {fts_ms:>10.2f}')
+
+    # List page filter: matching-row count, as paginate() issues on every page
+    print(f'\n{"list count":<14} {"LIKE ms":>10} {"FTS ms":>10}')
+    for q in QUERIES:
+        like_ms, _ = timed(lambda: [Customer.query.filter(or_(
+            Customer.name.contains(q), Customer.phone.contains(q), Customer.email.contains(q)
+        )).count()])
+        fts_ms, _ = timed(lambda: [Customer.query.filter(filter_clause(
+            Customer, q, [Customer.name, Customer.phone, Customer.email]
+        )).count()])
+        print(f'{q:<14} {like_ms:>10.2f} {fts_ms:>10.2f}')
+
+os.remove(db_file)
@@ -0,0 +1,79 @@
+"""
+Benchmark: worker startup time and resident memory.
+
+Each scenario runs in a fresh interpreter, the way a gunicorn worker starts,
+and reports the time to import the app and the process RSS afterwards:
+
+  app             ``from app import app``, what every worker pays
+  app + pandas    the same with pandas imported, as app/utils.py used to do
+  after exports   the app after writing a CSV and an XLSX export of a seeded
+                  product table, to show the export path leaves pandas unloaded
+
+Usage: python scripts/bench_startup.py [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import io, json, os, resource, sys, time
+start = time.perf_counter()
+from app import app, db
+{extra}
+elapsed = time.perf_counter() - start
+{after}
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+print(json.dumps({{'seconds': elapsed, 'rss_mb': rss_mb(), 'pandas': 'pandas' in sys.modules}}))
+'''
+
+EXPORTS = '''
+from app import exports
+from app.models import Product
+with app.app_context():
+    db.create_all()
+    db.session.add_all(Product(sku=f'B-{i}', name=f'Bench {i}', selling_price=1000 + i) for i in range(2000))
+    db.session.commit()
+    spec = exports.EXPORTS['products']
+    for format in ('csv', 'xlsx'):
+        exports.write_export(spec, spec.columns, format, io.BytesIO())
+'''
+
+SCENARIOS = [
+    ('app', '', ''),
+    ('app + pandas', 'import pandas', ''),
+    ('after exports', '', EXPORTS),
+]
+
+def probe(extra, after, db_file):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_file}')
+    out = subprocess.run([sys.executable, '-c', PROBE.format(extra=extra, after=after)],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+print(f'{"scenario":<16} {"import s (median)":>18} {"RSS MB (median)":>16} {"pandas loaded":>14}')
+for name, extra, after in SCENARIOS:
+    results = []
+    for _ in range(RUNS):
+        db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        try:
+            results.append(probe(extra, after, db_file))
+        finally:
+            os.remove(db_file)
+    seconds = statistics.median(r['seconds'] for r in results)
+    rss = statistics.median(r['rss_mb'] for r in results)
+    print(f'{name:<16} {seconds:>18.3f} {rss:>16.1f} {str(results[0]["pandas"]):>14}')
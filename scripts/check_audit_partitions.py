@@ -0,0 +1,144 @@
+"""
+Audit log partitioning and archiving check against a real PostgreSQL server.
+
+Needs a scratch database: every table in it is dropped and recreated.
+
+  1. Creates the schema with a plain audit_logs table holding entries from
+     several past months, then runs the migrations, so migration 5 turns it
+     into a partitioned table. Checks that every row and id survived and
+     that new entries keep numbering after them.
+  2. Writes entries for a month past AUDIT_PARTITIONS_AHEAD, so they land in
+     the default partition (as when cron has not run for a while), detaches
+     a cold month's partition by hand (as an interrupted archive run would
+     leave it) and puts one cold entry in the default partition.
+  3. Runs `run_retention` and checks that it creates the future month's
+     partition and moves its entries there, and that it archives the
+     detached month, the cold months still attached and the cold entry in
+     the default partition, then removes them all from the database.
+
+Exits non-zero if any check fails.
+
+Usage: TEST_POSTGRES_URL=postgresql+psycopg2://user@host/scratch python scripts/check_audit_partitions.py
+"""
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+
+if not os.environ.get('TEST_POSTGRES_URL'):
+    raise SystemExit('Set TEST_POSTGRES_URL to a scratch PostgreSQL database (all its tables are dropped).')
+archive_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = os.environ['TEST_POSTGRES_URL']
+os.environ['AUDIT_ARCHIVE_FOLDER'] = archive_dir
+os.environ['AUDIT_ASYNC'] = 'false'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, func
+from app import app, db, audit, audit_archive
+from app.migrations import upgrade
+from app.models import AuditLog
+
+failures = 0
+
+def check(description, ok, detail=''):
+    global failures
+    failures += not ok
+    print(f"{'OK  ' if ok else 'FAIL'} {description}{f' ({detail})' if detail and not ok else ''}")
+
+def month(offset):
+    now = datetime.utcnow()
+    return audit_archive.month_start(*audit_archive.add_months(now.year, now.month, offset))
+
+def entries(when, count, action):
+    return [{'username': 'check', 'action': f'{action} {i}', 'timestamp': when.replace(day=1 + i % 28)}
+            for i in range(count)]
+
+def partitions(conn):
+    return set(conn.exec_driver_sql(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'audit_logs'"
+    ).scalars())
+
+def where(conn, action):
+    """{partition: rows} for entries whose action starts with action"""
+    return dict(conn.exec_driver_sql(
+        "SELECT tableoid::regclass::text, count(*) FROM audit_logs WHERE action LIKE %(pattern)s GROUP BY 1",
+        {'pattern': action + ' %'}
+    ).all())
+
+with app.app_context():
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('DROP SCHEMA public CASCADE')
+        conn.exec_driver_sql('CREATE SCHEMA public')
+    db.create_all()
+    hot_months = app.config['AUDIT_HOT_MONTHS']
+
+    # 1. Migration 5 on a table that already has rows
+    audit.write_entries(entries(month(-hot_months - 2), 20, 'old') + entries(month(-hot_months), 20, 'cold')
+                        + entries(month(0), 20, 'hot'))
+    before = db.session.execute(select(func.count(), func.max(AuditLog.id))).one()
+    db.session.rollback()
+    upgrade()
+    with db.engine.connect() as conn:
+        check('migration 5 partitions audit_logs', audit_archive.is_partitioned(conn))
+        attached = partitions(conn)
+        check('partitions cover the oldest month through the months ahead',
+              {audit_archive.partition_name(d.year, d.month) for d in (month(-hot_months - 2), month(0), month(3))}
+              <= attached, sorted(attached))
+        after = conn.execute(select(func.count(), func.max(AuditLog.id))).one()
+        check('rows and ids are kept', tuple(after) == tuple(before), f'{tuple(before)} -> {tuple(after)}')
+    audit.write_entries(entries(month(0), 1, 'new'))
+    newest = db.session.execute(select(func.max(AuditLog.id))).scalar()
+    db.session.rollback()
+    check('new entries number after the copied ones', newest == before[1] + 1, f'{newest} after {before[1]}')
+
+    # 2. Entries for a month without a partition land in the default partition
+    ahead = app.config['AUDIT_PARTITIONS_AHEAD']
+    future = month(ahead + 2)
+    audit.write_entries(entries(future, 5, 'future'))
+    with db.engine.connect() as conn:
+        check('entries without a partition go to the default partition',
+              where(conn, 'future') == {'audit_logs_default': 5}, where(conn, 'future'))
+
+    # 3. A partition left detached, and a cold entry in the default partition
+    old, stray = month(-hot_months - 2), month(-hot_months - 1).replace(day=15)
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(f'ALTER TABLE audit_logs DETACH PARTITION {audit_archive.partition_name(old.year, old.month)}')
+        conn.exec_driver_sql(f'DROP TABLE {audit_archive.partition_name(stray.year, stray.month)}')
+    audit.write_entries([{'username': 'check', 'action': 'stray 0', 'timestamp': stray}])
+
+    app.config['AUDIT_PARTITIONS_AHEAD'] = ahead + 3
+    try:
+        summary = audit_archive.run_retention()
+    except Exception as e:
+        check('run_retention creates a partition over rows in the default partition', False, e)
+        raise SystemExit(1)
+    app.config['AUDIT_PARTITIONS_AHEAD'] = ahead
+    check('run_retention creates a partition over rows in the default partition', True)
+    with db.engine.connect() as conn:
+        name = audit_archive.partition_name(future.year, future.month)
+        check('the rows moved into the new partition', where(conn, 'future') == {name: 5}, where(conn, 'future'))
+
+    archived = sum(summary['archived'].values())
+    check('cold entries are archived', archived == 41, summary['archived'])
+    lines = []
+    for paths in audit_archive.archived_files().values():
+        for path in paths:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                lines += [json.loads(line)['action'] for line in f]
+    check('archive files hold every archived entry', sorted(lines) == sorted(
+        [f'old {i}' for i in range(20)] + [f'cold {i}' for i in range(20)] + ['stray 0']), len(lines))
+    with db.engine.connect() as conn:
+        left = conn.execute(select(func.count()).where(AuditLog.timestamp < audit_archive.hot_cutoff())).scalar()
+        check('no cold entries are left in the database', left == 0, left)
+        check('no detached partitions are left', audit_archive._detached_months(conn) == [],
+              audit_archive._detached_months(conn))
+    check('a second run archives nothing', audit_archive.run_retention()['archived'] == {})
+
+    db.session.remove()
+shutil.rmtree(archive_dir)
+if failures:
+    raise SystemExit(f'{failures} check(s) failed')
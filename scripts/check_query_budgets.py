@@ -0,0 +1,98 @@
+"""
+SQL statement budget check for the main read routes.
+
+Seeds a throwaway SQLite database with enough orders, items and products
+that any N+1 lazy load blows past the budget. It then requests each route
+as an admin and counts the statements it issues. Exits non-zero if a
+route goes over its budget.
+
+Usage: python scripts/check_query_budgets.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+# Keep the database and every file the app writes out of the repo's instance/ folder
+workdir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "budgets.db")}'
+os.environ['INVOICE_CACHE_FOLDER'] = os.path.join(workdir, 'invoices')
+os.environ['JOB_RESULTS_FOLDER'] = os.path.join(workdir, 'jobs')
+os.environ['AUDIT_ARCHIVE_FOLDER'] = os.path.join(workdir, 'audit')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from app import app, db, audit
+from app.models import User, Category, Customer, Product, Order, OrderItem, Payment
+
+ORDERS = 40
+ITEMS_PER_ORDER = 5
+
+# Maximum statements per request, independent of ORDERS / ITEMS_PER_ORDER
+BUDGETS = {
+    '/': 10,
+    '/orders': 6,
+    '/orders/1': 6,
+    '/orders/1/payments': 7,
+    '/orders/1/invoice': 5,
+    '/inventory': 8,
+    '/customers/1': 6,
+    '/reports': 10,
+    '/reports/export/products': 3,
+    '/reports/export/orders': 3,
+    '/reports/export/transactions': 3,
+}
+
+def seed():
+    db.create_all()
+    admin = User(username='admin', email='admin@example.com', role='Admin')
+    admin.set_password('admin123')
+    category = Category(name='Sofas')
+    customers = [Customer(name=f'Customer {i}', phone=f'0300-{i:07d}') for i in range(ORDERS)]
+    products = [Product(sku=f'SKU-{i}', name=f'Product {i}', category=category, cost_price=50,
+                        selling_price=100, stock_quantity=i % 4, reorder_level=2) for i in range(ORDERS)]
+    db.session.add_all([admin, category] + customers + products)
+    db.session.flush()
+    for i, customer in enumerate(customers):
+        order = Order(customer_id=customer.id, payment_status='Paid', total_amount=100 * ITEMS_PER_ORDER)
+        db.session.add(order)
+        db.session.flush()
+        for j in range(ITEMS_PER_ORDER):
+            db.session.add(OrderItem(order_id=order.id, product_id=products[(i + j) % ORDERS].id,
+                                     quantity=1, unit_price=100, subtotal=100))
+        db.session.add(Payment(order_id=order.id, amount=order.total_amount, recorded_by=admin.id))
+    db.session.commit()
+
+    from app.ledger import rebuild_profit_ledger
+    rebuild_profit_ledger()
+
+def main():
+    app.config.update(WTF_CSRF_ENABLED=False, TESTING=True)
+    with app.app_context():
+        seed()
+        engine = db.engine
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    audit.flush()  # Keep the background audit insert out of the counted requests
+    client.get('/')  # warm the KPI snapshot and reference caches
+
+    failures = 0
+    for url, budget in BUDGETS.items():
+        statements.clear()
+        response = client.get(url)
+        count = len(statements)
+        status = 'OK  ' if count <= budget and response.status_code == 200 else 'FAIL'
+        if status == 'FAIL':
+            failures += 1
+        print(f'{status} {url:<32} {count:>3} statements (budget {budget}, HTTP {response.status_code})')
+
+    audit.shutdown()
+    shutil.rmtree(workdir)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Stress test: many threads reserving the same scarce product at once.
+
+Seeds a throwaway SQLite database with one product, then has THREADS
+workers each try to reserve one unit ATTEMPTS times. Afterwards it checks
+that no more units were handed out than existed, that stock never went
+negative and that the stock movement ledger matches the product row.
+
+--naive runs the old read-check-write pattern (read stock in Python, compare,
+write it back) for comparison; it typically oversells.
+
+Usage: python scripts/stress_stock.py [--naive] [stock] [threads] [attempts]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+NAIVE = '--naive' in sys.argv
+args = [a for a in sys.argv[1:] if not a.startswith('--')]
+STOCK = int(args[0]) if len(args) > 0 else 50
+THREADS = int(args[1]) if len(args) > 1 else 16
+ATTEMPTS = int(args[2]) if len(args) > 2 else 10
+
+db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+os.environ['DATABASE_URL'] = f'sqlite:///{db_file}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError
+from app import app, db, stock
+from app.models import Product, StockMovement
+
+def naive_reserve(product_id, quantity):
+    product = db.session.get(Product, product_id)
+    if product.stock_quantity < quantity:
+        raise stock.InsufficientStock(product_id, quantity, product.stock_quantity)
+    time.sleep(0.001)  # Request handling between the check and the write
+    product.stock_quantity -= quantity
+
+def worker(product_id, results):
+    reserved = refused = 0
+    with app.app_context():
+        for _ in range(ATTEMPTS):
+            for _retry in range(20):
+                try:
+                    if NAIVE:
+                        naive_reserve(product_id, 1)
+                    else:
+                        stock.reserve(product_id, 1)
+                    db.session.commit()
+                    reserved += 1
+                except stock.InsufficientStock:
+                    db.session.rollback()
+                    refused += 1
+                except OperationalError:
+                    db.session.rollback()  # SQLite busy timeout; try again
+                    continue
+                break
+        db.session.remove()
+    results.append((reserved, refused))
+
+with app.app_context():
+    db.create_all()
+    product = Product(sku='STRESS-1', name='Stress Test Sofa', selling_price=1000, stock_quantity=STOCK)
+    db.session.add(product)
+    stock.record_initial(product)
+    db.session.commit()
+    product_id = product.id
+
+results = []
+threads = [threading.Thread(target=worker, args=(product_id, results)) for _ in range(THREADS)]
+start = time.perf_counter()
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+elapsed = time.perf_counter() - start
+
+reserved = sum(r[0] for r in results)
+refused = sum(r[1] for r in results)
+with app.app_context():
+    remaining = db.session.get(Product, product_id).stock_quantity
+    movements = StockMovement.query.filter_by(product_id=product_id).count()
+    mismatches = stock.verify()
+
+print(f'Mode:        {"naive read-check-write" if NAIVE else "conditional UPDATE"}')
+print(f'Requests:    {THREADS} threads x {ATTEMPTS} = {THREADS * ATTEMPTS} in {elapsed:.2f}s')
+print(f'Reserved:    {reserved} of {STOCK} units ({refused} refused)')
+print(f'Remaining:   {remaining}')
+print(f'Movements:   {movements}')
+
+problems = []
+if reserved > STOCK:
+    problems.append(f'oversold by {reserved - STOCK}')
+if remaining != STOCK - reserved:
+    problems.append(f'stock row says {remaining}, expected {STOCK - reserved} (lost updates)')
+if remaining < 0:
+    problems.append('stock went negative')
+if mismatches:
+    problems.append(f'ledger mismatch: {mismatches}')
+
+os.remove(db_file)
+if problems:
+    print('FAIL: ' + '; '.join(problems))
+    sys.exit(1)
+print('OK: no overselling, ledger matches stock')
@@ -0,0 +1,6 @@
+from app import app
+from app.jobs import run_worker
+
+if __name__ == '__main__':
+    with app.app_context():
+        run_worker()